@@ -1,5 +1,18 @@
 from kof_parser.exceptions import *
 from kof_parser.kof import *
 from kof_parser.model import *
+from kof_parser.index import *
+from kof_parser.merge import *
+from kof_parser.document import *
+from kof_parser.cache import *
+from kof_parser.stats import *
+from kof_parser.tokenizer import *
 from kof_parser.parser import *
 from kof_parser.writer import *
+
+
+def __getattr__(name: str):
+    # The projector is created on first use, see kof_parser.kof.get_projector()
+    if name == "projector":
+        return get_projector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
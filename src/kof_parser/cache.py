@@ -0,0 +1,164 @@
+"""
+Caches of parsed kof files, see the `cache` parameter of `KOFParser.parse()`.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Mapping, Optional, Union
+
+from kof_parser.enums import MethodType
+from kof_parser.model import Diagnostic, Location, construct_location
+
+# Number of bytes at the start of a file that identify it, together with the parse parameters, in a parse cache
+CACHE_HEAD_SIZE = 4 * 1024
+
+
+def parse_cache_key(
+    head: bytes,
+    result_srid: int,
+    file_srid: Optional[int],
+    swap_easting_northing: Optional[bool],
+    validate: bool,
+    lenient: bool = False,
+    tema_codes: Optional[Mapping[str, MethodType]] = None,
+) -> str:
+    """
+    The cache key of a file starting with the `head` bytes (the first `CACHE_HEAD_SIZE` bytes of the file), parsed
+    with the given parameters. `lenient` is True for parses that collect diagnostics instead of raising errors, and
+    `tema_codes` is the table of tema codes and method types that the methods are parsed with.
+
+    Files that are appended to keep their key, so a cached parse can be continued from where it ended.
+    """
+    parameters = f"{result_srid}:{file_srid}:{bool(swap_easting_northing)}:{validate}:{'lenient:' if lenient else ''}"
+    if tema_codes is not None:
+        parameters += json.dumps(sorted((code, method.name) for code, method in tema_codes.items())) + ":"
+    return sha256(parameters.encode() + head).hexdigest()
+
+
+def copy_locations(locations: list[Location]) -> list[Location]:
+    return [
+        construct_location(
+            name=location.name,
+            methods=list(location.methods),
+            point_easting=location.point_easting,
+            point_northing=location.point_northing,
+            point_z=location.point_z,
+            srid=location.srid,
+        )
+        for location in locations
+    ]
+
+
+@dataclass
+class CachedParse:
+    """
+    The result of parsing a file, and the state needed to continue parsing lines appended to it.
+
+    `content_hash` is the SHA-256 hex digest of the first `size` bytes of the file, which consist of `line_count`
+    lines. The coordinate system, axis order and character set are as they were after the last line. `diagnostics`
+    are those of a lenient parse.
+    """
+
+    content_hash: str
+    size: int
+    line_count: int
+    ends_with_newline: bool
+    encoding: str
+    file_srid: Optional[int]
+    use_east_north_order_as_default: bool
+    locations: list[Location] = field(default_factory=list)
+    diagnostics: list[Diagnostic] = field(default_factory=list)
+
+
+class ParseCache(ABC):
+    """
+    Base class for parse caches. Subclasses store `CachedParse` entries by key, see `parse_cache_key()`, and must
+    implement both `get()` and `set()`.
+
+    The parser does not change the locations of an entry, neither after `get()` nor after `set()`.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedParse]:
+        """
+        The entry stored with `key`, or None
+        """
+
+    @abstractmethod
+    def set(self, key: str, entry: CachedParse) -> None:
+        """
+        Store `entry` with `key`, replacing any entry stored with it before
+        """
+
+
+class MemoryParseCache(ParseCache):
+    """
+    Least recently used cache of at most `maxsize` parsed files, kept in memory.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, CachedParse] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedParse]:
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedParse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.maxsize, 0):
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskParseCache(ParseCache):
+    """
+    Cache of parsed files, kept as one JSON file per key in `directory`, e.g. to share it between processes.
+
+    Files are replaced atomically, so concurrent readers see either the old or the new entry. An entry that can not be
+    read is treated as missing.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedParse]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+            data["locations"] = [construct_location(**location) for location in data["locations"]]
+            data["diagnostics"] = [Diagnostic(**diagnostic) for diagnostic in data.get("diagnostics", [])]
+            return CachedParse(**data)
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def set(self, key: str, entry: CachedParse) -> None:
+        data = entry.__dict__ | {
+            "locations": [location.model_dump() for location in entry.locations],
+            "diagnostics": [asdict(diagnostic) for diagnostic in entry.diagnostics],
+        }
+        with NamedTemporaryFile("w", encoding="utf-8", dir=self.directory, suffix=".tmp", delete=False) as f:
+            json.dump(data, f)
+        os.replace(f.name, self._path(key))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
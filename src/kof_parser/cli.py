@@ -0,0 +1,303 @@
+"""
+The `kof` command line tool.
+
+    kof convert tests/data/*.kof --srid 4326 --to geojson --output-dir out
+    cat file.kof | kof convert --srid 25833 > file_utm33.kof
+"""
+
+import argparse
+import csv
+import glob
+import json
+import sys
+import uuid
+from dataclasses import dataclass
+from functools import partial
+from io import TextIOWrapper
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+from typing import IO, Any, Iterable, Optional, Union
+
+from kof_parser.model import Location
+from kof_parser.parser import KOFParser
+from kof_parser.stats import ParseStats, WriteStats
+from kof_parser.writer import KOFWriter
+
+FORMATS = {"kof": ".kof", "csv": ".csv", "geojson": ".geojson"}
+
+# Input that is read from stdin, and output that is written to stdout
+STANDARD_STREAM = "-"
+
+
+@dataclass
+class ConvertResult:
+    """
+    The summary of converting one file. `error` is set if the file could not be converted.
+    """
+
+    input_file: str
+    output_file: str
+    locations: int = 0
+    points: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    def summary(self) -> str:
+        if self.error is not None:
+            return f"{self.input_file}: failed - {self.error}"
+
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"{self.input_file} -> {self.output_file}: {self.locations} locations from {self.points} points in "
+            f"{self.seconds:.3f} s ({self.points / seconds:.0f} points/s, {self.bytes_read / seconds / 1e6:.1f} MB/s)"
+        )
+
+
+def convert(
+    input_file: str,
+    output_file: str,
+    result_srid: int,
+    output_format: str = "kof",
+    file_srid: Optional[int] = None,
+    swap_easting_northing: bool = False,
+    project_name: Optional[str] = None,
+) -> ConvertResult:
+    """
+    Parse one kof file, with its coordinates in `result_srid`, and write it as `output_format` (kof, csv or
+    geojson). Use "-" as the input or output to read from stdin or write to stdout.
+
+    Errors are returned in the result instead of raised, so one bad file does not stop a batch.
+    """
+    result = ConvertResult(input_file=input_file, output_file=output_file)
+    parse_stats = ParseStats()
+    start = perf_counter()
+    try:
+        source = sys.stdin.buffer if input_file == STANDARD_STREAM else input_file
+        locations = KOFParser().parse(
+            source,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            stats=parse_stats,
+        )
+        name = project_name or ("stdin" if input_file == STANDARD_STREAM else Path(input_file).stem)
+        if output_file == STANDARD_STREAM:
+            sys.stdout.flush()
+            write_locations(sys.stdout.buffer, locations, output_format, result_srid, name)
+            sys.stdout.buffer.flush()
+        else:
+            with open(output_file, "wb") as f:
+                write_locations(f, locations, output_format, result_srid, name)
+    except Exception as e:
+        result.error = str(e)
+        return result
+
+    result.locations = len(locations)
+    result.points = parse_stats.points
+    result.bytes_read = parse_stats.bytes_read
+    result.seconds = perf_counter() - start
+    return result
+
+
+def write_locations(
+    stream: IO[bytes],
+    locations: list[Location],
+    output_format: str,
+    srid: int,
+    project_name: str,
+    stats: Optional[WriteStats] = None,
+) -> None:
+    """
+    Write the locations, in the `srid` coordinate system, to a binary stream as kof (iso-8859-15), csv or geojson
+    (UTF-8)
+    """
+    if output_format == "kof":
+        KOFWriter().write_to(
+            stream, project_id=uuid.uuid4(), project_name=project_name, locations=locations, srid=srid, stats=stats
+        )
+        return
+
+    text = TextIOWrapper(stream, encoding="utf-8", newline="" if output_format == "csv" else None)
+    try:
+        if output_format == "csv":
+            write_csv(text, locations)
+        elif output_format == "geojson":
+            write_geojson(text, locations, srid)
+        else:
+            raise ValueError(f"Unknown format {output_format}")
+    finally:
+        text.detach()
+
+
+def write_csv(stream: IO[str], locations: Iterable[Location]) -> None:
+    """
+    Write one row per location, with the methods separated by semicolons and empty cells for missing values
+    """
+    writer = csv.writer(stream)
+    writer.writerow(["name", "methods", "easting", "northing", "z", "srid"])
+    for location in locations:
+        writer.writerow(
+            [
+                location.name,
+                ";".join(location.methods),
+                _csv_value(location.point_easting),
+                _csv_value(location.point_northing),
+                _csv_value(location.point_z),
+                _csv_value(location.srid),
+            ]
+        )
+    stream.flush()
+
+
+def write_geojson(stream: IO[str], locations: Iterable[Location], srid: int) -> None:
+    """
+    Write a feature collection with one point per location, streamed one feature at the time.
+
+    The coordinates are in the `srid` coordinate system, which is named in the (pre RFC 7946) `crs` member. Locations
+    without coordinates have no geometry.
+    """
+    stream.write('{"type": "FeatureCollection", ')
+    stream.write(f'"crs": {{"type": "name", "properties": {{"name": "urn:ogc:def:crs:EPSG::{srid}"}}}}, ')
+    stream.write('"features": [')
+    for index, location in enumerate(locations):
+        geometry = None
+        if location.point_easting is not None and location.point_northing is not None:
+            coordinates = [location.point_easting, location.point_northing]
+            if location.point_z is not None:
+                coordinates.append(location.point_z)
+            geometry = {"type": "Point", "coordinates": coordinates}
+        feature = {
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {"name": location.name, "methods": location.methods},
+        }
+        stream.write(("\n" if index == 0 else ",\n") + json.dumps(feature, ensure_ascii=False))
+    stream.write("\n]}\n")
+    stream.flush()
+
+
+def _csv_value(value: Union[float, int, None]) -> Any:
+    return "" if value is None else value
+
+
+def find_files(inputs: list[str]) -> list[str]:
+    """
+    Expand the inputs to file paths. Directories are searched for kof files, and glob patterns are expanded ("**"
+    matches any number of directories). "-" is kept, for stdin.
+    """
+    files: list[str] = []
+    for pattern in inputs:
+        path = Path(pattern)
+        if pattern == STANDARD_STREAM or path.is_file():
+            files.append(pattern)
+        elif path.is_dir():
+            files.extend(
+                sorted(str(file) for file in path.iterdir() if file.is_file() and file.suffix.lower() == ".kof")
+            )
+        else:
+            matches = sorted(match for match in glob.glob(pattern, recursive=True) if Path(match).is_file())
+            if not matches:
+                raise FileNotFoundError(f"No files match {pattern}")
+            files.extend(matches)
+
+    return list(dict.fromkeys(files))
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    """
+    Run the `kof` command, and return the exit status: 0 if all files were converted, otherwise 1
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog="kof", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = argument_parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser(
+        "convert",
+        help="Reproject kof files, or convert them to csv or geojson",
+        description="Parse kof files and write them in another coordinate system and/or format. A summary with the "
+        "throughput of every file is written to stderr.",
+    )
+    convert_parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=[STANDARD_STREAM],
+        metavar="INPUT",
+        help="Kof files, directories of kof files, or glob patterns (default: read stdin)",
+    )
+    convert_parser.add_argument("--srid", type=int, required=True, help="Write the coordinates in this SRID")
+    convert_parser.add_argument("--to", choices=list(FORMATS), default="kof", help="Output format (default: kof)")
+    convert_parser.add_argument(
+        "--file-srid", type=int, help="SRID of the input files, instead of the coordinate system in the files"
+    )
+    convert_parser.add_argument("--swap-easting-northing", action="store_true", help="Swap easting and northing")
+    convert_parser.add_argument("--project-name", help="Project name of kof output (default: the input file name)")
+    convert_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        help="Write every file to this directory, with the extension of the format (default: write to stdout)",
+    )
+    convert_parser.add_argument(
+        "--workers", type=int, help="Number of files converted in parallel (default: one per CPU)"
+    )
+    args = argument_parser.parse_args(arguments)
+
+    try:
+        files = find_files(args.inputs)
+    except FileNotFoundError as e:
+        argument_parser.error(str(e))
+    if args.output_dir is None and len(files) > 1:
+        argument_parser.error("--output-dir is required for more than one input file")
+
+    outputs = []
+    # The input file written to every output file, so two inputs with the same name are not written to the same file
+    files_by_output: dict[Path, str] = {}
+    for file in files:
+        output = STANDARD_STREAM
+        if args.output_dir is not None:
+            name = "stdin" if file == STANDARD_STREAM else Path(file).stem
+            output = str(args.output_dir / f"{name}{FORMATS[args.to]}")
+            if file != STANDARD_STREAM and Path(output).resolve() == Path(file).resolve():
+                argument_parser.error(f"{file} would be overwritten, use another --output-dir")
+            if (other_file := files_by_output.setdefault(Path(output).resolve(), file)) != file:
+                argument_parser.error(f"{other_file} and {file} would both be written to {output}")
+        outputs.append(output)
+    if args.output_dir is not None:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    convert_file = partial(
+        convert,
+        result_srid=args.srid,
+        output_format=args.to,
+        file_srid=args.file_srid,
+        swap_easting_northing=args.swap_easting_northing,
+        project_name=args.project_name,
+    )
+    start = perf_counter()
+    workers = min(args.workers or cpu_count() or 1, len(files))
+    if workers <= 1 or STANDARD_STREAM in files:
+        results = list(map(convert_file, files, outputs))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(convert_file, files, outputs))
+
+    for result in results:
+        print(result.summary(), file=sys.stderr)
+    converted = [result for result in results if result.error is None]
+    seconds = perf_counter() - start
+    points = sum(result.points for result in converted)
+    print(
+        f"Converted {len(converted)} of {len(results)} files, {points} points in {seconds:.3f} s "
+        f"({points / max(seconds, 1e-9):.0f} points/s)",
+        file=sys.stderr,
+    )
+
+    return 0 if len(converted) == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Kof files parsed for round trips, see `KOFParser.parse_document()` and `KOFWriter.write_document()`.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Optional
+
+from kof_parser.kof import TemaCodes
+from kof_parser.model import Location
+
+
+def location_fingerprint(location: Location) -> tuple:
+    """
+    The values of a location that are written to a kof file, to find the locations that are changed
+    """
+    return (
+        location.name,
+        tuple(location.methods),
+        location.point_easting,
+        location.point_northing,
+        location.point_z,
+        location.srid,
+    )
+
+
+@dataclass
+class KOFDocument:
+    """
+    A parsed kof file that keeps its source bytes, so it can be written back with only the changed locations
+    formatted again.
+
+    Change, add and remove the `locations` (merged by name, as `KOFParser.parse()` returns them), and write the
+    document with `KOFWriter.write_document()`. Locations are matched to their lines in the source by name.
+
+    The lines are kept as offsets into `source`, not as strings: line `i` is `source[line_offsets[i]:line_offsets[i +
+    1]]`. `coordinate_lines` are the indexes of the coordinate block (05) lines, and for each of them
+    `coordinate_line_locations` is the index of its location in `original_locations`, and `source_srids` and `swapped`
+    are the coordinate system (0 for none) and axis order (easting first if swapped) in effect on the line. For every
+    original location, `fingerprints` are its values as parsed (see `location_fingerprint()`). `end_srid` and
+    `end_swapped` are the coordinate system and axis order at the end of the file, used for new locations.
+    `tema_codes` is the tema code table of the parser.
+    """
+
+    source: bytes
+    encoding: str
+    locations: list[Location]
+    line_offsets: array
+    coordinate_lines: array
+    coordinate_line_locations: array
+    original_locations: list[Location] = field(default_factory=list)
+    fingerprints: list[tuple] = field(default_factory=list)
+    source_srids: array = field(default_factory=lambda: array("q"))
+    swapped: bytearray = field(default_factory=bytearray)
+    end_srid: int = 0
+    end_swapped: bool = False
+    tema_codes: Optional[TemaCodes] = None
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_offsets) - 1
+
+    @property
+    def newline(self) -> bytes:
+        """
+        The line ending of the first line, used for lines that are added
+        """
+        if self.line_count:
+            first_line = self.line(0)
+            for newline in (b"\r\n", b"\n", b"\r"):
+                if first_line.endswith(newline):
+                    return newline
+
+        return b"\n"
+
+    def line(self, index: int) -> bytes:
+        """
+        The source bytes of line `index` (from 0), with its line ending
+        """
+        return self.source[self.line_offsets[index] : self.line_offsets[index + 1]]
+
+    def changed_locations(self) -> tuple[list[int], list[Location]]:
+        """
+        Return the indexes of the original locations that are changed or removed, and the locations that are new
+        """
+        locations_by_name = {location.name: location for location in self.locations}
+        changed = [
+            index
+            for index, original in enumerate(self.original_locations)
+            if (location := locations_by_name.get(original.name)) is not original
+            or location_fingerprint(location) != self.fingerprints[index]
+        ]
+        original_names = {original.name for original in self.original_locations}
+        new = [location for location in self.locations if location.name not in original_names]
+
+        return changed, new
@@ -0,0 +1,197 @@
+"""
+Spatial index over parsed locations, see `KOFParser.parse_indexed()`.
+"""
+
+from array import array
+from heapq import heappop, heappush, heappushpop
+from math import hypot, isnan
+from typing import Iterable, Iterator, Optional
+
+from kof_parser.model import Location
+
+
+class LocationIndex:
+    """
+    Locations with a KD-tree over their easting and northing, for bounding box, radius and nearest neighbour queries,
+    and a lookup by name.
+
+    The tree is built once, in O(n log n), and is not updated if the locations are changed. Every tree node holds the
+    bounding box of its points, and the leaves hold at most `leaf_size` points. Locations without both an easting and
+    a northing are only found by name. Coordinates are compared as they are, so all locations should be in the same
+    coordinate system (as they are when parsed).
+    """
+
+    def __init__(self, locations: Iterable[Location], leaf_size: int = 16):
+        self.locations = list(locations)
+        self._locations_by_name = {location.name: location for location in self.locations}
+        self._easting = array("d", (_coordinate(location.point_easting) for location in self.locations))
+        self._northing = array("d", (_coordinate(location.point_northing) for location in self.locations))
+        # (min easting, min northing, max easting, max northing, start, end, left child, right child) of every node,
+        # where the points of a node are `_order[start:end]`, and a leaf has no children (-1)
+        self._nodes: list[tuple[float, float, float, float, int, int, int, int]] = []
+        self._order = self._build(max(leaf_size, 1))
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __iter__(self) -> Iterator[Location]:
+        return iter(self.locations)
+
+    def get(self, name: str) -> Optional[Location]:
+        """
+        Return the location with the name, or None
+        """
+        return self._locations_by_name.get(name)
+
+    def within_bbox(
+        self, min_easting: float, min_northing: float, max_easting: float, max_northing: float
+    ) -> list[Location]:
+        """
+        Return the locations inside the bounding box (edges included), in their original order
+        """
+        easting = self._easting
+        northing = self._northing
+        order = self._order
+        found: list[int] = []
+        stack = [0] if self._nodes else []
+        while stack:
+            node_min_x, node_min_y, node_max_x, node_max_y, start, end, left, right = self._nodes[stack.pop()]
+            if node_max_x < min_easting or node_min_x > max_easting or node_max_y < min_northing:
+                continue
+            if node_min_y > max_northing:
+                continue
+            if min_easting <= node_min_x and node_max_x <= max_easting and min_northing <= node_min_y:
+                if node_max_y <= max_northing:
+                    found.extend(order[start:end])
+                    continue
+            if left < 0:
+                found.extend(
+                    index
+                    for index in order[start:end]
+                    if min_easting <= easting[index] <= max_easting and min_northing <= northing[index] <= max_northing
+                )
+            else:
+                stack.append(left)
+                stack.append(right)
+
+        return [self.locations[index] for index in sorted(found)]
+
+    def within_radius(self, easting: float, northing: float, radius: float) -> list[Location]:
+        """
+        Return the locations within `radius` of the point (edge included), nearest first
+        """
+        found = []
+        stack = [0] if self._nodes else []
+        while stack:
+            node = self._nodes[stack.pop()]
+            if _distance_to_box(easting, northing, node) > radius:
+                continue
+            _, _, _, _, start, end, left, right = node
+            if left < 0:
+                for index in self._order[start:end]:
+                    distance = hypot(self._easting[index] - easting, self._northing[index] - northing)
+                    if distance <= radius:
+                        found.append((distance, index))
+            else:
+                stack.append(left)
+                stack.append(right)
+
+        return [self.locations[index] for _, index in sorted(found)]
+
+    def nearest(self, easting: float, northing: float, k: int = 1) -> list[Location]:
+        """
+        Return the `k` locations nearest to the point, nearest first. Locations at the same distance are returned in
+        their original order.
+        """
+        if k <= 0 or not self._nodes:
+            return []
+
+        # Max-heap of the k nearest points found so far, as (-distance, -index)
+        best: list[tuple[float, int]] = []
+        # Min-heap of the nodes to visit, by the distance from the point to their bounding box
+        queue = [(_distance_to_box(easting, northing, self._nodes[0]), 0)]
+        while queue:
+            node_distance, node_id = heappop(queue)
+            if len(best) == k and node_distance > -best[0][0]:
+                break
+            _, _, _, _, start, end, left, right = self._nodes[node_id]
+            if left >= 0:
+                for child in (left, right):
+                    heappush(queue, (_distance_to_box(easting, northing, self._nodes[child]), child))
+                continue
+            for index in self._order[start:end]:
+                candidate = (-hypot(self._easting[index] - easting, self._northing[index] - northing), -index)
+                if len(best) < k:
+                    heappush(best, candidate)
+                elif candidate > best[0]:
+                    heappushpop(best, candidate)
+
+        return [self.locations[-index] for _, index in sorted(best, reverse=True)]
+
+    def _build(self, leaf_size: int) -> array:
+        """
+        Build the KD-tree, and return the indexes of the points in the order of the leaves.
+
+        The points are sorted by easting and by northing once. Every node is split at the median of its widest axis,
+        and the other sorted list is partitioned stably, so both lists stay sorted within every node without sorting
+        again. This makes the build O(n log n).
+        """
+        easting = self._easting
+        northing = self._northing
+        points = [index for index in range(len(self.locations)) if not isnan(easting[index] + northing[index])]
+        by_easting = array("q", sorted(points, key=easting.__getitem__))
+        by_northing = array("q", sorted(points, key=northing.__getitem__))
+        if not points:
+            return by_easting
+
+        in_left = bytearray(len(self.locations))
+        self._nodes.append(self._node(by_easting, by_northing, 0, len(points)))
+        stack = [0]
+        while stack:
+            node_id = stack.pop()
+            min_x, min_y, max_x, max_y, start, end, _, _ = self._nodes[node_id]
+            if end - start <= leaf_size:
+                continue
+
+            middle = (start + end) // 2
+            split, other = (by_easting, by_northing) if max_x - min_x >= max_y - min_y else (by_northing, by_easting)
+            for index in split[start:middle]:
+                in_left[index] = 1
+            left_points = [index for index in other[start:end] if in_left[index]]
+            right_points = [index for index in other[start:end] if not in_left[index]]
+            other[start:end] = array("q", left_points + right_points)
+            for index in left_points:
+                in_left[index] = 0
+
+            left = len(self._nodes)
+            self._nodes.append(self._node(by_easting, by_northing, start, middle))
+            self._nodes.append(self._node(by_easting, by_northing, middle, end))
+            self._nodes[node_id] = (min_x, min_y, max_x, max_y, start, end, left, left + 1)
+            stack.extend((left, left + 1))
+
+        return by_easting
+
+    def _node(
+        self, by_easting: array, by_northing: array, start: int, end: int
+    ) -> tuple[float, float, float, float, int, int, int, int]:
+        return (
+            self._easting[by_easting[start]],
+            self._northing[by_northing[start]],
+            self._easting[by_easting[end - 1]],
+            self._northing[by_northing[end - 1]],
+            start,
+            end,
+            -1,
+            -1,
+        )
+
+
+def _coordinate(value: Optional[float]) -> float:
+    return float("nan") if value is None else value
+
+
+def _distance_to_box(
+    easting: float, northing: float, node: tuple[float, float, float, float, int, int, int, int]
+) -> float:
+    min_x, min_y, max_x, max_y = node[:4]
+    return hypot(max(min_x - easting, 0.0, easting - max_x), max(min_y - northing, 0.0, northing - max_y))
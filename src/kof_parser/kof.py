@@ -2,31 +2,227 @@
 Common super class for the KOFReader() and KOFWriter() classes
 """
 
-import csv
+from array import array
+from collections import OrderedDict
+from functools import cache
 from pathlib import Path
-from typing import Dict, Optional
+from sys import intern
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, Generic, Iterable, Iterator, Optional, TypeVar, Union
+
+from kof_parser.enums import MethodType
+
+if TYPE_CHECKING:
+    from coordinate_projector import Projector
+    from pyproj import Transformer
+
+_T = TypeVar("_T")
 
 
 def get_srid_to_code_mapping() -> Dict[int, int]:
-    field_names = ["name", "description", "code", "srid"]
+    """
+    Read the srid/epsg to SOSI code mapping from KoordSys.csv (columns: name;description;code;srid)
+    """
     path = Path(__file__).parent.absolute()
     result = {}
     with open(path / "KoordSys.csv", mode="r") as csv_file:
-        csv_reader = csv.DictReader(csv_file, fieldnames=field_names, delimiter=";")
-        for row in csv_reader:
-            result[int(row["srid"])] = int(row["code"])
+        for row in csv_file:
+            if row.strip():
+                _, _, code, srid = row.rsplit(";", 3)
+                result[int(srid)] = int(code)
 
     return result
 
 
-_srid_to_code_mapping = get_srid_to_code_mapping()
-_code_to_srid_mapping = {value: key for (key, value) in _srid_to_code_mapping.items()}
+@cache
+def _get_mappings() -> tuple[Dict[int, int], Dict[int, int]]:
+    """
+    The srid to code and code to srid mappings, read on first use and shared by all Kof instances
+    """
+    srid_to_code_mapping = get_srid_to_code_mapping()
+    return srid_to_code_mapping, {value: key for (key, value) in srid_to_code_mapping.items()}
+
+
+@cache
+def get_projector() -> "Projector":
+    """
+    The projector, created on first use. Importing it loads pyproj, which is slow, so it is not done on import.
+    """
+    from coordinate_projector import Projector
+
+    return Projector()
+
+
+def __getattr__(name: str) -> Any:
+    # The module level projector used to be created on import, keep it available for backwards compatibility
+    if name == "projector":
+        return get_projector()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class TransformerCache:
+    """
+    Least recently used cache of coordinate transformers, keyed by (from_srid, to_srid).
+
+    Creating a transformer means resolving both coordinate systems in the PROJ database, which is much slower than
+    transforming a batch of coordinates. At most `maxsize` transformers are kept. `hits` and `misses` count the
+    lookups that found and did not find a cached transformer.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._transformers: OrderedDict[tuple[int, int], "Transformer"] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._transformers)
+
+    def get(self, from_srid: int, to_srid: int) -> "Transformer":
+        key = (from_srid, to_srid)
+        with self._lock:
+            if (transformer := self._transformers.get(key)) is not None:
+                self._transformers.move_to_end(key)
+                self.hits += 1
+                return transformer
+            self.misses += 1
+
+        from pyproj import CRS, Transformer
+
+        transformer = Transformer.from_crs(CRS.from_epsg(from_srid), CRS.from_epsg(to_srid), always_xy=True)
+
+        with self._lock:
+            self._transformers[key] = transformer
+            self._transformers.move_to_end(key)
+            while len(self._transformers) > max(self.maxsize, 0):
+                self._transformers.popitem(last=False)
+
+        return transformer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._transformers.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+transformer_cache = TransformerCache()
+
+
+class TemaCodes:
+    """
+    Table of KOF tema codes and the method types they stand for, used both to parse and to write kof files.
+
+    A method type may have many codes (e.g. "2413" and "GVR" for PZ). All of them are parsed to the method type, and
+    the first one added is written, unless another one is added with `write=True`. The codes and method names are
+    interned, so the methods of parsed locations share one string per method type, and a lookup is one dict lookup.
+
+    Codes can be added at runtime, e.g. `tema_codes.add("2430", MethodType.OTHER)`. That changes the shared table of
+    all parsers and writers. To change one parser or writer only, pass it a copy, e.g.
+    `KOFParser(tema_codes=codes)` with `codes = tema_codes.copy()`.
+    """
+
+    def __init__(self, codes: Iterable[tuple[str, Union[MethodType, str]]] = ()):
+        # Code to method type, code to method name, and method name to the code that is written
+        self.methods: dict[str, MethodType] = {}
+        self.method_names: dict[str, str] = {}
+        self.codes: dict[str, str] = {}
+        for code, method in codes:
+            self.add(code, method)
+
+    def __len__(self) -> int:
+        return len(self.methods)
+
+    def add(self, code: str, method: Union[MethodType, str], write: bool = False) -> None:
+        """
+        Parse `code` as `method`, and write it for the method if it is its first code or if `write` is True
+        """
+        method = MethodType(method)
+        if code in self.methods:
+            self.remove(code)
+        code = intern(code)
+        self.methods[code] = method
+        self.method_names[code] = intern(method.name)
+        if write or method.name not in self.codes:
+            self.codes[method.name] = code
+
+    def remove(self, code: str) -> None:
+        """
+        Stop parsing `code`. If it was written for its method, the method's next code is written instead, if any.
+        """
+        method = self.methods.pop(code)
+        del self.method_names[code]
+        if self.codes.get(method.name) == code:
+            del self.codes[method.name]
+            if (other_code := next((key for key, value in self.methods.items() if value is method), None)) is not None:
+                self.codes[method.name] = other_code
+
+    def method(self, code: str) -> Optional[str]:
+        """
+        The method name of the tema code, or None
+        """
+        return self.method_names.get(code)
+
+    def code(self, method: str) -> str:
+        """
+        The tema code written for the method name, or "" if it has none
+        """
+        return self.codes.get(method, "")
+
+    def copy(self) -> "TemaCodes":
+        table = TemaCodes()
+        table.methods = dict(self.methods)
+        table.method_names = dict(self.method_names)
+        table.codes = dict(self.codes)
+        return table
+
+
+tema_codes = TemaCodes(
+    [
+        ("2251", MethodType.RO),
+        ("F", MethodType.RO),
+        ("2401", MethodType.RWS),
+        ("2402", MethodType.SA),
+        ("2403", MethodType.TP),
+        # 2404
+        ("2405", MethodType.SS),
+        ("2406", MethodType.RP),
+        ("2407", MethodType.CPT),
+        # 2408
+        ("2409", MethodType.RS),
+        ("2410", MethodType.SR),
+        ("2411", MethodType.SPT),
+        ("2412", MethodType.RCD),
+        ("2413", MethodType.PZ),
+        ("GVR", MethodType.PZ),
+        ("2414", MethodType.PT),
+        ("2415", MethodType.SVT),
+        ("VB", MethodType.SVT),
+        # 2416
+        ("2417", MethodType.INC),
+        ("2418", MethodType.TOT),
+        # 2419
+        # 2430 has many uses, so it is not mapped by default. Add it with e.g. tema_codes.add("2430", MethodType.OTHER)
+    ]
+)
 
 
 class Kof:
-    def __init__(self):
-        self.srid_to_code_mapping = _srid_to_code_mapping
-        self.code_to_srid_mapping = _code_to_srid_mapping
+    # The tema code table, shared by all parsers and writers unless one is passed to the constructor
+    tema_codes = tema_codes
+
+    def __init__(self, tema_codes: Optional[TemaCodes] = None):
+        if tema_codes is not None:
+            self.tema_codes = tema_codes
+
+    @property
+    def srid_to_code_mapping(self) -> Dict[int, int]:
+        return _get_mappings()[0]
+
+    @property
+    def code_to_srid_mapping(self) -> Dict[int, int]:
+        return _get_mappings()[1]
 
     def get_srid(self, code: int) -> Optional[int]:
         """
@@ -39,3 +235,36 @@ class Kof:
         Get SOSI code from srid/epsg
         """
         return self.srid_to_code_mapping.get(srid)
+
+
+class CoordinateBatch(Generic[_T]):
+    """
+    Easting/northing pairs collected for one (from_srid, to_srid) transformation.
+
+    Each pair is stored with an item (e.g. a location or a row index) so the transformed coordinates can be written
+    back to where they came from. All pairs are transformed in one vectorized call, instead of paying the projection
+    overhead for every point.
+    """
+
+    def __init__(self, from_srid: int, to_srid: int):
+        self.from_srid = from_srid
+        self.to_srid = to_srid
+        self.items: list[_T] = []
+        self.eastings = array("d")
+        self.northings = array("d")
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item: _T, easting: float, northing: float) -> None:
+        self.items.append(item)
+        self.eastings.append(easting)
+        self.northings.append(northing)
+
+    def transform(self) -> Iterator[tuple[_T, float, float]]:
+        """
+        Transform all collected pairs and return them as (item, easting, northing) tuples
+        """
+        transformer = transformer_cache.get(self.from_srid, self.to_srid)
+        eastings, northings = transformer.transform(self.eastings, self.northings)
+        return zip(self.items, eastings, northings)
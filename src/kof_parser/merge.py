@@ -0,0 +1,178 @@
+"""
+Merging of locations with the same name, in memory or spilled to disk, see `KOFParser.iter_parse_merged()`.
+"""
+
+import json
+from heapq import merge as heapq_merge
+from math import ceil
+from operator import itemgetter
+from os import PathLike
+from pathlib import Path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import Iterable, Iterator, Optional, Union
+
+from kof_parser.model import Location, construct_location
+
+# Estimated memory of a location waiting to be merged (the location, its methods and its entry in the merge), in bytes
+LOCATION_MEMORY_SIZE = 1600
+
+# Estimated size of a coordinate block (05) line, in bytes
+LINE_SIZE = 60
+
+# The most partitions that are spilled to
+MAX_PARTITIONS = 1024
+
+# The number of sorted partitions that are read at the same time. More partitions are merged in several passes.
+MAX_OPEN_RUNS = 128
+
+
+def merge_location(existing_location: Location, location: Location) -> None:
+    """
+    Merge a location into an earlier location with the same name. Methods are appended and the last coordinates win.
+    """
+    existing_location.methods += location.methods
+    existing_location.point_easting = location.point_easting
+    existing_location.point_northing = location.point_northing
+    existing_location.point_z = location.point_z
+
+
+class ExternalMerge:
+    """
+    Merge locations with the same name, like `KOFParser.parse()` does, within a memory budget.
+
+    Locations are merged in memory until `memory_budget` bytes (estimated) are used. Then the merged locations are
+    spilled to `partitions` temporary files, by the hash of their name, so all locations with the same name end up
+    in the same partition. When all locations are read, every partition is merged on its own and written back sorted
+    by where its names first appeared, and the partitions are merged into one stream in that order with
+    `heapq.merge()`. The result is the same as merging all locations in memory.
+
+    The budget bounds the locations held while reading and while merging one partition, so every partition must fit
+    in it: pass more partitions for more locations, e.g. `partitions_for()` the size of the file. If the locations
+    fit in the budget, nothing is written to disk.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = 64 * 1024 * 1024,
+        partitions: int = 64,
+        directory: Optional[Union[str, PathLike]] = None,
+    ):
+        self.memory_budget = memory_budget
+        self.partitions = max(partitions, 1)
+        self.directory = directory
+        self.spills = 0
+
+    @staticmethod
+    def partitions_for(size: int, memory_budget: int) -> int:
+        """
+        The number of partitions needed to merge a file of `size` bytes within the memory budget, with some margin
+        for names that are not spread evenly, and at most `MAX_PARTITIONS`
+        """
+        return min(max(ceil(2 * size / LINE_SIZE * LOCATION_MEMORY_SIZE / max(memory_budget, 1)), 1), MAX_PARTITIONS)
+
+    def merge(self, locations: Iterable[Location]) -> Iterator[Location]:
+        """
+        Merge the locations, and yield the merged locations in the order their names first appear
+        """
+        capacity = max(self.memory_budget // LOCATION_MEMORY_SIZE, 1)
+        # The sequence number of the first location with the name, and the merged location, by name
+        merged: dict[str, tuple[int, Location]] = {}
+        directory: Optional[TemporaryDirectory] = None
+        paths: list[Path] = []
+        try:
+            for sequence, location in enumerate(locations):
+                if (entry := merged.get(location.name)) is None:
+                    merged[location.name] = (sequence, location)
+                else:
+                    merge_location(entry[1], location)
+                if len(merged) >= capacity:
+                    if directory is None:
+                        directory = TemporaryDirectory(prefix="kof-merge-", dir=self.directory)
+                        paths = [Path(directory.name) / f"partition-{index}.jsonl" for index in range(self.partitions)]
+                    self._spill(merged, paths)
+                    merged = {}
+
+            if directory is None:
+                yield from (location for _, location in merged.values())
+                return
+
+            self._spill(merged, paths)
+            del merged
+            runs = [self._merge_partition(path) for path in paths if path.exists()]
+            while len(runs) > MAX_OPEN_RUNS:
+                runs = [self._merge_runs(runs[i : i + MAX_OPEN_RUNS]) for i in range(0, len(runs), MAX_OPEN_RUNS)]
+            for _, name, methods, easting, northing, z, srid in heapq_merge(
+                *map(self._read_run, runs), key=itemgetter(0)
+            ):
+                yield construct_location(name, methods, easting, northing, z, srid)
+        finally:
+            if directory is not None:
+                directory.cleanup()
+
+    def _spill(self, merged: dict[str, tuple[int, Location]], paths: list[Path]) -> None:
+        """
+        Append the merged locations to their partitions, one JSON array per line. The files are only open while they
+        are written, so the number of partitions is not limited by the number of open files.
+        """
+        if not merged:
+            return
+
+        self.spills += 1
+        partitions: dict[int, list[str]] = {}
+        for sequence, location in merged.values():
+            record = [
+                sequence,
+                location.name,
+                location.methods,
+                location.point_easting,
+                location.point_northing,
+                location.point_z,
+                location.srid,
+            ]
+            partitions.setdefault(hash(location.name) % len(paths), []).append(json.dumps(record) + "\n")
+        for partition, lines in partitions.items():
+            with open(paths[partition], "a", encoding="utf-8") as f:
+                f.writelines(lines)
+
+    @staticmethod
+    def _merge_partition(path: Path) -> Path:
+        """
+        Merge the spilled locations of a partition, which are in the order they were read, and write them back sorted
+        by the sequence number of their first location. Return the path of the sorted partition.
+        """
+        merged: dict[str, list] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if (existing := merged.get(record[1])) is None:
+                    merged[record[1]] = record
+                else:
+                    existing[2] += record[2]
+                    existing[3:6] = record[3:6]
+        path.unlink()
+
+        sorted_path = path.with_suffix(".sorted.jsonl")
+        with open(sorted_path, "w", encoding="utf-8") as f:
+            for record in sorted(merged.values(), key=itemgetter(0)):
+                f.write(json.dumps(record) + "\n")
+
+        return sorted_path
+
+    @classmethod
+    def _merge_runs(cls, runs: list[Path]) -> Path:
+        """
+        Merge sorted partitions into one, and return its path
+        """
+        with NamedTemporaryFile("w", encoding="utf-8", dir=runs[0].parent, suffix=".jsonl", delete=False) as f:
+            for record in heapq_merge(*map(cls._read_run, runs), key=itemgetter(0)):
+                f.write(json.dumps(record) + "\n")
+        for run in runs:
+            run.unlink()
+
+        return Path(f.name)
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[list]:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
@@ -1,3 +1,8 @@
+from array import array
+from dataclasses import dataclass
+from math import isnan
+from typing import Iterator, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -11,3 +16,132 @@ class Location(BaseModel):
 
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.name} ({self.point_easting}, {self.point_northing}, {self.point_z})>"
+
+
+_location_fields = frozenset(Location.model_fields)
+_set_attribute = object.__setattr__
+
+
+def construct_location(
+    name: str,
+    methods: list[str],
+    point_easting: Optional[float],
+    point_northing: Optional[float],
+    point_z: Optional[float],
+    srid: Optional[int],
+) -> Location:
+    """
+    Create a Location from trusted values, without validation.
+
+    This does the same as `Location.model_construct()` with all fields passed, but without its per-call overhead.
+    """
+    location = object.__new__(Location)
+    _set_attribute(
+        location,
+        "__dict__",
+        {
+            "name": name,
+            "methods": methods,
+            "point_easting": point_easting,
+            "point_northing": point_northing,
+            "point_z": point_z,
+            "srid": srid,
+        },
+    )
+    _set_attribute(location, "__pydantic_fields_set__", set(_location_fields))
+    _set_attribute(location, "__pydantic_extra__", None)
+    _set_attribute(location, "__pydantic_private__", None)
+
+    return location
+
+
+@dataclass
+class LocationColumns:
+    """
+    Locations stored column by column, e.g. as parsed by `KOFParser.parse_columnar()`.
+
+    The `easting`, `northing`, `z` and `srid` columns are contiguous arrays (with NaN for missing coordinates), and
+    support the buffer protocol, e.g. `numpy.frombuffer(columns.easting)`. The methods are stored in the Arrow list
+    layout: the methods of location `i` are `method_values[method_offsets[i]:method_offsets[i + 1]]`.
+    """
+
+    names: list[str]
+    method_values: list[str]
+    method_offsets: array
+    easting: array
+    northing: array
+    z: array
+    srid: array
+
+    @classmethod
+    def from_method_rows(
+        cls,
+        names: list[str],
+        easting: array,
+        northing: array,
+        z: array,
+        srid: array,
+        method_rows: array,
+        method_values: list[str],
+    ) -> "LocationColumns":
+        """
+        Create the columns from methods given as (row, method) pairs. The methods of each row keep their order.
+        """
+        method_offsets = array("q", bytes(8 * (len(names) + 1)))
+        for row in method_rows:
+            method_offsets[row + 1] += 1
+        for row in range(len(names)):
+            method_offsets[row + 1] += method_offsets[row]
+
+        next_index = method_offsets[:-1]
+        sorted_method_values = [""] * len(method_values)
+        for row, method in zip(method_rows, method_values):
+            sorted_method_values[next_index[row]] = method
+            next_index[row] += 1
+
+        return cls(
+            names=names,
+            method_values=sorted_method_values,
+            method_offsets=method_offsets,
+            easting=easting,
+            northing=northing,
+            z=z,
+            srid=srid,
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_methods(self, index: int) -> list[str]:
+        return self.method_values[self.method_offsets[index] : self.method_offsets[index + 1]]
+
+    def to_locations(self) -> Iterator[Location]:
+        for index, name in enumerate(self.names):
+            yield construct_location(
+                name=name,
+                methods=self.get_methods(index),
+                point_easting=_none_if_nan(self.easting[index]),
+                point_northing=_none_if_nan(self.northing[index]),
+                point_z=_none_if_nan(self.z[index]),
+                srid=self.srid[index],
+            )
+
+
+def _none_if_nan(value: float) -> Optional[float]:
+    return None if isnan(value) else value
+
+
+@dataclass
+class Diagnostic:
+    """
+    A problem with a line of a kof file, found by a lenient parse (see the `diagnostics` parameter of
+    `KOFParser.parse()`).
+
+    `field` is the field with the problem (e.g. "easting" or "coordinate_system"), or None if it is the whole line. If
+    `repaired` is True, the line was repaired and used, otherwise it was skipped.
+    """
+
+    line_number: int
+    field: Optional[str]
+    reason: str
+    repaired: bool = False
@@ -2,19 +2,37 @@
 This is the parser service.
 """
 
-from io import BytesIO, TextIOWrapper
-from typing import Optional, Any
+import codecs
+import re
+from array import array
+from codecs import getincrementaldecoder
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from hashlib import sha256
+from itertools import islice, pairwise
+from io import SEEK_END, BufferedReader, BytesIO, IncrementalNewlineDecoder, RawIOBase, TextIOWrapper
+from math import nan
+from mmap import ACCESS_READ, mmap
+from os import PathLike, cpu_count, fstat
+from time import perf_counter
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, Mapping, Optional, TypeVar, Union
 
-from charset_normalizer import detect
-from coordinate_projector import Projector
+from pydantic import ValidationError
 
 from kof_parser import Kof
+from kof_parser.kof import CoordinateBatch, TemaCodes
+from kof_parser.cache import CACHE_HEAD_SIZE, CachedParse, ParseCache, copy_locations, parse_cache_key
 from kof_parser.exceptions import ParseError
-from kof_parser.model import Location
+from kof_parser.document import KOFDocument, location_fingerprint
+from kof_parser.index import LocationIndex
+from kof_parser.merge import ExternalMerge, merge_location
+from kof_parser.model import Diagnostic, Location, LocationColumns, construct_location
+from kof_parser.stats import ParseStats
+from kof_parser.tokenizer import ADMINISTRATIVE_RECORD, COORDINATE_RECORD, RecordSpec, record_spec
 from kof_parser.enums import MethodType
 
-projector = Projector()
-
 #                   2251                                                  *Berg i dagen (RO/F)
 # //  05 TEST1      2401            0.000       0.000    0.000            *dreiesondering RWS
 # //  05 TEST10     2402            0.000       0.000    0.000            *prøvetaking    SA
@@ -38,76 +56,265 @@ projector = Projector()
 # //  05 TEST11     2430            0.000       0.000    0.000            *miljøprøvetaking
 
 
+_T = TypeVar("_T")
+
+_STATS_SAMPLE_INTERVAL = 16
+
+# The fields of a coordinate block (05) line, with their columns
+_COORDINATE_COLUMNS = {column.name: (column.start, column.end) for column in COORDINATE_RECORD.columns}
+_COORDINATE_FIELD_BY_LOCATION_FIELD = {"point_easting": "easting", "point_northing": "northing", "point_z": "z"}
+_L = TypeVar("_L", str, bytes)
+
+_UTF_8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+_ASCII = bytes(range(0x80))
+
+# A line ending, as `bytes.splitlines()` splits lines of kof files
+_LINE_ENDING = re.compile(rb"\r\n|\r|\n")
+
+# A carriage return that does not end a line with "\r\n", i.e. is a line ending of its own
+_LONE_CARRIAGE_RETURN = re.compile(rb"\r(?!\n)")
+
+# Any byte that is not a printable ASCII character or a line ending (e.g. a tab or a non-ASCII character)
+_NOT_PRINTABLE_ASCII = re.compile(rb"[^ -~\r\n]")
+
+
+def _is_utf_8(data: bytes, final: bool = True) -> bool:
+    """
+    Check if `data` is valid UTF-8. If `final` is False, `data` may end in the middle of a character.
+    """
+    try:
+        getincrementaldecoder("utf-8")().decode(data, final=final)
+    except UnicodeDecodeError:
+        return False
+
+    return True
+
+
+def _is_ascii_compatible(encoding: str) -> bool:
+    """
+    Check if the ASCII characters are encoded as single ASCII bytes in `encoding`, as in e.g. UTF-8 and ISO-8859-15
+    """
+    try:
+        return _ASCII.decode(encoding) == _ASCII.decode("ascii")
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+# The character set of files where only a sample was detected as ASCII or UTF-8: UTF-8, with the bytes that are not
+# valid UTF-8 decoded as ISO-8859-15, so a non-ASCII character after the sample can not garble or fail the parse
+FALLBACK_CHAR_SET = "utf-8-iso-8859-15"
+
+_FALLBACK_ERRORS = "kof-iso-8859-15-fallback"
+
+
+def _decode_as_iso_8859_15(error: UnicodeError) -> tuple[str, int]:
+    if not isinstance(error, UnicodeDecodeError):
+        raise error
+
+    return error.object[error.start : error.end].decode("iso-8859-15"), error.end
+
+
+def _fallback_decode(data: Any, errors: str = "strict") -> tuple[str, int]:
+    return codecs.utf_8_decode(data, _FALLBACK_ERRORS, True)
+
+
+class _FallbackIncrementalDecoder(codecs.BufferedIncrementalDecoder):
+    @staticmethod
+    def _buffer_decode(data, errors, final):
+        return codecs.utf_8_decode(data, _FALLBACK_ERRORS, final)
+
+
+def _search_fallback_char_set(name: str) -> Optional[codecs.CodecInfo]:
+    if name.replace("-", "_") != FALLBACK_CHAR_SET.replace("-", "_"):
+        return None
+
+    utf_8 = codecs.lookup("utf-8")
+    return codecs.CodecInfo(
+        name=FALLBACK_CHAR_SET,
+        encode=utf_8.encode,
+        decode=_fallback_decode,
+        incrementalencoder=utf_8.incrementalencoder,
+        incrementaldecoder=_FallbackIncrementalDecoder,
+        streamreader=utf_8.streamreader,
+        streamwriter=utf_8.streamwriter,
+    )
+
+
+codecs.register_error(_FALLBACK_ERRORS, _decode_as_iso_8859_15)
+codecs.register(_search_fallback_char_set)
+
+
+class _ReplayStream(RawIOBase):
+    """
+    Non-seekable stream that first returns the bytes already read from it (e.g. for character set detection) and then
+    the rest of the stream, without buffering the whole stream.
+    """
+
+    def __init__(self, head: bytes, stream: Any):
+        self._head = memoryview(head)
+        self._stream = stream
+        self.bytes_read = len(head)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stream.close()
+        super().close()
+
+
+@dataclass
+class ParseContext:
+    """
+    The state of one parse of a kof file.
+
+    `file_srid` and `use_east_north_order_as_default` start out as given by the caller, and are updated by the
+    administrative blocks (01) as the file is read. Keeping them here instead of on the parser makes one `KOFParser`
+    safe to use from many threads at once.
+
+    `line_count` is the number of lines read. If `stats` are passed, the timings and counters of the parse are added
+    to them. Timing every coordinate line would slow the parse down noticeably, so splitting and location creation
+    are timed for every `_STATS_SAMPLE_INTERVAL`th point only (`sampled_points`), and scaled up to all `points`.
+
+    If `diagnostics` is a list, the parse is lenient: bad lines are repaired or skipped, and a `Diagnostic` is added to
+    the list for every problem, instead of raising a ParseError.
+    """
+
+    file_srid: Optional[int] = None
+    use_east_north_order_as_default: bool = True
+    encoding: Optional[str] = None
+    line_count: int = 0
+    stats: Optional[ParseStats] = None
+    diagnostics: Optional[list[Diagnostic]] = None
+    points: int = 0
+    sampled_points: int = 0
+    sampled_parse_seconds: float = 0.0
+    sampled_construct_seconds: float = 0.0
+
+
+@dataclass
+class _ParsedChunk:
+    """
+    The coordinate block (05) lines of a byte range of a file, parsed by `_parse_chunk()` without the state of the
+    lines before it.
+
+    `records` are the (name, methods, easting, northing, z) of the lines, as they are in the file. The administrative
+    block (01) lines are kept as (number of records before it, line number, line), to be replayed in file order.
+    `error` is the (line number, message) of the first line that could not be parsed, which ends the chunk. Line
+    numbers count from the start of the chunk.
+    """
+
+    records: list[tuple[str, list[str], Optional[float], Optional[float], Optional[float]]] = field(
+        default_factory=list
+    )
+    administrative_lines: list[tuple[int, int, str]] = field(default_factory=list)
+    line_count: int = 0
+    error: Optional[tuple[int, str]] = None
+
+
 class KOFParser(Kof):
-    tema_codes_mapping = {
-        "2251": MethodType.RO,
-        "F": MethodType.RO,
-        "2401": MethodType.RWS,
-        "2402": MethodType.SA,
-        "2403": MethodType.TP,
-        # 2404
-        "2405": MethodType.SS,
-        "2406": MethodType.RP,
-        "2407": MethodType.CPT,
-        # 2408
-        "2409": MethodType.RS,
-        "2410": MethodType.SR,
-        "2411": MethodType.SPT,
-        "2412": MethodType.RCD,
-        "2413": MethodType.PZ,
-        "GVR": MethodType.PZ,
-        "2414": MethodType.PT,
-        "2415": MethodType.SVT,
-        "VB": MethodType.SVT,
-        # 2416
-        "2417": MethodType.INC,
-        "2418": MethodType.TOT,
-        # 2419
-        # 2430 has many uses, could be mapped to the OTHER method type?
-    }
-
-    def __init__(self):
-        super().__init__()
-        self.use_east_north_order_as_default = True
-        self.file_srid: Optional[int] = None
+    # A read-only view of the tema codes and the method types they are parsed to, of the shared table. An instance has
+    # a view of its own table. Add codes with `tema_codes.add()`.
+    tema_codes_mapping: Mapping[str, MethodType] = MappingProxyType(Kof.tema_codes.methods)
+
+    def __init__(self, charset_sample_size: Optional[int] = 64 * 1024, tema_codes: Optional[TemaCodes] = None):
+        """
+        The character set of a file is detected from the first `charset_sample_size` bytes, and from a quarter as many
+        bytes at the end of the file if it is seekable. Pass `None` to detect it from the whole file.
+
+        Tema codes are parsed to methods with `tema_codes`, or the shared table, see `TemaCodes`.
+        """
+        super().__init__(tema_codes)
+        self.charset_sample_size = charset_sample_size
+        self.tema_codes_mapping = MappingProxyType(self.tema_codes.methods)
 
     def tema_code_to_method(self, code: str) -> Optional[str]:
-        if not code or code not in self.tema_codes_mapping.keys():
-            return None
+        return self.tema_codes.method_names.get(code)
 
-        return self.tema_codes_mapping[code].name
+    def map_line_to_coordinate_block(self, line: str, result_srid: int, validate: bool = True) -> Location:
+        """
+        If `validate` is False, the location is created without validation (e.g. of the point_z range), which is
+        faster. See `validate_locations()`.
+        """
+        return self._create_coordinate_location(*self._split_coordinate_line(line), result_srid, validate)
 
-    def map_line_to_coordinate_block(self, line: str, result_srid: int) -> Location:
-        # template_coordinate_block: str = "-05 PPPPPPPPPP KKKKKKKK XXXXXXXX.XXX YYYYYYY.YYY ZZZZ.ZZZ Bk MMMMMMM"
-        if "\t" in line:
-            raise ParseError("KOF file contains tabs, please convert to spaces.")
+    def _create_coordinate_location(
+        self,
+        name: str,
+        tema_code: str,
+        easting: Optional[float],
+        northing: Optional[float],
+        z: Optional[float],
+        result_srid: int,
+        validate: bool,
+    ) -> Location:
+        new_method = self.tema_code_to_method(tema_code)
+
+        if not validate:
+            return construct_location(
+                name=name,
+                methods=[new_method] if new_method else [],
+                point_easting=easting,
+                point_northing=northing,
+                point_z=z,
+                srid=result_srid,
+            )
 
         resolved_location = Location(
-            name=line[4:15].strip(),
+            name=name,
             srid=result_srid,
-            point_easting=float(line[24:37]) if line[24:37].strip() else None,
-            point_northing=float(line[37:49]) if line[37:49].strip() else None,
-            point_z=float(line[49:58]) if line[49:58].strip() else None,
+            point_easting=easting,
+            point_northing=northing,
+            point_z=z,
         )
-        if new_method := self.tema_code_to_method(line[15:24].strip()):
+        if new_method:
             resolved_location.methods.append(new_method)
 
         return resolved_location
 
-    def map_line_to_administrative_block(self, line: str, file_srid: Optional[int]) -> None:
-        # template_admin_block: str = "-01 OOOOOOOOOOOO DDMMYYYY VVV KKKKKKK KKKK $RVAllllllll OOOOOOOOOOOO"
-        if "\t" in line:
-            raise ParseError("KOF file contains tabs, please convert to spaces.")
-        coordinate_system = line[30:38].strip()
+    # Split a coordinate block (05) line into its name, tema code, easting, northing and z fields, see `RecordSpec`
+    _split_coordinate_line: Callable[[str], tuple[str, str, Optional[float], Optional[float], Optional[float]]] = (
+        staticmethod(COORDINATE_RECORD.split)
+    )
+
+    def map_line_to_administrative_block(self, line: str, file_srid: Optional[int], context: ParseContext) -> None:
+        """
+        Update the parse context with the coordinate system and axis order of the administrative block (01).
+        """
+        _, _, _, coordinate_system, _, units, _ = ADMINISTRATIVE_RECORD.split(line)
         if coordinate_system and not file_srid:
-            self.file_srid = self.get_srid(int(coordinate_system))
-        units = line[43:56]
+            context.file_srid = self.get_srid(int(coordinate_system))
         if units:
             dir_spec = units[1:2]
             if dir_spec == "1":
-                self.use_east_north_order_as_default = False
+                context.use_east_north_order_as_default = False
             elif dir_spec == "2":
-                self.use_east_north_order_as_default = True
+                context.use_east_north_order_as_default = True
+
+    @staticmethod
+    def validate_locations(locations: Iterable[Location]) -> None:
+        """
+        Validate locations, e.g. parsed with `validate=False`. Raise a ParseError for the first invalid location.
+        """
+        for location in locations:
+            try:
+                Location.model_validate(location.__dict__)
+            except ValidationError as e:
+                raise ParseError(f"Invalid location {location.name} - {e}")
 
     def parse(
         self,
@@ -115,6 +322,10 @@ class KOFParser(Kof):
         result_srid: int,
         file_srid: Optional[int] = None,
         swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        cache: Optional[ParseCache] = None,
+        stats: Optional[ParseStats] = None,
+        diagnostics: Optional[list[Diagnostic]] = None,
     ) -> list[Location]:
         """
         Parse passed kof file. Resulting locations are returned in the `result_srid` coordinate system.
@@ -129,97 +340,1292 @@ class KOFParser(Kof):
 
         If the swap_easting_northing parameter is set to True, then the easting and northing values are swapped before
         any transformation is done.
+
+        If `validate` is False, the locations are not validated while parsing, which is faster for trusted input.
+        They can be validated afterwards with `validate_locations()`.
+
+        If a `cache` is passed (e.g. `MemoryParseCache` or `DiskParseCache`), a file that has been parsed with the
+        same parameters before is returned from the cache. If lines have been appended to it since, only the new
+        lines are parsed and merged onto the cached locations. Files are recognized by their content, so the cache
+        works for uploaded files as well as paths. Non-seekable streams are read into memory.
+
+        If `stats` are passed, the time spent in every stage of the parse and the number of lines, points and bytes
+        read are added to them. See `ParseStats`.
+
+        If a `diagnostics` list is passed, the parse is lenient: tabs are expanded to spaces, and a line with a field
+        that can not be parsed or is invalid is skipped, instead of raising a ParseError. A `Diagnostic` with the line
+        number, the field and the reason is added to the list for every problem.
+        """
+        if cache is not None:
+            with self._open(filepath_or_buffer) as f:
+                return self._read_cached_kof(
+                    f,
+                    cache,
+                    result_srid=result_srid,
+                    file_srid=file_srid,
+                    swap_easting_northing=swap_easting_northing,
+                    validate=validate,
+                    stats=stats,
+                    diagnostics=diagnostics,
+                )
+
+        with self._open(filepath_or_buffer) as f:
+            return self._read_kof(
+                f,
+                result_srid=result_srid,
+                file_srid=file_srid,
+                swap_easting_northing=swap_easting_northing,
+                validate=validate,
+                stats=stats,
+                diagnostics=diagnostics,
+            )
+
+    def parse_indexed(
+        self,
+        filepath_or_buffer: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        cache: Optional[ParseCache] = None,
+    ) -> LocationIndex:
+        """
+        Parse passed kof file like `parse()`, and return the locations in a `LocationIndex`, for bounding box, radius
+        and nearest neighbour queries, and lookups by name.
+        """
+        locations = self.parse(
+            filepath_or_buffer,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+            cache=cache,
+        )
+
+        return LocationIndex(locations)
+
+    def parse_document(
+        self,
+        filepath_or_buffer: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        stats: Optional[ParseStats] = None,
+        diagnostics: Optional[list[Diagnostic]] = None,
+    ) -> KOFDocument:
+        """
+        Parse passed kof file like `parse()`, into a `KOFDocument` that keeps the source bytes of the file, for writing
+        it back with `KOFWriter.write_document()`. Comments and all other lines are kept as they are, and only the
+        changed locations are formatted again. `stats` and `diagnostics` are as for `parse()`, and lines that a
+        lenient parse skips are kept as they are.
+
+        The file is read into memory, and must be in a character set where ASCII characters are single bytes (e.g.
+        ISO-8859-15 or UTF-8).
+        """
+        with self._open(filepath_or_buffer) as f:
+            source = f.read()
+        context = ParseContext(file_srid=file_srid or result_srid, stats=stats, diagnostics=diagnostics)
+        encoding = self._detect_char_set(BytesIO(source), context)
+        if encoding == FALLBACK_CHAR_SET:
+            # The whole file is in memory, so the character set that changed lines are written in can be resolved
+            encoding = "iso-8859-15" if source.isascii() or not _is_utf_8(source) else "utf-8"
+        context.encoding = encoding
+        if not _is_ascii_compatible(encoding):
+            raise ParseError(f"Error parsing KOF file - documents can not be parsed from {encoding} files")
+        if stats is not None:
+            stats.bytes_read += len(source)
+
+        document = KOFDocument(
+            source=source,
+            encoding=encoding,
+            locations=[],
+            line_offsets=self._line_offsets(source),
+            coordinate_lines=array("q"),
+            coordinate_line_locations=array("q"),
+            tema_codes=self.tema_codes,
+        )
+        # Locations are merged in the order their names first appear, so the index of a name is that of its location
+        index_by_name: dict[str, int] = {}
+
+        def iter_lines() -> Iterator[tuple[Location, Optional[int]]]:
+            lines = (source[start:end] for start, end in pairwise(document.line_offsets))
+            for location, source_srid in self._iter_kof_byte_lines(
+                lines,
+                encoding,
+                context,
+                result_srid=result_srid,
+                file_srid=file_srid,
+                swap_easting_northing=swap_easting_northing,
+                validate=validate,
+            ):
+                document.coordinate_lines.append(context.line_count - 1)
+                document.source_srids.append(context.file_srid or 0)
+                document.swapped.append(not context.use_east_north_order_as_default or bool(swap_easting_northing))
+                if (location_index := index_by_name.get(location.name)) is None:
+                    location_index = index_by_name[location.name] = len(index_by_name)
+                document.coordinate_line_locations.append(location_index)
+                yield location, source_srid
+
+        document.original_locations = self._collect_locations(iter_lines(), context, result_srid=result_srid)
+        document.end_srid = context.file_srid or 0
+        document.end_swapped = not context.use_east_north_order_as_default or bool(swap_easting_northing)
+        document.fingerprints = [location_fingerprint(location) for location in document.original_locations]
+        document.locations = list(document.original_locations)
+
+        return document
+
+    @staticmethod
+    def _line_offsets(source: bytes) -> array:
+        """
+        The offsets of the lines of `source`, and its length: line `i` is `source[offsets[i]:offsets[i + 1]]`. Lines
+        end with "\\r\\n", "\\n" or "\\r", as in `bytes.splitlines()`, but the lines are not copied.
+        """
+        offsets = array("q", [0])
+        offsets.extend(match.end() for match in _LINE_ENDING.finditer(source))
+        if offsets[-1] != len(source):
+            offsets.append(len(source))
+
+        return offsets
+
+    def iter_records(self, filepath_or_buffer: Any) -> Iterator[tuple[int, RecordSpec, tuple]]:
+        """
+        Yield the line number, the record spec and the fields of every line of a record type in `RECORD_SPECS`, e.g.
+        the comments (00) and line commands (09) that `parse()` skips. The fields are in the order of
+        `RecordSpec.fields`, and coordinates are as they are in the file, not transformed.
+        """
+        with self._open(filepath_or_buffer) as f:
+            context = ParseContext()
+            for line in self._iter_text_lines(f, context):
+                if (spec := record_spec(line)) is None:
+                    continue
+                try:
+                    fields = spec.split(line.rstrip("\n"))
+                except Exception as e:
+                    raise ParseError(f"Error parsing KOF file on line {context.line_count} - {e}")
+                yield context.line_count, spec, fields
+
+    def iter_parse(
+        self,
+        filepath_or_buffer: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        merge_consecutive: bool = False,
+        batch_size: int = 10_000,
+        validate: bool = True,
+    ) -> Iterator[Location]:
+        """
+        Parse passed kof file lazily, yielding locations while the file is read.
+
+        The coordinate system and axis order are handled as in `parse()`, and a bad line raises the same
+        `ParseError`, when the iteration reaches it.
+
+        By default, one location is yielded per coordinate block (05) line. If `merge_consecutive` is True, consecutive
+        lines with the same name are merged like `parse()` does (methods are appended and the last coordinates win),
+        and the location is yielded when a line with another name is read. A name that appears again later in the file
+        is yielded again.
+
+        Coordinates are transformed in batches of `batch_size` lines. See `parse()` for `validate`.
+        """
+        context = ParseContext(file_srid=file_srid or result_srid)
+        with self._open(filepath_or_buffer) as f:
+            locations = self._iter_transformed_locations(
+                self._iter_kof_lines(
+                    self._iter_text_lines(f, context),
+                    context,
+                    result_srid=result_srid,
+                    file_srid=file_srid,
+                    swap_easting_northing=swap_easting_northing,
+                    validate=validate,
+                ),
+                result_srid=result_srid,
+                batch_size=batch_size,
+            )
+            if merge_consecutive:
+                locations = self._merge_consecutive_locations(locations)
+            yield from locations
+
+    def iter_parse_merged(
+        self,
+        filepath_or_buffer: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        memory_budget: int = 64 * 1024 * 1024,
+        partitions: Optional[int] = None,
+        temporary_directory: Optional[Union[str, PathLike]] = None,
+        batch_size: int = 10_000,
+    ) -> Iterator[Location]:
+        """
+        Parse passed kof file lazily, and yield the same locations as `parse()` returns, in the same order, while
+        holding about `memory_budget` bytes of locations at most. For files with more locations than fit in memory.
+
+        Locations with the same name are merged in memory until the budget is used, and then spilled to temporary
+        files in `temporary_directory` (default: the system's), partitioned by name. Every partition is merged on its
+        own when the file is read, see `ExternalMerge`. The files are removed when the iteration ends. Files with
+        fewer locations than fit in the budget are not written to disk.
+
+        The number of `partitions` is estimated from the size of the file if it is not passed (64 for streams that
+        can not seek). Every partition must fit in the budget when it is merged.
+
+        Coordinates are transformed in batches of `batch_size` lines. See `parse()` for the other parameters.
+        """
+        context = ParseContext(file_srid=file_srid or result_srid)
+        with self._open(filepath_or_buffer) as f:
+            if partitions is None:
+                partitions = 64
+                if self._is_seekable(f):
+                    position = f.tell()
+                    partitions = ExternalMerge.partitions_for(f.seek(0, SEEK_END) - position, memory_budget)
+                    f.seek(position)
+            locations = self._iter_transformed_locations(
+                self._iter_kof_lines(
+                    self._iter_text_lines(f, context),
+                    context,
+                    result_srid=result_srid,
+                    file_srid=file_srid,
+                    swap_easting_northing=swap_easting_northing,
+                    validate=validate,
+                ),
+                result_srid=result_srid,
+                batch_size=batch_size,
+            )
+            yield from ExternalMerge(memory_budget, partitions, temporary_directory).merge(locations)
+
+    async def aparse(
+        self,
+        stream: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        batch_size: int = 10_000,
+    ) -> list[Location]:
+        """
+        Parse a kof file from an async stream, without blocking the event loop.
+
+        The `stream` is either an async iterable of bytes (e.g. `Request.stream()` in Starlette/FastAPI), or has an
+        async `read(size)` method (e.g. `UploadFile`). The stream is decoded while it is read, and every `batch_size`
+        lines are parsed and transformed in the event loop's default executor. See `parse()` for the other parameters.
+        """
+        from asyncio import get_running_loop
+
+        loop = get_running_loop()
+        context = ParseContext(file_srid=file_srid or result_srid)
+        parse_lines = partial(
+            self._parse_text_lines,
+            context=context,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+        )
+        locations_by_name: dict[str, Location] = {}
+        first_line_number = 1
+        async for lines in self._aiter_text_line_batches(stream, context, batch_size):
+            locations = await loop.run_in_executor(None, parse_lines, lines, first_line_number)
+            self._merge_locations(locations, locations_by_name)
+            first_line_number += len(lines)
+
+        return list(locations_by_name.values())
+
+    def parse_columnar(
+        self,
+        filepath_or_buffer: Any,
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+    ) -> LocationColumns:
+        """
+        Parse passed kof file into columns (see `LocationColumns`) instead of a list of locations.
+
+        Locations with the same name are merged like `parse()` does, and the coordinate system and axis order are
+        handled the same way, but no `Location` objects are created or validated. The coordinate columns are
+        contiguous float arrays, ready for e.g. `numpy.frombuffer()`.
+        """
+        names: list[str] = []
+        eastings = array("d")
+        northings = array("d")
+        z_values = array("d")
+        source_srids = array("q")
+        method_rows = array("q")
+        method_values: list[str] = []
+        row_by_name: dict[str, int] = {}
+
+        context = ParseContext(file_srid=file_srid or result_srid)
+        with self._open(filepath_or_buffer) as f:
+            for line_number, line in self._iter_coordinate_lines(
+                self._iter_text_lines(f, context), context, file_srid=file_srid
+            ):
+                try:
+                    name, tema_code, easting, northing, z = self._split_coordinate_line(line)
+                except Exception as e:
+                    raise ParseError(f"Error parsing KOF file on line {line_number} - {e}")
+
+                if not context.use_east_north_order_as_default or swap_easting_northing:
+                    easting, northing = northing, easting
+                source_srid = 0
+                if context.file_srid and result_srid != context.file_srid and easting and northing:
+                    source_srid = context.file_srid
+
+                row = row_by_name.get(name)
+                if row is None:
+                    row = row_by_name[name] = len(names)
+                    names.append(name)
+                    eastings.append(nan if easting is None else easting)
+                    northings.append(nan if northing is None else northing)
+                    z_values.append(nan if z is None else z)
+                    source_srids.append(source_srid)
+                else:
+                    eastings[row] = nan if easting is None else easting
+                    northings[row] = nan if northing is None else northing
+                    z_values[row] = nan if z is None else z
+                    source_srids[row] = source_srid
+
+                if method := self.tema_code_to_method(tema_code):
+                    method_rows.append(row)
+                    method_values.append(method)
+
+        batches: dict[int, CoordinateBatch[int]] = {}
+        for row, source_srid in enumerate(source_srids):
+            if source_srid:
+                if (batch := batches.get(source_srid)) is None:
+                    batch = batches[source_srid] = CoordinateBatch(source_srid, result_srid)
+                batch.add(row, eastings[row], northings[row])
+        for row, easting, northing in self._transform_batches(batches.values()):
+            eastings[row] = easting
+            northings[row] = northing
+
+        return LocationColumns.from_method_rows(
+            names=names,
+            easting=eastings,
+            northing=northings,
+            z=z_values,
+            srid=array("q", [result_srid]) * len(names),
+            method_rows=method_rows,
+            method_values=method_values,
+        )
+
+    def parse_many(
+        self,
+        paths: Iterable[Union[str, PathLike]],
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        workers: Optional[int] = None,
+    ) -> list[Union[list[Location], ParseError]]:
+        """
+        Parse many kof files in parallel, in a pool of `workers` processes (default: one per CPU).
+
+        The results are returned in the same order as `paths`. A file that can not be parsed does not stop the others,
+        its result is the `ParseError` instead. See `parse()` for the other parameters.
+
+        Every file is parsed with a new parser, so no state is carried over from one file to the next. With
+        `workers=1` the files are parsed in this process.
+        """
+        parse_file = partial(
+            _parse_file,
+            charset_sample_size=self.charset_sample_size,
+            tema_codes=self.tema_codes,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+        )
+        paths = list(paths)
+        workers = min(workers or cpu_count() or 1, len(paths))
+        if workers <= 1:
+            return [parse_file(path) for path in paths]
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(parse_file, paths, chunksize=max(1, len(paths) // (4 * workers))))
+
+    def parse_parallel(
+        self,
+        path: Union[str, PathLike],
+        result_srid: int,
+        file_srid: Optional[int] = None,
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        workers: Optional[int] = None,
+        chunk_size: int = 16 * 1024 * 1024,
+    ) -> list[Location]:
         """
+        Parse one large kof file on disk in parallel, in a pool of `workers` processes (default: one per CPU).
+
+        The file is split into byte ranges of about `chunk_size` bytes at line boundaries, and the coordinate block
+        (05) lines of every range are split and validated in a worker. The administrative blocks (01), the axis order,
+        the coordinate transformation and the merging of locations with the same name are then handled in file order
+        in this process, so the result, and the error of a bad line, are the same as from `parse()`.
+
+        Files that can not be split into lines at the byte level (empty files, files with an encoding that is not ASCII
+        compatible, or with carriage return line endings) are parsed as `parse()` does. See `parse()` for the other
+        parameters.
+        """
+        context = ParseContext(file_srid=file_srid or result_srid)
+        with self._open(path) as f:
+            context.encoding = encoding = self._detect_char_set(f, context)
+            ranges = self._split_line_ranges(f, chunk_size) if _is_ascii_compatible(encoding) else []
+        if not ranges:
+            return self.parse(
+                path,
+                result_srid=result_srid,
+                file_srid=file_srid,
+                swap_easting_northing=swap_easting_northing,
+                validate=validate,
+            )
+
+        parse_chunk = partial(
+            _parse_chunk,
+            path,
+            encoding=encoding,
+            result_srid=result_srid,
+            validate=validate,
+            tema_codes=self.tema_codes,
+        )
+        starts, ends = zip(*ranges)
+        workers = min(workers or cpu_count() or 1, len(ranges))
+        if workers <= 1:
+            chunks: Iterable[_ParsedChunk] = map(parse_chunk, starts, ends)
+            return self._collect_chunks(chunks, context, result_srid, file_srid, swap_easting_northing)
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = executor.map(parse_chunk, starts, ends)
+            return self._collect_chunks(chunks, context, result_srid, file_srid, swap_easting_northing)
+
+    @contextmanager
+    def _open(self, filepath_or_buffer: Any) -> Iterator[BytesIO]:
         if self._is_file_like(filepath_or_buffer):
-            f = filepath_or_buffer
-            close_file = False
+            yield filepath_or_buffer
         else:
-            f = open(filepath_or_buffer, "rb")
-            close_file = True
-        try:
-            return self._read_kof(
-                f, result_srid=result_srid, file_srid=file_srid, swap_easting_northing=swap_easting_northing
+            with open(filepath_or_buffer, "rb") as f:
+                yield f  # type: ignore[misc]
+
+    def _read_kof(
+        self,
+        file: BytesIO,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        stats: Optional[ParseStats] = None,
+        diagnostics: Optional[list[Diagnostic]] = None,
+    ) -> list[Location]:
+        context = ParseContext(file_srid=file_srid or result_srid, stats=stats, diagnostics=diagnostics)
+        lines = self._iter_kof_lines(
+            self._iter_text_lines(file, context),
+            context,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+        )
+
+        return self._collect_locations(lines, context, result_srid=result_srid)
+
+    def _collect_locations(
+        self,
+        lines: Iterable[tuple[Location, Optional[int]]],
+        context: ParseContext,
+        result_srid: int,
+        locations_by_name: Optional[dict[str, Location]] = None,
+    ) -> list[Location]:
+        """
+        Transform and merge the (location, source srid) lines of a file. If the context has stats, the stages are
+        timed and counted.
+        """
+        if (stats := context.stats) is None:
+            return self._merge_locations(
+                self._iter_transformed_locations(lines, result_srid=result_srid), locations_by_name
             )
+
+        start = perf_counter()
+        line_count = context.line_count
+        timed_seconds = stats.detect_seconds + stats.transform_seconds
+        try:
+            transformed_locations = list(self._iter_transformed_locations(lines, result_srid=result_srid, stats=stats))
+        except ParseError:
+            stats.errors += 1
+            raise
         finally:
-            if close_file:
-                f.close()
+            elapsed = perf_counter() - start - (stats.detect_seconds + stats.transform_seconds - timed_seconds)
+            if context.sampled_points:
+                scale = context.points / context.sampled_points
+                stats.parse_seconds += context.sampled_parse_seconds * scale
+                stats.construct_seconds += context.sampled_construct_seconds * scale
+                elapsed -= (context.sampled_parse_seconds + context.sampled_construct_seconds) * scale
+            stats.read_seconds += max(elapsed, 0.0)
+            stats.lines += context.line_count - line_count
+            stats.points += context.points
 
-    def _read_kof(
-        self, file: BytesIO, result_srid: int, file_srid: Optional[int], swap_easting_northing: Optional[bool] = False
+        merge_start = perf_counter()
+        locations = self._merge_locations(transformed_locations, locations_by_name)
+        stats.merge_seconds += perf_counter() - merge_start
+        stats.locations += len(locations)
+
+        return locations
+
+    def _read_cached_kof(
+        self,
+        file: BytesIO,
+        cache: ParseCache,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        stats: Optional[ParseStats] = None,
+        diagnostics: Optional[list[Diagnostic]] = None,
+    ) -> list[Location]:
+        """
+        Return the cached locations of the file, parse only the lines appended since it was cached, or parse all of
+        it. The result, and the diagnostics of a lenient parse, are stored in the cache.
+        """
+        if not self._is_seekable(file):
+            file = BytesIO(file.read())
+        start = file.tell()
+        key = parse_cache_key(
+            file.read(CACHE_HEAD_SIZE),
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+            lenient=diagnostics is not None,
+            tema_codes=self.tema_codes.methods,
+        )
+        entry = cache.get(key)
+        file.seek(start)
+        content_hash, size, prefix_hash, ends_with_newline = self._hash_file(file, entry.size if entry else None)
+
+        lenient_diagnostics: Optional[list[Diagnostic]] = [] if diagnostics is not None else None
+        context = ParseContext(file_srid=file_srid or result_srid, stats=stats, diagnostics=lenient_diagnostics)
+        locations_by_name: dict[str, Location] = {}
+        file.seek(start)
+        if entry is not None and prefix_hash == entry.content_hash:
+            if size == entry.size:
+                if stats is not None:
+                    stats.locations += len(entry.locations)
+                if diagnostics is not None:
+                    diagnostics.extend(entry.diagnostics)
+                return copy_locations(entry.locations)
+            # The appended lines are decoded in the cached character set. Detecting it again could name another one
+            # for the same bytes (e.g. Windows-1252 or cp775 for ISO-8859-15), and parse all of the file again.
+            file.seek(start + entry.size)
+            if entry.ends_with_newline and self._decodes(file, entry.encoding):
+                context = ParseContext(
+                    file_srid=entry.file_srid,
+                    use_east_north_order_as_default=entry.use_east_north_order_as_default,
+                    encoding=entry.encoding,
+                    line_count=entry.line_count,
+                    stats=stats,
+                    diagnostics=list(entry.diagnostics) if diagnostics is not None else None,
+                )
+                locations_by_name = {location.name: location for location in copy_locations(entry.locations)}
+                file.seek(start + entry.size)
+            else:
+                file.seek(start)
+
+        lines = self._iter_kof_lines(
+            self._iter_text_lines(file, context),
+            context,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+            first_line_number=context.line_count + 1,
+        )
+        locations = self._collect_locations(
+            lines, context, result_srid=result_srid, locations_by_name=locations_by_name
+        )
+
+        cache.set(
+            key,
+            CachedParse(
+                content_hash=content_hash,
+                size=size,
+                line_count=context.line_count,
+                ends_with_newline=ends_with_newline,
+                encoding=context.encoding or "",
+                file_srid=context.file_srid,
+                use_east_north_order_as_default=context.use_east_north_order_as_default,
+                locations=copy_locations(locations),
+                diagnostics=list(context.diagnostics or []),
+            ),
+        )
+        if diagnostics is not None and context.diagnostics:
+            diagnostics.extend(context.diagnostics)
+
+        return locations
+
+    @staticmethod
+    def _hash_file(file: BytesIO, prefix_size: Optional[int]) -> tuple[str, int, Optional[str], bool]:
+        """
+        Read the file from the current position to the end, and return the SHA-256 hex digest and size of its content,
+        the hex digest of the first `prefix_size` bytes (None if the file is shorter), and whether it ends with "\n".
+        """
+        content_hash = sha256()
+        prefix_hash = None
+        size = 0
+        last_chunk = b""
+        while chunk := file.read(1024 * 1024):
+            if prefix_size is not None and size <= prefix_size <= size + len(chunk):
+                prefix = content_hash.copy()
+                prefix.update(chunk[: prefix_size - size])
+                prefix_hash = prefix.hexdigest()
+            content_hash.update(chunk)
+            size += len(chunk)
+            last_chunk = chunk
+        if prefix_size == size == 0:
+            prefix_hash = content_hash.hexdigest()
+
+        return content_hash.hexdigest(), size, prefix_hash, last_chunk.endswith(b"\n")
+
+    @staticmethod
+    def _decodes(file: BytesIO, encoding: str) -> bool:
+        """
+        Read the file from the current position to the end, and check that its content decodes in the `encoding`
+        character set
+        """
+        try:
+            decoder = getincrementaldecoder(encoding)()
+            while chunk := file.read(1024 * 1024):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except (LookupError, UnicodeDecodeError):
+            return False
+
+        return True
+
+    @staticmethod
+    def _count_lines(lines: Iterable[str], context: ParseContext) -> Iterator[str]:
+        """
+        Yield the lines, counting them in `context.line_count`
+        """
+        for context.line_count, line in enumerate(lines, start=context.line_count + 1):
+            yield line
+
+    def _iter_kof_byte_lines(
+        self,
+        lines: Iterable[bytes],
+        encoding: str,
+        context: ParseContext,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+    ) -> Iterator[tuple[Location, Optional[int]]]:
+        """
+        Yield the location of every coordinate block (05) line of the byte lines of a file (e.g. a file read into
+        memory) in the `encoding` character set, like `_iter_kof_lines()`.
+
+        Coordinate lines of printable ASCII characters are split as bytes, and only their fields are decoded. Other
+        coordinate lines (e.g. with tabs or non-ASCII names) and administrative lines are decoded and split as text.
+        """
+        split_line = partial(self._split_coordinate_byte_line, encoding=encoding)
+        for context.line_count, line in enumerate(lines, start=1):
+            try:
+                if line.startswith(b" 05 "):
+                    location = self._map_line(split_line, line, result_srid, validate, context)
+                elif line.startswith(b" 01 "):
+                    self.map_line_to_administrative_block(self._decode_line(line, encoding), file_srid, context)
+                    continue
+                else:
+                    continue
+            except Exception as e:
+                if context.diagnostics is None:
+                    raise ParseError(f"Error parsing KOF file on line {context.line_count} - {e}")
+                text = self._decode_line(line, encoding, errors="replace")
+                if not line.startswith(b" 05 "):
+                    self._map_bad_administrative_line(text, context.line_count, file_srid, context)
+                    continue
+                repaired = self._map_bad_coordinate_line(text, context.line_count, result_srid, validate, context)
+                if repaired is None:
+                    continue
+                location = repaired
+
+            try:
+                source_srid = self._orient_location(location, context, result_srid, swap_easting_northing)
+            except Exception as e:
+                raise ParseError(f"Error parsing KOF file on line {context.line_count} - {e}")
+
+            yield location, source_srid
+
+    @staticmethod
+    def _split_line_ranges(file: BytesIO, chunk_size: int) -> list[tuple[int, int]]:
+        """
+        Split a file into (start, end) byte ranges of about `chunk_size` bytes that end at a line ending. Return an
+        empty list if the file is empty, or has carriage return line endings.
+        """
+        if not fstat(file.fileno()).st_size:
+            return []
+
+        with mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+            if _LONE_CARRIAGE_RETURN.search(data):
+                return []
+            ranges = []
+            start = 0
+            while start < len(data):
+                end = data.find(b"\n", start + max(chunk_size, 1) - 1) + 1 or len(data)
+                ranges.append((start, end))
+                start = end
+
+        return ranges
+
+    def _collect_chunks(
+        self,
+        chunks: Iterable[_ParsedChunk],
+        context: ParseContext,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool],
+    ) -> list[Location]:
+        """
+        Replay the parsed chunks of a file in file order: update the context with the administrative blocks (01),
+        orient the coordinates, and transform and merge the locations.
+        """
+
+        def iter_lines() -> Iterator[tuple[Location, Optional[int]]]:
+            for chunk in chunks:
+                start = 0
+                for end, line_number, line in [*chunk.administrative_lines, (len(chunk.records), 0, "")]:
+                    for name, methods, easting, northing, z in islice(chunk.records, start, end):
+                        location = construct_location(name, methods, easting, northing, z, result_srid)
+                        yield location, self._orient_location(location, context, result_srid, swap_easting_northing)
+                    start = end
+                    if line:
+                        try:
+                            self.map_line_to_administrative_block(line, file_srid, context)
+                        except Exception as e:
+                            raise ParseError(f"Error parsing KOF file on line {context.line_count + line_number} - {e}")
+                if chunk.error is not None:
+                    line_number, message = chunk.error
+                    raise ParseError(f"Error parsing KOF file on line {context.line_count + line_number} - {message}")
+                context.line_count += chunk.line_count
+
+        return self._collect_locations(iter_lines(), context, result_srid=result_srid)
+
+    def _split_coordinate_byte_line(
+        self, line: bytes, encoding: str
+    ) -> tuple[str, str, Optional[float], Optional[float], Optional[float]]:
+        """
+        Split a coordinate block (05) line of a file as bytes, or decoded as text if it must be
+        """
+        if not _NOT_PRINTABLE_ASCII.search(line):
+            try:
+                return self._split_coordinate_bytes(line)
+            except ValueError:
+                pass
+
+        return self._split_coordinate_line(self._decode_line(line, encoding))
+
+    def _map_line(
+        self,
+        split_line: Callable[[_L], tuple[str, str, Optional[float], Optional[float], Optional[float]]],
+        line: _L,
+        result_srid: int,
+        validate: bool,
+        context: ParseContext,
+    ) -> Location:
+        """
+        Split a coordinate block (05) line with `split_line` and create its location. If the context has stats, the
+        points are counted and a sample of them is timed.
+        """
+        if context.stats is not None:
+            context.points += 1
+            if context.points % _STATS_SAMPLE_INTERVAL == 1:
+                start = perf_counter()
+                fields = split_line(line)
+                split_end = perf_counter()
+                location = self._create_coordinate_location(*fields, result_srid, validate)
+                context.sampled_parse_seconds += split_end - start
+                context.sampled_construct_seconds += perf_counter() - split_end
+                context.sampled_points += 1
+                return location
+
+        return self._create_coordinate_location(*split_line(line), result_srid, validate)
+
+    # Split a coordinate block (05) line of printable ASCII bytes into its fields, like `_split_coordinate_line()`
+    _split_coordinate_bytes: Callable[[bytes], tuple[str, str, Optional[float], Optional[float], Optional[float]]] = (
+        staticmethod(COORDINATE_RECORD.split_bytes)
+    )
+
+    @staticmethod
+    def _decode_line(line: bytes, encoding: str, errors: str = "strict") -> str:
+        """
+        Decode a line, with its line ending translated to "\n" as `TextIOWrapper` does
+        """
+        text = line.decode(encoding, errors)
+        if text.endswith("\r\n"):
+            return text[:-2] + "\n"
+
+        return text
+
+    def _iter_kof_lines(
+        self,
+        lines: Iterable[str],
+        context: ParseContext,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool] = False,
+        validate: bool = True,
+        first_line_number: int = 1,
+    ) -> Iterator[tuple[Location, Optional[int]]]:
+        """
+        Yield the location of every coordinate block (05) line, together with the srid its coordinates must be
+        transformed from, or None if no transformation is needed.
+        """
+        stats = context.stats
+        for line_number, line in self._iter_coordinate_lines(
+            lines, context, file_srid=file_srid, first_line_number=first_line_number
+        ):
+            try:
+                if stats is None:
+                    location = self.map_line_to_coordinate_block(line, result_srid, validate=validate)
+                else:
+                    location = self._map_line(self._split_coordinate_line, line, result_srid, validate, context)
+            except Exception as e:
+                if context.diagnostics is None:
+                    raise ParseError(f"Error parsing KOF file on line {line_number} - {e}")
+                repaired = self._map_bad_coordinate_line(line, line_number, result_srid, validate, context)
+                if repaired is None:
+                    continue
+                location = repaired
+
+            try:
+                source_srid = self._orient_location(location, context, result_srid, swap_easting_northing)
+            except Exception as e:
+                raise ParseError(f"Error parsing KOF file on line {line_number} - {e}")
+
+            yield location, source_srid
+
+    def _map_bad_coordinate_line(
+        self, line: str, line_number: int, result_srid: int, validate: bool, context: ParseContext
+    ) -> Optional[Location]:
+        """
+        Repair a coordinate block (05) line that failed to parse in a lenient parse, or skip it. A diagnostic is added
+        to the context for every problem. Return the location, or None if the line is skipped.
+
+        Tabs are expanded to spaces. If the fields are still not in their columns, they are split on whitespace
+        instead, see `_split_coordinate_words()`. Only bad lines get here, so the line is simply parsed again.
+        """
+        diagnostics = context.diagnostics if context.diagnostics is not None else []
+        has_tabs = "\t" in line
+        if has_tabs:
+            line = line.expandtabs()
+
+        problems: list[Diagnostic] = []
+        repair = "Tabs expanded to spaces"
+        fields = None
+        try:
+            fields = self._split_coordinate_line(line)
+        except Exception as e:
+            if has_tabs and (fields := self._split_coordinate_words(line)) is not None:
+                repair = "Tabs expanded to spaces, and fields split on whitespace"
+            else:
+                for field in ["easting", "northing", "z"]:
+                    start, end = _COORDINATE_COLUMNS[field]
+                    text = line[start:end].strip()
+                    try:
+                        float(text or 0)
+                    except ValueError:
+                        problems.append(Diagnostic(line_number, field, f"Invalid number {text!r}"))
+                if not problems:
+                    problems.append(Diagnostic(line_number, None, str(e)))
+
+        location = None
+        if fields is not None:
+            try:
+                location = self._create_coordinate_location(*fields, result_srid, validate)
+            except ValidationError as e:
+                for error in e.errors():
+                    location_field = str(error["loc"][0]) if error["loc"] else None
+                    field_name = _COORDINATE_FIELD_BY_LOCATION_FIELD.get(location_field or "", location_field)
+                    problems.append(Diagnostic(line_number, field_name, error["msg"]))
+
+        if has_tabs:
+            diagnostics.append(Diagnostic(line_number, None, repair, repaired=location is not None))
+        diagnostics.extend(problems)
+
+        return location
+
+    @staticmethod
+    def _split_coordinate_words(
+        line: str,
+    ) -> Optional[tuple[str, str, Optional[float], Optional[float], Optional[float]]]:
+        """
+        Split a coordinate block (05) line with its fields out of their columns into words: the last two or three
+        numbers are the easting, northing and z, and the one or two words before them the name and tema code.
+        Return None if the line does not look like that.
+        """
+        words = line.split()[1:]
+        coordinates: list[Optional[float]] = []
+        while len(words) > 1 and len(coordinates) < 3:
+            try:
+                coordinates.insert(0, float(words[-1]))
+            except ValueError:
+                break
+            words.pop()
+        if len(coordinates) < 2 or len(words) > 2:
+            return None
+
+        name, tema_code = (words + [""])[:2]
+        easting, northing, z = (coordinates + [None])[:3]
+        return name, tema_code, easting, northing, z
+
+    @staticmethod
+    def _orient_location(
+        location: Location, context: ParseContext, result_srid: int, swap_easting_northing: Optional[bool]
+    ) -> Optional[int]:
+        """
+        Swap the easting and northing of the location if the file's axis order requires it, and return the srid its
+        coordinates must be transformed from, or None if no transformation is needed.
+        """
+        if not context.use_east_north_order_as_default or swap_easting_northing:
+            location.point_easting, location.point_northing = (
+                location.point_northing,
+                location.point_easting,
+            )
+
+        if context.file_srid and result_srid != context.file_srid:
+            if location.point_easting and location.point_northing:
+                return context.file_srid
+
+        return None
+
+    def _parse_text_lines(
+        self,
+        lines: list[str],
+        first_line_number: int,
+        context: ParseContext,
+        result_srid: int,
+        file_srid: Optional[int],
+        swap_easting_northing: Optional[bool],
+        validate: bool,
     ) -> list[Location]:
-        resolved_locations: list[Location] = []
-        if file_srid:
-            self.file_srid = file_srid
+        """
+        Parse and transform a batch of lines, e.g. in an executor for `aparse()`
+        """
+        kof_lines = self._iter_kof_lines(
+            lines,
+            context,
+            result_srid=result_srid,
+            file_srid=file_srid,
+            swap_easting_northing=swap_easting_northing,
+            validate=validate,
+            first_line_number=first_line_number,
+        )
+
+        return list(self._iter_transformed_locations(kof_lines, result_srid=result_srid))
+
+    async def _aiter_text_line_batches(
+        self, stream: Any, context: ParseContext, batch_size: int
+    ) -> AsyncIterator[list[str]]:
+        """
+        Detect the character set of the async stream and yield its decoded lines, `batch_size` lines at the time.
+
+        Line endings are translated to "\\n" as `TextIOWrapper` does. The character set is detected in the event
+        loop's default executor, since `charset-normalizer` may take long for a large sample.
+        """
+        from asyncio import get_running_loop
+
+        chunks = _aiter_bytes(stream)
+        head = b""
+        at_end = False
+        while self.charset_sample_size is None or len(head) < self.charset_sample_size:
+            if (chunk := await anext(chunks, None)) is None:
+                at_end = True
+                break
+            head += chunk
+        context.encoding = await get_running_loop().run_in_executor(
+            None, partial(self._detect_char_set_from_sample, head, head_only=not at_end)
+        )
+
+        decoder = IncrementalNewlineDecoder(getincrementaldecoder(context.encoding)(), translate=True)
+        lines: list[str] = []
+        partial_line = ""
+        data = head
+        line_count = 0
+        while True:
+            try:
+                text = decoder.decode(data, final=at_end)
+            except UnicodeDecodeError as e:
+                raise ParseError(f"Error parsing KOF file on line {line_count + len(lines) + 1} - {e}") from e
+            if text:
+                *complete_lines, partial_line = (partial_line + text).split("\n")
+                lines.extend(line + "\n" for line in complete_lines)
+            if at_end:
+                break
+            if len(lines) >= batch_size:
+                yield lines
+                line_count += len(lines)
+                lines = []
+            if (chunk := await anext(chunks, None)) is None:
+                at_end = True
+                data = b""
+            else:
+                data = chunk
+
+        if partial_line:
+            lines.append(partial_line)
+        if lines:
+            yield lines
+
+    def _iter_text_lines(self, file: BytesIO, context: ParseContext) -> Iterator[str]:
+        """
+        Detect the character set of the file, unless it is already known in the context, and yield its decoded lines.
+        The lines are counted in the context.
+        """
+        replay_stream = None
+        if context.encoding is not None:
+            pass
+        elif self._is_seekable(file):
+            context.encoding = self._detect_char_set(file, context)
         else:
-            self.file_srid = result_srid
+            start = perf_counter()
+            head = self._read_sample(file, self.charset_sample_size)
+            context.encoding = self._detect_char_set_from_sample(head, head_only=True)
+            if context.stats is not None:
+                context.stats.detect_seconds += perf_counter() - start
+            replay_stream = _ReplayStream(head, file)
+            file = BufferedReader(replay_stream)  # type: ignore[assignment]
+
+        position = file.tell() if context.stats is not None and replay_stream is None else 0
+        with TextIOWrapper(file, encoding=context.encoding) as wrapper:
+            try:
+                yield from self._count_lines(wrapper, context)
+            except UnicodeDecodeError as e:
+                raise ParseError(f"Error parsing KOF file on line {context.line_count + 1} - {e}") from e
+            if context.stats is not None:
+                context.stats.bytes_read += (
+                    replay_stream.bytes_read if replay_stream is not None else file.tell() - position
+                )
 
-        self.encoding = self.detect_char_set_from_file(file)
-        with TextIOWrapper(file, encoding=self.encoding) as wrapper:
-            for line_number, line in enumerate(wrapper, start=1):
+    def _detect_char_set(self, file: BytesIO, context: ParseContext) -> str:
+        """
+        Detect the character set of a seekable file, timing it if the context has stats
+        """
+        start = perf_counter()
+        encoding = self.detect_char_set_from_file(file)
+        if context.stats is not None:
+            context.stats.detect_seconds += perf_counter() - start
+
+        return encoding
+
+    def _iter_coordinate_lines(
+        self, lines: Iterable[str], context: ParseContext, file_srid: Optional[int], first_line_number: int = 1
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yield the line number and the line of every coordinate block (05) line.
+
+        Administrative block (01) lines update the file srid and the axis order in the `context` as they are read.
+        """
+        for line_number, line in enumerate(lines, start=first_line_number):
+            if line.startswith(" 05 "):
+                yield line_number, line
+            elif line.startswith(" 01 "):
                 try:
-                    if line.startswith(" 01 "):
-                        self.map_line_to_administrative_block(line, file_srid)
-
-                    elif line.startswith(" 05 "):
-                        location = self.map_line_to_coordinate_block(line, result_srid)
-
-                        if not self.use_east_north_order_as_default or swap_easting_northing:
-                            location.point_easting, location.point_northing = (
-                                location.point_northing,
-                                location.point_easting,
-                            )
-
-                        if self.file_srid and result_srid != self.file_srid:
-                            if location.point_easting and location.point_northing:
-                                location.point_easting, location.point_northing = projector.transform(
-                                    self.file_srid, result_srid, location.point_easting, location.point_northing
-                                )
-
-                        if len(resolved_locations) > 0:
-                            existing_locations = list(
-                                filter(lambda existing: location.name == existing.name, resolved_locations)
-                            )
-                            if len(existing_locations) > 0:
-                                existing_location = next(
-                                    existing_location
-                                    for existing_location in existing_locations
-                                    if existing_location.name == location.name
-                                )
-                                if existing_location is not None:
-                                    if existing_location.methods is None:
-                                        existing_location.methods = []
-                                    existing_location.methods += (
-                                        location.methods if location.methods is not None else []
-                                    )
-                                    existing_location.point_easting = location.point_easting
-                                    existing_location.point_northing = location.point_northing
-                                    existing_location.point_z = location.point_z
-                            else:
-                                resolved_locations.append(location)
-                        else:
-                            resolved_locations.append(location)
+                    self.map_line_to_administrative_block(line, file_srid, context)
                 except Exception as e:
-                    raise ParseError(f"Error parsing KOF file on line {line_number} - {e}")
+                    if context.diagnostics is None:
+                        raise ParseError(f"Error parsing KOF file on line {line_number} - {e}")
+                    self._map_bad_administrative_line(line, line_number, file_srid, context)
+
+    def _map_bad_administrative_line(
+        self, line: str, line_number: int, file_srid: Optional[int], context: ParseContext
+    ) -> None:
+        """
+        Repair an administrative block (01) line that failed to parse in a lenient parse, or skip it (keeping the
+        coordinate system and axis order as they were). A diagnostic is added to the context for every problem.
+        """
+        diagnostics = context.diagnostics if context.diagnostics is not None else []
+        has_tabs = "\t" in line
+        if has_tabs:
+            line = line.expandtabs()
+
+        problem = None
+        try:
+            self.map_line_to_administrative_block(line, file_srid, context)
+        except Exception as e:
+            _, _, _, coordinate_system, _, _, _ = ADMINISTRATIVE_RECORD.split(line)
+            field = "coordinate_system" if coordinate_system else None
+            problem = Diagnostic(
+                line_number, field, f"Invalid coordinate system {coordinate_system!r}" if field else str(e)
+            )
+
+        if has_tabs:
+            diagnostics.append(Diagnostic(line_number, None, "Tabs expanded to spaces", repaired=problem is None))
+        if problem is not None:
+            diagnostics.append(problem)
+
+    def _iter_transformed_locations(
+        self,
+        lines: Iterable[tuple[Location, Optional[int]]],
+        result_srid: int,
+        batch_size: Optional[int] = None,
+        stats: Optional[ParseStats] = None,
+    ) -> Iterator[Location]:
+        """
+        Transform the coordinates of the passed (location, source srid) lines and yield the locations.
+
+        Coordinates are transformed in one batch per source srid for every `batch_size` lines, or for all lines if
+        `batch_size` is None.
+        """
+        locations: list[Location] = []
+        batches: dict[int, CoordinateBatch[Location]] = {}
+        for location, source_srid in lines:
+            if source_srid:
+                if (batch := batches.get(source_srid)) is None:
+                    batch = batches[source_srid] = CoordinateBatch(source_srid, result_srid)
+                batch.add(location, location.point_easting or 0, location.point_northing or 0)
+            locations.append(location)
+
+            if batch_size and len(locations) >= batch_size:
+                self._transform_locations(batches.values(), stats)
+                yield from locations
+                locations = []
+                batches = {}
+
+        self._transform_locations(batches.values(), stats)
+        yield from locations
+
+    @classmethod
+    def _transform_locations(
+        cls, batches: Iterable[CoordinateBatch[Location]], stats: Optional[ParseStats] = None
+    ) -> None:
+        start = perf_counter()
+        for location, easting, northing in cls._transform_batches(batches):
+            location.point_easting = easting
+            location.point_northing = northing
+        if stats is not None:
+            stats.transform_seconds += perf_counter() - start
 
-        return resolved_locations
+    @staticmethod
+    def _transform_batches(batches: Iterable[CoordinateBatch[_T]]) -> Iterator[tuple[_T, float, float]]:
+        for batch in batches:
+            try:
+                transformed = batch.transform()
+            except Exception as e:
+                raise ParseError(
+                    f"Error transforming coordinates from SRID {batch.from_srid} to SRID {batch.to_srid} - {e}"
+                )
+            yield from transformed
+
+    @classmethod
+    def _merge_locations(
+        cls, locations: Iterable[Location], locations_by_name: Optional[dict[str, Location]] = None
+    ) -> list[Location]:
+        """
+        Merge locations with the same name. Methods are appended and the last coordinates win.
+
+        Pass `locations_by_name` to merge into locations that are already merged.
+        """
+        if locations_by_name is None:
+            locations_by_name = {}
+        for location in locations:
+            existing_location = locations_by_name.get(location.name)
+            if existing_location is None:
+                locations_by_name[location.name] = location
+            else:
+                cls._merge_location(existing_location, location)
+
+        return list(locations_by_name.values())
+
+    @classmethod
+    def _merge_consecutive_locations(cls, locations: Iterable[Location]) -> Iterator[Location]:
+        current_location: Optional[Location] = None
+        for location in locations:
+            if current_location is not None and current_location.name == location.name:
+                cls._merge_location(current_location, location)
+                continue
+            if current_location is not None:
+                yield current_location
+            current_location = location
+
+        if current_location is not None:
+            yield current_location
+
+    _merge_location = staticmethod(merge_location)
 
     def detect_char_set_from_file(
         self, file: BytesIO, default_char_set: str = "iso-8859-15", confidence: float = 0.70
     ) -> str:
-        sample = file.read()
-        detection = detect(sample)
+        """
+        Detect the character set of a seekable file. The file is rewound to where it was before reading the sample.
+
+        Only a sample of the file is read, see `charset_sample_size`.
+        """
+        start = file.tell()
+        head = self._read_sample(file, self.charset_sample_size)
+        tail = b""
+        if self.charset_sample_size is not None and len(head) == self.charset_sample_size:
+            tail_size = self.charset_sample_size // 4
+            file.seek(max(file.seek(0, SEEK_END) - tail_size, start + len(head)))
+            tail = file.read()
+        file.seek(start)
+
+        return self._detect_char_set_from_sample(head, tail, default_char_set=default_char_set, confidence=confidence)
+
+    @staticmethod
+    def _detect_char_set_from_sample(
+        head: bytes,
+        tail: bytes = b"",
+        head_only: bool = False,
+        default_char_set: str = "iso-8859-15",
+        confidence: float = 0.70,
+    ) -> str:
+        """
+        Detect the character set from the first bytes (`head`) and the last bytes (`tail`) of a file.
+
+        Set `head_only` if `head` may have been cut off in the middle of the file and there is no tail.
+
+        If only part of the file was sampled and it is ASCII or UTF-8, the rest of the file may still have other
+        characters, so `FALLBACK_CHAR_SET` is returned.
+        """
+        sampled_all = not tail and not head_only
+        if head.isascii() and tail.isascii():
+            # Since iso-8859-15 is a superset of ascii, just return that, even if ascii was detected
+            return "iso-8859-15" if sampled_all else FALLBACK_CHAR_SET
+        if _is_utf_8(head, final=sampled_all) and _is_utf_8(tail[:3].lstrip(_UTF_8_CONTINUATION_BYTES) + tail[3:]):
+            return "utf-8" if sampled_all else FALLBACK_CHAR_SET
+
+        from charset_normalizer import detect
+
+        detection = detect(head + tail)
         detected_confidence = detection.get("confidence", 0.0)
         if not isinstance(detected_confidence, float) or detected_confidence < confidence:
             encoding = default_char_set
         else:
             encoding = detection["encoding"] if isinstance(detection["encoding"], str) else default_char_set
-        file.seek(0)
         if encoding == "ASCII":
-            # Since iso-8859-15 is a superset of ascii, just return that, even if ascii was detected
             return "iso-8859-15"
 
         return encoding
 
+    @staticmethod
+    def _read_sample(file: Any, size: Optional[int]) -> bytes:
+        """
+        Read `size` bytes, or until the end of the file if `size` is None. Streams may return fewer bytes per read.
+        """
+        if size is None:
+            return file.read()
+
+        chunks = []
+        remaining = size
+        while remaining > 0 and (chunk := file.read(remaining)):
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return b"".join(chunks)
+
+    @staticmethod
+    def _is_seekable(file: Any) -> bool:
+        seekable = getattr(file, "seekable", None)
+        return bool(seekable and seekable())
+
     @staticmethod
     def _is_file_like(obj) -> bool:
         """Check if object is file like
@@ -237,3 +1643,75 @@ class KOFParser(Kof):
             return False
 
         return True
+
+
+def _parse_file(
+    path: Union[str, PathLike],
+    charset_sample_size: Optional[int],
+    tema_codes: TemaCodes,
+    result_srid: int,
+    file_srid: Optional[int],
+    swap_easting_northing: Optional[bool],
+) -> Union[list[Location], ParseError]:
+    """
+    Parse one file for `KOFParser.parse_many()`. Runs in a worker process, where coordinate transformers are created
+    on first use and reused for the files it parses, see `transformer_cache`.
+    """
+    try:
+        return KOFParser(charset_sample_size=charset_sample_size, tema_codes=tema_codes).parse(
+            path, result_srid=result_srid, file_srid=file_srid, swap_easting_northing=swap_easting_northing
+        )
+    except Exception as e:
+        return ParseError(f"Error parsing KOF file {path} - {e}")
+
+
+def _parse_chunk(
+    path: Union[str, PathLike],
+    start: int,
+    end: int,
+    encoding: str,
+    result_srid: int,
+    validate: bool,
+    tema_codes: TemaCodes,
+) -> _ParsedChunk:
+    """
+    Parse the lines in the byte range [start, end) of a file for `KOFParser.parse_parallel()`. Runs in a worker
+    process.
+    """
+    parser = KOFParser(tema_codes=tema_codes)
+    chunk = _ParsedChunk()
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    for chunk.line_count, line in enumerate(data.splitlines(keepends=True), start=1):
+        try:
+            if line.startswith(b" 05 "):
+                location = parser._create_coordinate_location(
+                    *parser._split_coordinate_byte_line(line, encoding), result_srid, validate
+                )
+                chunk.records.append(
+                    (location.name, location.methods, location.point_easting, location.point_northing, location.point_z)
+                )
+            elif line.startswith(b" 01 "):
+                chunk.administrative_lines.append(
+                    (len(chunk.records), chunk.line_count, parser._decode_line(line, encoding))
+                )
+        except Exception as e:
+            chunk.error = (chunk.line_count, str(e))
+            break
+
+    return chunk
+
+
+async def _aiter_bytes(stream: Any, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    Yield the bytes of an async iterable of bytes, or of an object with an async `read(size)` method
+    """
+    if hasattr(stream, "__aiter__"):
+        async for chunk in stream:
+            if chunk:
+                yield bytes(chunk)
+    else:
+        while chunk := await stream.read(chunk_size):
+            yield bytes(chunk)
@@ -0,0 +1,75 @@
+"""
+Timings and counters of parsing and writing kof files, see the `stats` parameter of `KOFParser.parse()` and
+`KOFWriter.writeKOF()`.
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass
+class ParseStats:
+    """
+    Where the time of parsing kof files goes, and how much was parsed.
+
+    Pass the same object to many parses to add them up. The stages are:
+
+    - `detect_seconds`: detecting the character set
+    - `read_seconds`: reading and decoding the lines, and handling the lines that are not coordinate blocks (05)
+    - `parse_seconds`: splitting the coordinate blocks (05) into fields
+    - `construct_seconds`: creating the locations
+    - `transform_seconds`: transforming the coordinates to the result coordinate system
+    - `merge_seconds`: merging locations with the same name
+
+    The counters are the lines and bytes read (bytes only for files read to the end), the coordinate block (05) lines
+    (`points`), the merged `locations` and the parses that failed (`errors`). To keep the overhead low, the parse and
+    construct times are measured for a sample of the points and scaled up.
+    """
+
+    detect_seconds: float = 0.0
+    read_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    construct_seconds: float = 0.0
+    transform_seconds: float = 0.0
+    merge_seconds: float = 0.0
+    lines: int = 0
+    bytes_read: int = 0
+    points: int = 0
+    locations: int = 0
+    errors: int = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return (
+            self.detect_seconds
+            + self.read_seconds
+            + self.parse_seconds
+            + self.construct_seconds
+            + self.transform_seconds
+            + self.merge_seconds
+        )
+
+
+@dataclass
+class WriteStats:
+    """
+    Where the time of writing kof files goes, and how much was written.
+
+    Pass the same object to many writes to add them up. The stages are:
+
+    - `transform_seconds`: transforming the coordinates to the file's coordinate system
+    - `format_seconds`: formatting the header, administrative block and coordinate block (05) lines
+    - `write_seconds`: encoding and writing to the stream
+
+    The counters are the `locations` and `lines` written, and the `bytes_written` (characters for text streams).
+    """
+
+    transform_seconds: float = 0.0
+    format_seconds: float = 0.0
+    write_seconds: float = 0.0
+    locations: int = 0
+    lines: int = 0
+    bytes_written: int = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.transform_seconds + self.format_seconds + self.write_seconds
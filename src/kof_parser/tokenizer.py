@@ -0,0 +1,200 @@
+"""
+Fixed-width tokenizer for the records (lines) of a kof file, driven by declarative column specs.
+"""
+
+from dataclasses import dataclass
+from functools import partial
+from operator import call, itemgetter
+from struct import Struct
+from typing import Any, Callable, Optional, Sequence, Union
+
+from kof_parser.exceptions import ParseError
+
+TAB_ERROR = "KOF file contains tabs, please convert to spaces."
+
+# The kinds of column, and how their text is converted:
+# "text" is stripped, "number" is a float (None if blank) and "raw" is kept as it is
+COLUMN_KINDS = ("text", "number", "raw")
+
+
+@dataclass(frozen=True)
+class Column:
+    """
+    A field of a record, in the columns `start` to `end` (as a slice, from 0). `end` is None for the rest of the line,
+    which only the last column may be.
+    """
+
+    name: str
+    start: int
+    end: Optional[int]
+    kind: str = "text"
+
+
+class RecordSpec:
+    """
+    The columns of a kof record type, e.g. the coordinate block (05), with functions that extract all fields of a line
+    in one pass and convert them to a tuple in the order of the columns.
+
+    `split()` splits text lines. Every field is sliced in one `operator.itemgetter` call, and a line with a tab (which
+    moves the fields out of their columns) raises a ParseError. `split_bytes()` splits lines of printable ASCII bytes
+    (e.g. of a file read into memory) with one `struct.Struct` unpack, and decodes the text fields.
+
+    The converters of the fields are looked up by kind when the spec is created, and applied to the fields of a line
+    with one `map()` call, so they are not looked up for every line.
+    """
+
+    def __init__(self, record_type: str, columns: Sequence[Column], separator: str = " "):
+        self.record_type = record_type
+        # The start of the lines of the record type, e.g. " 05 ", with the `separator` after the record type
+        self.prefix = f" {record_type}{separator}"
+        self.columns = tuple(columns)
+        self.fields = tuple(column.name for column in self.columns)
+        self._check_columns()
+        # The length of the columns, that the bytes of a line are padded to if they are unpacked as a struct
+        self.size = self.columns[-1].end
+
+        getter = itemgetter(*(slice(column.start, column.end) for column in self.columns))
+        self.split: Callable[[str], tuple] = self._create_split(getter, text=True)
+        if self.size is None:
+            self.split_bytes: Callable[[bytes], tuple] = self._create_split(getter, text=False)
+        else:
+            self.split_bytes = self._create_split(Struct(self._struct_format()).unpack_from, text=False, padded=True)
+
+    def __repr__(self) -> str:
+        return f"RecordSpec({self.record_type!r}, {list(self.fields)})"
+
+    def column(self, name: str) -> Column:
+        return self.columns[self.fields.index(name)]
+
+    def _check_columns(self) -> None:
+        end = 0
+        for index, column in enumerate(self.columns):
+            if column.kind not in COLUMN_KINDS:
+                raise ValueError(f"Unknown kind {column.kind!r} of column {column.name}")
+            if column.start < end or (column.end is not None and column.end <= column.start):
+                raise ValueError(f"Column {column.name} overlaps the column before it, or is empty")
+            if column.end is None and index != len(self.columns) - 1:
+                raise ValueError(f"Only the last column may run to the end of the line, not {column.name}")
+            end = column.end or column.start
+
+    def _struct_format(self) -> str:
+        """
+        The struct format of the columns, with pad bytes between them, e.g. "4x11s9s" for columns 4-15 and 15-24
+        """
+        parts = []
+        position = 0
+        for column in self.columns:
+            if column.start > position:
+                parts.append(f"{column.start - position}x")
+            parts.append(f"{column.end - column.start}s")  # type: ignore[operator]
+            position = column.end  # type: ignore[assignment]
+
+        return "".join(parts)
+
+    def _create_split(self, extract: Callable[[Any], Any], text: bool, padded: bool = False) -> Callable[[Any], tuple]:
+        """
+        Create the function that extracts the fields of a line with `extract` and converts them. If `padded`, lines
+        shorter than the columns are padded with spaces first.
+        """
+        converters = tuple(_CONVERTERS[column.kind][0 if text else 1] for column in self.columns)
+        # Numbers are converted with float() first, which is faster, and blank numbers raise a ValueError
+        fast_converters = tuple(
+            float if column.kind == "number" else converter for column, converter in zip(self.columns, converters)
+        )
+        if len(self.columns) == 1 and not padded:
+            # A struct always unpacks a tuple, but itemgetter returns the value itself for a single column
+            extract = partial(_extract_one, extract)
+        size = self.size
+
+        def split_text(line: str) -> tuple:
+            if "\t" in line:
+                raise ParseError(TAB_ERROR)
+            fields = extract(line)
+            try:
+                return tuple(map(call, fast_converters, fields))
+            except ValueError:
+                return tuple(map(call, converters, fields))
+
+        def split_bytes(line: bytes) -> tuple:
+            if padded and len(line) < size:  # type: ignore[operator]
+                line = line.ljust(size)  # type: ignore[arg-type]
+            fields = extract(line)
+            try:
+                return tuple(map(call, fast_converters, fields))
+            except ValueError:
+                return tuple(map(call, converters, fields))
+
+        split = split_text if text else split_bytes
+        split.__qualname__ = f"RecordSpec({self.record_type!r}).{'split' if text else 'split_bytes'}"
+        return split
+
+
+def _extract_one(extract: Callable[[Any], Any], line: Any) -> tuple:
+    return (extract(line),)
+
+
+def _number(field: Union[str, bytes]) -> Optional[float]:
+    return float(field) if field and not field.isspace() else None
+
+
+def _decode_text(field: bytes) -> str:
+    return field.strip().decode("ascii")
+
+
+def _decode_raw(field: bytes) -> str:
+    return field.decode("ascii")
+
+
+# The converters of the fields of every column kind, of text lines and of byte lines
+_CONVERTERS: dict[str, tuple[Callable[[Any], Any], Callable[[Any], Any]]] = {
+    "text": (str.strip, _decode_text),
+    "number": (_number, _number),
+    "raw": (str, _decode_raw),
+}
+
+# template_comment_block: str =        "-00 Free text"
+COMMENT_RECORD = RecordSpec("00", [Column("text", 4, None)])
+
+# template_admin_block: str =          "-01 OOOOOOOOOOOO DDMMYYYY VVV KKKKKKK KKKK $RVAllllllll OOOOOOOOOOOO"
+ADMINISTRATIVE_RECORD = RecordSpec(
+    "01",
+    [
+        Column("project", 4, 16),
+        Column("date", 17, 25),
+        Column("version", 26, 29),
+        Column("coordinate_system", 30, 38),
+        Column("municipality", 38, 42),
+        Column("units", 43, 56, kind="raw"),
+        Column("observer", 56, 68),
+    ],
+)
+
+# template_coordinate_block: str =     "-05 PPPPPPPPPP KKKKKKKK XXXXXXXX.XXX YYYYYYY.YYY ZZZZ.ZZZ Bk MMMMMMM"
+COORDINATE_RECORD = RecordSpec(
+    "05",
+    [
+        Column("name", 4, 15),
+        Column("tema_code", 15, 24),
+        Column("easting", 24, 37, kind="number"),
+        Column("northing", 37, 49, kind="number"),
+        Column("z", 49, 58, kind="number"),
+    ],
+)
+
+# template_command_block: str =        "-09_CC", e.g. "-09_91" to start a line and "-09_99" to end it
+COMMAND_RECORD = RecordSpec("09", [Column("command", 4, 6)], separator="_")
+
+RECORD_SPECS = {
+    spec.record_type: spec for spec in [COMMENT_RECORD, ADMINISTRATIVE_RECORD, COORDINATE_RECORD, COMMAND_RECORD]
+}
+
+
+def record_spec(line: str) -> Optional[RecordSpec]:
+    """
+    The spec of the record type of a line, or None if the line is not a record of a type in `RECORD_SPECS`
+    """
+    spec = RECORD_SPECS.get(line[1:3])
+    if spec is None or not line.startswith(spec.prefix):
+        return None
+
+    return spec
@@ -1,35 +1,37 @@
-from typing import List, Optional
+from collections.abc import AsyncIterable
+from inspect import isawaitable
+from io import BufferedIOBase, RawIOBase, StringIO
+from itertools import islice
+from operator import itemgetter
+from time import perf_counter
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
 from datetime import datetime, UTC
 from uuid import UUID
 
 from kof_parser import Kof
 from kof_parser import Location
-from kof_parser.enums import MethodType
-from kof_parser import projector
+from kof_parser.document import KOFDocument
+from kof_parser.kof import CoordinateBatch, TemaCodes
+from kof_parser.stats import WriteStats
+
+# A coordinate block (05) line as `KOFWriter.create_kof_coordinate_block()` formats it, padded to 70 characters, for
+# fields that fit in their columns. The name is cut to 10 characters by the precision of its format.
+_COORDINATE_BLOCK_TEMPLATE = " 05 {:<10.10} {:<8} {:>12.3f} {:>11.3f} {:>8.3f}" + " " * 13 + "\n"
+_COORDINATE_BLOCK_LENGTH = 71
 
 
 class KOFWriter(Kof):
-    method_type_to_temakode = {
-        MethodType.RO.name: "2251",
-        MethodType.RWS.name: "2401",
-        MethodType.SA.name: "2402",
-        MethodType.TP.name: "2403",
-        MethodType.SS.name: "2405",
-        MethodType.RP.name: "2406",
-        MethodType.CPT.name: "2407",
-        MethodType.RS.name: "2409",
-        MethodType.SR.name: "2410",
-        MethodType.SPT.name: "2411",
-        MethodType.RCD.name: "2412",
-        MethodType.PZ.name: "2413",
-        MethodType.PT.name: "2414",
-        MethodType.SVT.name: "2415",
-        MethodType.INC.name: "2417",
-        MethodType.TOT.name: "2418",
-    }
-
-    def __init__(self):
-        super().__init__()
+    # A read-only view of the method names and the tema codes they are written as, of the shared table. An instance has
+    # a view of its own table. Add codes with `tema_codes.add()`.
+    method_type_to_temakode: Mapping[str, str] = MappingProxyType(Kof.tema_codes.codes)
+
+    def __init__(self, tema_codes: Optional[TemaCodes] = None):
+        """
+        Methods are written with their tema code in `tema_codes`, or the shared table, see `TemaCodes`.
+        """
+        super().__init__(tema_codes)
+        self.method_type_to_temakode = MappingProxyType(self.tema_codes.codes)
 
     def create_admin_block(self, project_name: str, srid: int, swap_easting_northing: Optional[bool] = False) -> str:
         """
@@ -68,6 +70,34 @@ class KOFWriter(Kof):
 
         return coord_block
 
+    @classmethod
+    def create_kof_coordinate_blocks(
+        cls,
+        ids: Sequence[str],
+        temakodes: Sequence[str],
+        xs: Sequence[float],
+        ys: Sequence[float],
+        zs: Sequence[float],
+    ) -> str:
+        """
+        Create the coordinate blocks of many lines from columns, the same as joining `create_kof_coordinate_block()`
+        of every line.
+
+        All lines are formatted with one precomputed template and joined once. The few lines with a field that does
+        not fit in its column are formatted again by `create_kof_coordinate_block()`.
+        """
+        lines = list(map(_COORDINATE_BLOCK_TEMPLATE.format, ids, temakodes, ys, xs, zs))
+        text = "".join(lines)
+        if len(text) == _COORDINATE_BLOCK_LENGTH * len(lines):
+            return text
+
+        return "".join(
+            line
+            if len(line) == _COORDINATE_BLOCK_LENGTH
+            else cls.create_kof_coordinate_block(ids[index], temakodes[index], xs[index], ys[index], zs[index])
+            for index, line in enumerate(lines)
+        )
+
     @staticmethod
     def create_kof_header_lines(project_id: UUID, project_name, srid: int) -> str:
         header = " 00 KOF Export from NGI Field Manager\n"
@@ -77,45 +107,380 @@ class KOFWriter(Kof):
 
         return header
 
+    @staticmethod
+    def _is_binary(stream: Any) -> bool:
+        """
+        Check if a file-like object is written bytes rather than text, e.g. a `BytesIO` or a file opened in "wb" mode
+        """
+        if isinstance(stream, (RawIOBase, BufferedIOBase)):
+            return True
+        mode = getattr(stream, "mode", "")
+        return isinstance(mode, str) and "b" in mode
+
+    @staticmethod
+    def _transform_coordinates(locations: List[Location], srid: int) -> list[tuple[float, float]]:
+        """
+        Return the (easting, northing) of every location in the `srid` coordinate system.
+
+        Locations are grouped by their own srid and each group is transformed in one batch.
+        """
+        coordinates: list[tuple[float, float]] = []
+        batches: dict[int, CoordinateBatch[int]] = {}
+        for index, location in enumerate(locations):
+            x = location.point_easting or 0
+            y = location.point_northing or 0
+            coordinates.append((x, y))
+            if x and y and srid and location.srid and srid != location.srid:
+                if (batch := batches.get(location.srid)) is None:
+                    batch = batches[location.srid] = CoordinateBatch(location.srid, srid)
+                batch.add(index, x, y)
+
+        for batch in batches.values():
+            for index, x, y in batch.transform():
+                coordinates[index] = (x, y)
+
+        return coordinates
+
     def writeKOF(
         self,
         project_id: UUID,
         project_name: str,
-        locations: List[Location],
+        locations: Iterable[Location],
         srid: int,
         swap_easting_northing: Optional[bool] = False,
+        stats: Optional[WriteStats] = None,
     ) -> str:
-        """For now, we do not do any transformation of locations positions"""
+        """
+        Create a KOF file and return it as a string. See `write_to()`.
+        """
+        kof_string = StringIO()
+        self.write_to(
+            kof_string,
+            project_id=project_id,
+            project_name=project_name,
+            locations=locations,
+            srid=srid,
+            swap_easting_northing=swap_easting_northing,
+            stats=stats,
+        )
 
-        kof_string = self.create_kof_header_lines(project_id=project_id, project_name=project_name, srid=srid)
-        kof_string += self.create_admin_block(project_name, srid=srid, swap_easting_northing=swap_easting_northing)
-        for location in locations:
-            location.name = location.name if not None else ""
-            z = location.point_z or 0
+        return kof_string.getvalue()
+
+    def write_to(
+        self,
+        stream: Any,
+        project_id: UUID,
+        project_name: str,
+        locations: Iterable[Location],
+        srid: int,
+        swap_easting_northing: Optional[bool] = False,
+        encoding: str = "iso-8859-15",
+        batch_size: int = 10_000,
+        stats: Optional[WriteStats] = None,
+    ) -> None:
+        """
+        Write a KOF file to a text or binary file-like object. The locations are written in the `srid` coordinate
+        system.
+
+        The locations may be any iterable, e.g. a generator, and are written in chunks of `batch_size` locations, so
+        the whole file is never held in memory. Binary streams (raw or buffered I/O objects, or streams with "b" in their
+        mode) are written in the `encoding` character set, and other streams are written as text. The default
+        character set, iso-8859-15, is what the KOF parser falls back to.
+
+        If `stats` are passed, the time spent transforming, formatting and writing, and the number of locations, lines
+        and bytes written are added to them. See `WriteStats`.
+        """
+        if self._is_binary(stream):
+
+            def write(text: str) -> int:
+                data = text.encode(encoding)
+                stream.write(data)
+                return len(data)
+
+        else:
+
+            def write(text: str) -> int:
+                stream.write(text)
+                return len(text)
+
+        chunks = self._iter_kof_chunks(
+            project_id=project_id,
+            project_name=project_name,
+            locations=locations,
+            srid=srid,
+            swap_easting_northing=swap_easting_northing,
+            batch_size=batch_size,
+            stats=stats,
+        )
+        if stats is None:
+            for chunk in chunks:
+                write(chunk)
+            return
+
+        for chunk in chunks:
+            start = perf_counter()
+            stats.bytes_written += write(chunk)
+            stats.write_seconds += perf_counter() - start
+            stats.lines += chunk.count("\n")
+
+    def write_document(self, document: KOFDocument, stream: Any) -> None:
+        """
+        Write a document parsed by `KOFParser.parse_document()` to a binary file-like object.
+
+        Comments, administrative blocks and the lines of unchanged locations are written as their source bytes. Every
+        line of a changed location is written in place with the current values of the location, in the coordinate
+        system, axis order and line ending of that line, and keeps its own tema code. Lines of methods that are removed
+        from the location are removed, and methods that are added are written after its last line. All lines of
+        removed locations are removed. New locations are added at the end of the file, in the coordinate system and
+        axis order in effect there.
+        """
+        changed, new = document.changed_locations()
+        if not changed and not new:
+            stream.write(document.source)
+            return
+
+        tema_codes = document.tema_codes or self.tema_codes
+        locations_by_name = {location.name: location for location in document.locations}
+        # The indexes in `coordinate_lines` of the lines of every changed location
+        location_lines: dict[int, list[int]] = {location_index: [] for location_index in changed}
+        for line, location_index in enumerate(document.coordinate_line_locations):
+            if (lines_of_location := location_lines.get(location_index)) is not None:
+                lines_of_location.append(line)
+
+        newline = document.newline
+        # The (location, srid, swapped, line ending, tema codes) of the blocks to write, and the (line index, block
+        # index or None to remove the line) of the lines not written as they are
+        blocks: list[tuple[Location, int, bool, bytes, list[str]]] = []
+        edits: list[tuple[int, Optional[int]]] = []
+        for location_index, lines_of_location in location_lines.items():
+            location = locations_by_name.get(document.original_locations[location_index].name)
+            if location is None:
+                edits.extend((document.coordinate_lines[line], None) for line in lines_of_location)
+                continue
+
+            methods = list(location.methods)
+            kept_lines: list[tuple[int, list[str]]] = []
+            for line in lines_of_location:
+                line_index = document.coordinate_lines[line]
+                # A tema code that is not mapped to a method (e.g. 2430) is kept as it is
+                temakode = document.line(line_index)[15:24].strip().decode(document.encoding)
+                if (method := tema_codes.method(temakode)) is not None:
+                    if method not in methods:
+                        edits.append((line_index, None))
+                        continue
+                    methods.remove(method)
+                kept_lines.append((line, [temakode]))
+            if not kept_lines:
+                # The first line is written with the methods that are left, or without a tema code, instead of removed
+                edits.remove((document.coordinate_lines[lines_of_location[0]], None))
+                kept_lines.append((lines_of_location[0], []))
+            kept_lines[-1][1].extend(tema_codes.code(method) for method in methods)
+
+            for line, temakodes in kept_lines:
+                line_index = document.coordinate_lines[line]
+                source_line = document.line(line_index)
+                line_ending = source_line[len(source_line.rstrip(b"\r\n")) :] or newline
+                edits.append((line_index, len(blocks)))
+                blocks.append(
+                    (
+                        location,
+                        document.source_srids[line],
+                        bool(document.swapped[line]),
+                        line_ending,
+                        temakodes or [""],
+                    )
+                )
+        edits.sort(key=itemgetter(0))
+        blocks.extend(
+            (
+                location,
+                document.end_srid,
+                document.end_swapped,
+                newline,
+                [tema_codes.code(method) for method in location.methods] or [""],
+            )
+            for location in new
+        )
+        encoded_blocks = self._create_document_blocks(blocks, document)
+
+        source = memoryview(document.source)
+        position = 0
+        for line_index, block_index in edits:
+            stream.write(source[position : document.line_offsets[line_index]])
+            if block_index is not None:
+                stream.write(encoded_blocks[block_index])
+            position = document.line_offsets[line_index + 1]
+        stream.write(source[position:])
+
+        if new:
+            if document.source and not document.source.endswith((b"\n", b"\r")):
+                stream.write(newline)
+            stream.writelines(encoded_blocks[len(blocks) - len(new) :])
+
+    def _create_document_blocks(
+        self, blocks: List[tuple[Location, int, bool, bytes, list[str]]], document: KOFDocument
+    ) -> list[bytes]:
+        """
+        Create the encoded coordinate blocks of every (location, srid, swapped, line ending, tema codes), one line per
+        tema code
+        """
+        coordinates: list[tuple[float, float]] = []
+        batches: dict[tuple[int, int], CoordinateBatch[int]] = {}
+        for index, (location, srid, _, _, _) in enumerate(blocks):
             x = location.point_easting or 0
             y = location.point_northing or 0
+            coordinates.append((x, y))
             if x and y and srid and location.srid and srid != location.srid:
-                x, y = projector.transform(from_srid=location.srid, to_srid=srid, east=x, north=y)
-
-            if swap_easting_northing:
-                x, y = y, x
-
-            if location.methods:
-                for method in location.methods:
-                    kof_string += self.create_kof_coordinate_block(
-                        id=location.name,
-                        temakode=self.method_type_to_temakode.get(method, ""),
-                        x=x,
-                        y=y,
-                        z=z,
-                    )
-            else:
-                kof_string += self.create_kof_coordinate_block(
-                    id=location.name,
-                    temakode="",
-                    x=x,
-                    y=y,
-                    z=z,
-                )
+                if (batch := batches.get((location.srid, srid))) is None:
+                    batch = batches[location.srid, srid] = CoordinateBatch(location.srid, srid)
+                batch.add(index, x, y)
+        for batch in batches.values():
+            for index, x, y in batch.transform():
+                coordinates[index] = (x, y)
+
+        encoded_blocks = []
+        for (location, _, swapped, line_ending, temakodes), (easting, northing) in zip(blocks, coordinates):
+            # Northing is written first, unless the axis order of the line is swapped
+            x, y = (easting, northing) if swapped else (northing, easting)
+            z = location.point_z or 0
+            block = "".join(self.create_kof_coordinate_block(location.name, code, x, y, z) for code in temakodes)
+            encoded_blocks.append(block.replace("\n", line_ending.decode("ascii")).encode(document.encoding))
+
+        return encoded_blocks
+
+    async def awrite(
+        self,
+        stream: Any,
+        project_id: UUID,
+        project_name: str,
+        locations: Union[Iterable[Location], AsyncIterable[Location]],
+        srid: int,
+        swap_easting_northing: Optional[bool] = False,
+        encoding: str = "iso-8859-15",
+        batch_size: int = 10_000,
+    ) -> None:
+        """
+        Write a KOF file to an async stream, without blocking the event loop.
+
+        The `stream` must have a `write(data: bytes)` method, which may be a coroutine (e.g. aiofiles). If the stream
+        has a `drain()` coroutine (e.g. `asyncio.StreamWriter`), it is awaited after every write. The file is written
+        in the `encoding` character set.
+
+        The locations may be an iterable or an async iterable. Every `batch_size` locations are transformed and
+        formatted in the event loop's default executor. See `write_to()` for the other parameters.
+        """
+        from asyncio import get_running_loop
+
+        loop = get_running_loop()
+        header = self.create_kof_header_lines(project_id=project_id, project_name=project_name, srid=srid)
+        header += self.create_admin_block(project_name, srid=srid, swap_easting_northing=swap_easting_northing)
+        await _awrite(stream, header.encode(encoding))
+
+        async for batch in _aiter_batches(locations, batch_size):
+            chunk = await loop.run_in_executor(
+                None, self._format_coordinate_blocks, batch, srid, swap_easting_northing, encoding
+            )
+            await _awrite(stream, chunk)
+
+    def _format_coordinate_blocks(
+        self, locations: List[Location], srid: int, swap_easting_northing: Optional[bool], encoding: str
+    ) -> bytes:
+        return self._create_coordinate_blocks(locations, srid, swap_easting_northing).encode(encoding)
+
+    def _iter_kof_chunks(
+        self,
+        project_id: UUID,
+        project_name: str,
+        locations: Iterable[Location],
+        srid: int,
+        swap_easting_northing: Optional[bool],
+        batch_size: int,
+        stats: Optional[WriteStats] = None,
+    ) -> Iterator[str]:
+        start = perf_counter()
+        header = self.create_kof_header_lines(project_id=project_id, project_name=project_name, srid=srid)
+        header += self.create_admin_block(project_name, srid=srid, swap_easting_northing=swap_easting_northing)
+        if stats is not None:
+            stats.format_seconds += perf_counter() - start
+        yield header
+
+        iterator = iter(locations)
+        while batch := list(islice(iterator, batch_size)):
+            if stats is None:
+                yield self._create_coordinate_blocks(batch, srid, swap_easting_northing)
+                continue
+
+            start = perf_counter()
+            transform_seconds = stats.transform_seconds
+            chunk = self._create_coordinate_blocks(batch, srid, swap_easting_northing, stats)
+            stats.format_seconds += perf_counter() - start - (stats.transform_seconds - transform_seconds)
+            stats.locations += len(batch)
+            yield chunk
+
+    def _create_coordinate_blocks(
+        self,
+        locations: List[Location],
+        srid: int,
+        swap_easting_northing: Optional[bool],
+        stats: Optional[WriteStats] = None,
+    ) -> str:
+        """
+        Create the coordinate blocks of the locations, one line per method (or one line without a tema code)
+        """
+        start = perf_counter()
+        coordinates = self._transform_coordinates(locations, srid)
+        if stats is not None:
+            stats.transform_seconds += perf_counter() - start
+        if swap_easting_northing:
+            coordinates = [(y, x) for x, y in coordinates]
+
+        temakode_by_method = self.tema_codes.codes
+        ids: list[str] = []
+        temakodes: list[str] = []
+        xs: list[float] = []
+        ys: list[float] = []
+        zs: list[float] = []
+        for location, (x, y) in zip(locations, coordinates):
+            z = location.point_z or 0
+            if len(location.methods) <= 1:
+                ids.append(location.name)
+                temakodes.append(temakode_by_method.get(location.methods[0], "") if location.methods else "")
+                xs.append(x)
+                ys.append(y)
+                zs.append(z)
+                continue
+
+            for method in location.methods:
+                ids.append(location.name)
+                temakodes.append(temakode_by_method.get(method, ""))
+                xs.append(x)
+                ys.append(y)
+                zs.append(z)
+
+        return self.create_kof_coordinate_blocks(ids, temakodes, xs, ys, zs)
+
+
+async def _aiter_batches(
+    items: Union[Iterable[Location], AsyncIterable[Location]], batch_size: int
+) -> AsyncIterator[list[Location]]:
+    if isinstance(items, AsyncIterable):
+        batch = []
+        async for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    else:
+        iterator = iter(items)
+        while batch := list(islice(iterator, batch_size)):
+            yield batch
+
 
-        return kof_string
+async def _awrite(stream: Any, data: bytes) -> None:
+    result = stream.write(data)
+    if isawaitable(result):
+        await result
+    if drain := getattr(stream, "drain", None):
+        await drain()
@@ -0,0 +1,289 @@
+"""
+Benchmark parsing and writing synthetic KOF files, and report the throughput and peak memory as JSON.
+
+Run from the project root folder:
+
+    uv run python tests/benchmark.py --output baseline.json
+    uv run python tests/benchmark.py --points 1000 100000 --compare baseline.json
+    uv run python tests/benchmark.py --points 1000 --coordinate-blocks 1000000
+    uv run python tests/benchmark.py --points 1000 --tokenizer 1000000
+
+Compare results from the same machine only.
+"""
+
+import argparse
+import gc
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import asdict, replace
+from functools import partial
+from importlib.metadata import version
+from typing import Any, Callable, Optional
+
+from kof_generator import SyntheticKof
+
+from kof_parser import COORDINATE_RECORD, KOFParser, KOFWriter
+
+RESULT_SRID = 25832
+
+SCENARIOS = {
+    "plain": SyntheticKof(),
+    "duplicates": SyntheticKof(duplicate_ratio=0.5),
+    "north-east": SyntheticKof(north_east=True),
+    "transform": SyntheticKof(srid=23032),
+    "utf-8": SyntheticKof(encoding="utf-8"),
+}
+
+
+def measure(function: Callable[[], Any], repeat: int) -> tuple[float, int]:
+    """
+    Return the best time of `repeat` calls, and the peak memory allocated by one more call (traced separately, since
+    tracing slows the call down)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def throughput(seconds: float, points: int, size: int, peak: int) -> dict[str, float]:
+    return {
+        "seconds": seconds,
+        "points_per_second": points / seconds,
+        "megabytes_per_second": size / seconds / 1e6,
+        "peak_memory_megabytes": peak / 1e6,
+    }
+
+
+def run_case(name: str, kof: SyntheticKof, repeat: int) -> dict[str, Any]:
+    data = kof.generate()
+    parser = KOFParser()
+    writer = KOFWriter()
+
+    def parse() -> list:
+        return parser.parse(io.BytesIO(data), result_srid=RESULT_SRID)
+
+    locations = parse()
+
+    def write() -> str:
+        return writer.writeKOF(uuid.UUID(int=0), "benchmark", locations, srid=kof.srid or RESULT_SRID)
+
+    written = write()
+    # UTF-8, since the detected character set of a synthetic file may not have all the characters of its names
+    round_trip = parser.parse(io.BytesIO(written.encode("utf-8")), result_srid=RESULT_SRID)
+    if len(round_trip) != len(locations):
+        raise AssertionError(f"{name}: {len(round_trip)} locations after writing and parsing, not {len(locations)}")
+
+    parse_seconds, parse_peak = measure(parse, repeat)
+    write_seconds, write_peak = measure(write, repeat)
+
+    return {
+        "name": name,
+        "parameters": asdict(kof),
+        "locations": len(locations),
+        "parse": throughput(parse_seconds, kof.points, len(data), parse_peak),
+        "write": throughput(write_seconds, kof.points, len(written), write_peak),
+    }
+
+
+def run_coordinate_blocks(rows: int, repeat: int) -> dict[str, Any]:
+    """
+    Compare formatting `rows` coordinate block (05) lines one at a time with `KOFWriter.create_kof_coordinate_block()`
+    and as columns with `KOFWriter.create_kof_coordinate_blocks()`
+    """
+    rng = random.Random(0)  # nosec B311 - not used for security
+    ids = [f"P{i}" for i in range(rows)]
+    temakodes = [["2418", "2407", ""][i % 3] for i in range(rows)]
+    xs = [rng.uniform(500_000, 600_000) for _ in range(rows)]
+    ys = [rng.uniform(6_500_000, 6_600_000) for _ in range(rows)]
+    zs = [rng.uniform(0, 100) for _ in range(rows)]
+
+    def per_line() -> str:
+        return "".join(map(KOFWriter.create_kof_coordinate_block, ids, temakodes, xs, ys, zs))
+
+    def bulk() -> str:
+        return KOFWriter.create_kof_coordinate_blocks(ids, temakodes, xs, ys, zs)
+
+    size = len(per_line())
+    if bulk() != per_line():
+        raise AssertionError("The coordinate blocks formatted as columns differ from those formatted one at a time")
+
+    per_line_seconds, per_line_peak = measure(per_line, repeat)
+    bulk_seconds, bulk_peak = measure(bulk, repeat)
+
+    return {
+        "rows": rows,
+        "per_line": throughput(per_line_seconds, rows, size, per_line_peak),
+        "bulk": throughput(bulk_seconds, rows, size, bulk_peak),
+    }
+
+
+def slice_coordinate_line(line: str) -> tuple:
+    """
+    Split a coordinate block (05) line with a slice per field, as the parser did before `RecordSpec`
+    """
+    if "\t" in line:
+        raise ValueError("KOF file contains tabs, please convert to spaces.")
+
+    return (
+        line[4:15].strip(),
+        line[15:24].strip(),
+        float(line[24:37]) if line[24:37].strip() else None,
+        float(line[37:49]) if line[37:49].strip() else None,
+        float(line[49:58]) if line[49:58].strip() else None,
+    )
+
+
+def slice_coordinate_bytes(line: bytes) -> tuple:
+    return (
+        line[4:15].strip().decode("ascii"),
+        line[15:24].strip().decode("ascii"),
+        float(line[24:37]) if line[24:37].strip() else None,
+        float(line[37:49]) if line[37:49].strip() else None,
+        float(line[49:58]) if line[49:58].strip() else None,
+    )
+
+
+def _split_all(split: Callable[[Any], tuple], lines: list) -> list[tuple]:
+    return list(map(split, lines))
+
+
+def run_tokenizer(rows: int, repeat: int) -> dict[str, Any]:
+    """
+    Compare splitting `rows` coordinate block (05) lines, as text and as bytes, with a slice per field and with the
+    `COORDINATE_RECORD` tokenizer
+    """
+    lines = SyntheticKof(points=rows, srid=None, encoding="ascii").generate().decode("ascii").splitlines(keepends=True)
+    text_lines = [line for line in lines if line.startswith(" 05 ")]
+    byte_lines = [line.encode("ascii") for line in text_lines]
+    size = sum(map(len, byte_lines))
+    if list(map(slice_coordinate_line, text_lines)) != list(map(COORDINATE_RECORD.split, text_lines)):
+        raise AssertionError("The tokenizer splits the text lines differently than slicing")
+    if list(map(slice_coordinate_bytes, byte_lines)) != list(map(COORDINATE_RECORD.split_bytes, byte_lines)):
+        raise AssertionError("The tokenizer splits the byte lines differently than slicing")
+
+    results: dict[str, Any] = {"rows": len(text_lines)}
+    cases: list[tuple[str, Callable[[Any], tuple], list]] = [
+        ("slice_text", slice_coordinate_line, text_lines),
+        ("tokenizer_text", COORDINATE_RECORD.split, text_lines),
+        ("slice_bytes", slice_coordinate_bytes, byte_lines),
+        ("tokenizer_bytes", COORDINATE_RECORD.split_bytes, byte_lines),
+    ]
+    for name, split, split_lines in cases:
+        seconds, peak = measure(partial(_split_all, split, split_lines), repeat)
+        results[name] = throughput(seconds, len(split_lines), size, peak)
+
+    return results
+
+
+def run(points: list[int], scenarios: list[str], repeat: int, log: Optional[Callable[[str], Any]] = None) -> dict:
+    results = []
+    for number_of_points in points:
+        for name in scenarios:
+            result = run_case(name, replace(SCENARIOS[name], points=number_of_points), repeat)
+            results.append(result)
+            if log:
+                log(
+                    f"{name:<12} {number_of_points:>9} points: "
+                    f"parse {result['parse']['points_per_second']:>10.0f} points/s "
+                    f"{result['parse']['peak_memory_megabytes']:>8.1f} MB, "
+                    f"write {result['write']['points_per_second']:>10.0f} points/s "
+                    f"{result['write']['peak_memory_megabytes']:>8.1f} MB"
+                )
+
+    return {
+        "environment": {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "kof_parser": version("kof-parser"),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """
+    Compare the throughput and peak memory of the cases in both results, as current / baseline
+    """
+    baseline_results = {(result["name"], result["parameters"]["points"]): result for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        key = (result["name"], result["parameters"]["points"])
+        if (old := baseline_results.get(key)) is None:
+            continue
+        ratios = [
+            f"{operation} {result[operation]['points_per_second'] / old[operation]['points_per_second']:.2f}x speed "
+            f"{result[operation]['peak_memory_megabytes'] / old[operation]['peak_memory_megabytes']:.2f}x memory"
+            for operation in ["parse", "write"]
+        ]
+        lines.append(f"{key[0]:<12} {key[1]:>9} points: {', '.join(ratios)}")
+
+    return lines
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("--points", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    argument_parser.add_argument("--scenario", choices=list(SCENARIOS), nargs="+", default=list(SCENARIOS))
+    argument_parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many runs")
+    argument_parser.add_argument("--output", help="Write the results to this JSON file")
+    argument_parser.add_argument("--compare", help="Compare the results with an earlier JSON file")
+    argument_parser.add_argument(
+        "--coordinate-blocks",
+        type=int,
+        metavar="ROWS",
+        help="Also compare formatting this many coordinate block lines one at a time and as columns",
+    )
+    argument_parser.add_argument(
+        "--tokenizer",
+        type=int,
+        metavar="ROWS",
+        help="Also compare splitting this many coordinate block lines with slices and with the tokenizer",
+    )
+    args = argument_parser.parse_args(arguments)
+
+    results = run(args.points, args.scenario, args.repeat, log=print)
+    if args.coordinate_blocks:
+        results["coordinate_blocks"] = blocks = run_coordinate_blocks(args.coordinate_blocks, args.repeat)
+        print(
+            f"coordinate blocks {blocks['rows']:>9} rows: "
+            f"per line {blocks['per_line']['points_per_second']:>10.0f} rows/s, "
+            f"columns {blocks['bulk']['points_per_second']:>10.0f} rows/s"
+        )
+    if args.tokenizer:
+        results["tokenizer"] = tokenizer = run_tokenizer(args.tokenizer, args.repeat)
+        print(
+            f"tokenizer {tokenizer['rows']:>9} rows: "
+            + ", ".join(
+                f"{name} {tokenizer[name]['points_per_second']:>10.0f} rows/s"
+                for name in ["slice_text", "tokenizer_text", "slice_bytes", "tokenizer_bytes"]
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Synthetic KOF files for tests and benchmarks
+"""
+
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from kof_parser import Kof, transformer_cache
+
+TEMA_CODES = ["2401", "2402", "2403", "2405", "2406", "2407", "2409", "2413", "2418", "2430", ""]
+
+
+@dataclass
+class SyntheticKof:
+    """
+    The shape of a synthetic KOF file.
+
+    - `points`: number of coordinate block (05) lines
+    - `duplicate_ratio`: share of the lines that repeat the name of an earlier line
+    - `srid`: coordinate system of the coordinates, written as a SOSI code in the administrative block (01). With
+      None there is no administrative block, and the coordinates are in EPSG:25832.
+    - `north_east`: write the coordinates in northing/easting order (the KOF default), instead of easting/northing
+    - `encoding`: character set of the file. Unless it is ASCII, the names contain non-ASCII characters.
+    """
+
+    points: int = 1000
+    duplicate_ratio: float = 0.0
+    srid: Optional[int] = 25832
+    north_east: bool = False
+    encoding: str = "iso-8859-15"
+    seed: int = 0
+
+    def generate(self) -> bytes:
+        """
+        Create the KOF file. The same parameters give the same file.
+        """
+        rng = random.Random(self.seed)  # nosec B311 - not used for security
+        unique_names = max(1, round(self.points * (1 - self.duplicate_ratio)))
+        prefixes = ["P"] if self.encoding.lower() == "ascii" else ["Brø", "Mål", "Sæt", "Hø", "Å"]
+        easting, northing = transformer_cache.get(4326, self.srid or 25832).transform(10.75, 59.9)
+
+        lines = [" 00 Synthetic KOF file\n"]
+        if self.srid is not None:
+            sosi_code = Kof().get_code(self.srid)
+            axis_order = "$11100000000" if self.north_east else "$21100000000"
+            lines.append(f" 01 Synthetic    01012025   1 {sosi_code:>7}      {axis_order}\n")
+        for i in range(self.points):
+            number = i if i < unique_names else rng.randrange(unique_names)
+            name = f"{prefixes[number % len(prefixes)]}{number}"
+            x = easting + rng.uniform(-5000, 5000)
+            y = northing + rng.uniform(-5000, 5000)
+            if self.north_east:
+                x, y = y, x
+            lines.append(
+                f" 05 {name:<10} {TEMA_CODES[i % len(TEMA_CODES)]:<8} {x:>12.3f} {y:>11.3f} {rng.uniform(0, 100):>8.3f}\n"
+            )
+
+        return "".join(lines).encode(self.encoding)
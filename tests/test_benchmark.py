@@ -0,0 +1,122 @@
+import io
+import json
+import subprocess  # nosec B404
+import sys
+import time
+
+import pytest
+from benchmark import compare, run, run_coordinate_blocks, run_tokenizer
+from kof_generator import TEMA_CODES, SyntheticKof
+
+from kof_parser import KOFParser
+
+
+def time_parse(number_of_points: int, repeat: int = 3) -> float:
+    data = SyntheticKof(points=number_of_points, srid=None).generate()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        locations = KOFParser().parse(io.BytesIO(data), result_srid=5110)
+        best = min(best, time.perf_counter() - start)
+        assert len(locations) == number_of_points
+    return best
+
+
+class TestBenchmark:
+    def test_parse_time_grows_linearly(self):
+        """
+        Parsing eight times as many points should take roughly eight times as long.
+
+        A quadratic merge would take about 64 times as long, so the bound is loose enough to not be flaky.
+        """
+        small = time_parse(2_000)
+        large = time_parse(16_000)
+
+        assert large / small < 20
+
+    @pytest.mark.parametrize(
+        "kof",
+        [
+            SyntheticKof(points=500, srid=None),
+            SyntheticKof(points=500, duplicate_ratio=0.4, north_east=True),
+            SyntheticKof(points=500, srid=23032, encoding="utf-8"),
+            SyntheticKof(points=500, srid=5110, encoding="ascii"),
+        ],
+    )
+    def test_synthetic_kof(self, kof):
+        data = kof.generate()
+
+        locations = KOFParser().parse(io.BytesIO(data), result_srid=25832)
+
+        assert data == kof.generate()
+        assert len(locations) == round(kof.points * (1 - kof.duplicate_ratio))
+        assert sum(len(location.methods) for location in locations) == sum(
+            TEMA_CODES[i % len(TEMA_CODES)] not in ["2430", ""] for i in range(kof.points)
+        )
+        assert any(not location.name.isascii() for location in locations) == (kof.encoding != "ascii")
+        expected = SyntheticKof(points=500, duplicate_ratio=kof.duplicate_ratio, srid=None).generate()
+        for location, expected_location in zip(locations, KOFParser().parse(io.BytesIO(expected), 25832)):
+            assert location.point_northing > location.point_easting
+            assert location.point_easting == pytest.approx(expected_location.point_easting, abs=1e3)
+            assert location.point_northing == pytest.approx(expected_location.point_northing, abs=1e3)
+
+    def test_benchmark_runner(self):
+        results = run(points=[200], scenarios=["plain", "transform"], repeat=1)
+
+        assert json.loads(json.dumps(results)) == results
+        assert [result["name"] for result in results["results"]] == ["plain", "transform"]
+        for result in results["results"]:
+            assert result["locations"] == 200
+            assert result["parse"]["points_per_second"] > 0
+            assert result["write"]["peak_memory_megabytes"] > 0
+        assert compare(results, results)[0].startswith("plain              200 points: parse 1.00x speed 1.00x memory")
+
+    def test_coordinate_blocks_benchmark(self):
+        results = run_coordinate_blocks(rows=300, repeat=1)
+
+        assert json.loads(json.dumps(results)) == results
+        assert results["rows"] == 300
+        assert results["per_line"]["megabytes_per_second"] > 0
+        assert results["bulk"]["points_per_second"] > 0
+
+    def test_tokenizer_benchmark(self):
+        results = run_tokenizer(rows=300, repeat=1)
+
+        assert json.loads(json.dumps(results)) == results
+        assert results["rows"] == 300
+        assert results["slice_text"]["points_per_second"] > 0
+        assert results["tokenizer_bytes"]["megabytes_per_second"] > 0
+
+    def test_import_time(self):
+        """
+        Measure `import kof_parser` with `python -X importtime`. Slow dependencies are only imported on first use.
+        """
+        result = subprocess.run(  # nosec B603
+            [sys.executable, "-X", "importtime", "-c", "import kof_parser"], capture_output=True, text=True, check=True
+        )
+        cumulative_import_times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, module = line.rsplit("|", 2)
+                if cumulative.strip().isdigit():
+                    cumulative_import_times[module.strip()] = int(cumulative)
+
+        assert "kof_parser" in cumulative_import_times
+        for module in ["pyproj", "coordinate_projector", "charset_normalizer", "asyncio", "concurrent.futures"]:
+            assert module not in cumulative_import_times, (
+                f"{module} is imported by `import kof_parser` ({cumulative_import_times['kof_parser'] / 1000:.1f} ms)"
+            )
+
+    def test_projector_is_created_on_first_use(self):
+        result = subprocess.run(  # nosec B603
+            [
+                sys.executable,
+                "-c",
+                "import sys, kof_parser; assert 'pyproj' not in sys.modules; kof_parser.projector; "
+                "assert 'pyproj' in sys.modules",
+            ],
+            capture_output=True,
+            text=True,
+        )
+
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+import sys
+
+import pytest
+
+from kof_parser import KOFParser
+from kof_parser.cli import main
+
+
+class TestConvert:
+    def test_convert_to_csv(self, tmp_path, capsys):
+        status = main(["convert", "tests/data/UTM32_NE.kof", "--srid", "25833", "--to", "csv", "-o", str(tmp_path)])
+
+        with open(tmp_path / "UTM32_NE.csv", newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        locations = KOFParser().parse("tests/data/UTM32_NE.kof", result_srid=25833)
+        assert status == 0
+        assert [(row["name"], float(row["easting"]), float(row["northing"]), row["srid"]) for row in rows] == [
+            (location.name, location.point_easting, location.point_northing, "25833") for location in locations
+        ]
+        summary = capsys.readouterr().err.splitlines()
+        assert summary[0].startswith(f"tests/data/UTM32_NE.kof -> {tmp_path / 'UTM32_NE.csv'}: ")
+        assert "points/s" in summary[0]
+        assert summary[-1].startswith("Converted 1 of 1 files")
+
+    def test_convert_to_geojson(self, tmp_path):
+        status = main(["convert", "tests/data/test.kof", "--srid", "5110", "--to", "geojson", "-o", str(tmp_path)])
+
+        with open(tmp_path / "test.geojson", encoding="utf-8") as f:
+            collection = json.load(f)
+        locations = KOFParser().parse("tests/data/test.kof", result_srid=5110)
+        assert status == 0
+        assert collection["crs"]["properties"]["name"] == "urn:ogc:def:crs:EPSG::5110"
+        assert [feature["properties"]["name"] for feature in collection["features"]] == [
+            location.name for location in locations
+        ]
+        assert collection["features"][1]["geometry"] == {"type": "Point", "coordinates": [112893.15, 1217079.46, 2.0]}
+        assert collection["features"][1]["properties"]["methods"] == ["TOT"]
+
+    @pytest.mark.parametrize("workers", ["1", "2"])
+    def test_convert_directory_and_glob_to_kof(self, tmp_path, workers):
+        output = tmp_path / "output"
+
+        status = main(
+            [
+                "convert",
+                "tests/data",
+                "tests/data/UTM3*.kof",
+                "--srid",
+                "25833",
+                "-o",
+                str(output),
+                "--workers",
+                workers,
+            ]
+        )
+
+        assert status == 1, "kof-with-tabs.kof can not be parsed"
+        for path in ["tests/data/UTM32_NE.kof", "tests/data/UTM33_EN.kof", "tests/data/Innmålt_UTM32.kof"]:
+            name = path.rsplit("/", 1)[1]
+            converted = KOFParser().parse(output / name, result_srid=25833)
+            expected = KOFParser().parse(path, result_srid=25833)
+            assert [location.name for location in converted] == [location.name for location in expected]
+            for location, expected_location in zip(converted, expected):
+                assert location.point_easting == pytest.approx(expected_location.point_easting, abs=1e-3)
+        assert not (output / "kof-with-tabs.kof").exists()
+
+    def test_convert_stdin_to_stdout(self, monkeypatch, capsysbinary):
+        with open("tests/data/test.kof", "rb") as f:
+            monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(f.read())))
+
+        status = main(["convert", "--srid", "5110", "--to", "csv"])
+
+        output = capsysbinary.readouterr()
+        assert status == 0
+        assert output.out.decode("utf-8").splitlines()[:2] == [
+            "name,methods,easting,northing,z,srid",
+            "SMPLOC1,,112892.81,1217083.64,1.0,5110",
+        ]
+        assert output.err.decode().startswith("- -> -: 7 locations from 7 points")
+
+    def test_convert_errors(self, tmp_path, capsys):
+        with pytest.raises(SystemExit):
+            main(["convert", "tests/data/*.kof", "--srid", "25833"])
+        assert "--output-dir is required" in capsys.readouterr().err
+
+        with pytest.raises(SystemExit):
+            main(["convert", "tests/data/does-not-exist*.kof", "--srid", "25833", "-o", str(tmp_path)])
+        assert "No files match" in capsys.readouterr().err
+
+        with pytest.raises(SystemExit):
+            main(["convert", "tests/data/test.kof", "--srid", "25833", "-o", "tests/data"])
+        assert "would be overwritten" in capsys.readouterr().err
+
+    def test_convert_err_inputs_with_the_same_name(self, tmp_path, capsys):
+        for directory in ["a", "b"]:
+            (tmp_path / directory).mkdir()
+            (tmp_path / directory / "x.kof").write_bytes(b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n")
+
+        with pytest.raises(SystemExit):
+            main(
+                [
+                    "convert",
+                    str(tmp_path / "**" / "*.kof"),
+                    "--srid",
+                    "5110",
+                    "--to",
+                    "csv",
+                    "-o",
+                    str(tmp_path / "out"),
+                ]
+            )
+
+        assert "would both be written to" in capsys.readouterr().err
+        assert not (tmp_path / "out").exists()
@@ -0,0 +1,83 @@
+import math
+import random
+
+import pytest
+
+from kof_parser import KOFParser, LocationIndex, construct_location
+
+
+def random_locations(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)  # nosec B311 - not used for security
+    locations = []
+    for i in range(count):
+        # Round to get points with the same coordinates, and leave a few without coordinates
+        easting = round(rng.uniform(594000, 595000), -1) if i % 50 else None
+        northing = round(rng.uniform(6589000, 6589500), -1)
+        locations.append(construct_location(f"P{i}", [], easting, northing, 1.0, 25832))
+    return locations
+
+
+def distance(location, easting: float, northing: float) -> float:
+    return math.hypot(location.point_easting - easting, location.point_northing - northing)
+
+
+class TestLocationIndex:
+    @pytest.mark.parametrize("count, leaf_size", [(0, 16), (1, 16), (7, 1), (1000, 16), (1000, 3)])
+    def test_queries_match_linear_scan(self, count, leaf_size):
+        locations = random_locations(count)
+        with_coordinates = [location for location in locations if location.point_easting is not None]
+        index = LocationIndex(locations, leaf_size=leaf_size)
+        rng = random.Random(1)  # nosec B311 - not used for security
+
+        for _ in range(20):
+            easting, northing = rng.uniform(593900, 595100), rng.uniform(6588900, 6589600)
+            width, height, radius = rng.uniform(0, 400), rng.uniform(0, 200), rng.uniform(0, 200)
+
+            assert index.within_bbox(easting, northing, easting + width, northing + height) == [
+                location
+                for location in with_coordinates
+                if easting <= location.point_easting <= easting + width
+                and northing <= location.point_northing <= northing + height
+            ]
+            by_distance = sorted(with_coordinates, key=lambda location: distance(location, easting, northing))
+            assert index.within_radius(easting, northing, radius) == [
+                location for location in by_distance if distance(location, easting, northing) <= radius
+            ]
+            assert index.nearest(easting, northing, k=5) == by_distance[:5]
+
+    def test_nearest(self):
+        index = LocationIndex(
+            [
+                construct_location("A", [], 0.0, 0.0, None, 25832),
+                construct_location("B", [], 10.0, 0.0, None, 25832),
+                construct_location("C", [], 0.0, 10.0, None, 25832),
+                construct_location("D", [], None, None, None, 25832),
+            ]
+        )
+
+        assert [location.name for location in index.nearest(9.0, 1.0)] == ["B"]
+        assert [location.name for location in index.nearest(5.0, 5.0, k=2)] == ["A", "B"]
+        assert [location.name for location in index.nearest(0.0, 0.0, k=10)] == ["A", "B", "C"]
+        assert index.nearest(0.0, 0.0, k=0) == []
+        assert index.within_bbox(-1.0, -1.0, 20.0, 20.0) == index.locations[:3]
+
+    def test_get_by_name(self):
+        locations = random_locations(100)
+        index = LocationIndex(locations)
+
+        assert len(index) == 100
+        assert list(index) == locations
+        assert index.get("P0") is locations[0]
+        assert index.get("P99") is locations[99]
+        assert index.get("P100") is None
+
+    def test_parse_indexed(self):
+        parser = KOFParser()
+        locations = parser.parse("tests/data/UTM32_NE.kof", result_srid=25832)
+
+        index = parser.parse_indexed("tests/data/UTM32_NE.kof", result_srid=25832)
+
+        assert index.locations == locations
+        for location in locations:
+            assert index.get(location.name) == location
+            assert index.nearest(location.point_easting, location.point_northing) == [location]
@@ -0,0 +1,135 @@
+import uuid
+
+import pytest
+
+from kof_parser import KOFParser, KOFWriter, Location, TransformerCache, tema_codes, transformer_cache
+from kof_parser.enums import MethodType
+
+
+class TestTransformerCache:
+    def test_hits_and_misses(self):
+        cache = TransformerCache(maxsize=2)
+
+        transformer = cache.get(25832, 25833)
+
+        assert cache.get(25832, 25833) is transformer
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TransformerCache(maxsize=2)
+        transformer_32_33 = cache.get(25832, 25833)
+        cache.get(25833, 25832)
+        cache.get(25832, 25833)
+
+        cache.get(5110, 25833)
+
+        assert len(cache) == 2
+        assert cache.get(25832, 25833) is transformer_32_33
+        assert cache.misses == 3
+        cache.get(25833, 25832)
+        assert cache.misses == 4, "25833 -> 25832 was the least recently used and is evicted"
+
+    def test_write_mixed_srids_reuses_transformers(self):
+        locations = [
+            Location(name=f"LOC{i}", point_easting=594137.802, point_northing=6589107.923, srid=srid)
+            for i, srid in enumerate([25832, 5110, 23032] * 100)
+        ]
+        writer = KOFWriter()
+        writer.writeKOF(project_id=uuid.uuid4(), project_name="cool-name", locations=locations, srid=25833)
+        misses = transformer_cache.misses
+
+        writer.writeKOF(project_id=uuid.uuid4(), project_name="cool-name", locations=locations, srid=25833)
+
+        assert transformer_cache.misses == misses
+
+
+class TestTemaCodes:
+    def test_parser_and_writer_share_the_table(self):
+        assert KOFWriter().method_type_to_temakode == {
+            "RO": "2251",
+            "RWS": "2401",
+            "SA": "2402",
+            "TP": "2403",
+            "SS": "2405",
+            "RP": "2406",
+            "CPT": "2407",
+            "RS": "2409",
+            "SR": "2410",
+            "SPT": "2411",
+            "RCD": "2412",
+            "PZ": "2413",
+            "PT": "2414",
+            "SVT": "2415",
+            "INC": "2417",
+            "TOT": "2418",
+        }
+        parser = KOFParser()
+        for code, method in parser.tema_codes_mapping.items():
+            assert parser.tema_code_to_method(code) == method.name
+            assert tema_codes.code(method.name) in parser.tema_codes_mapping
+        assert [parser.tema_code_to_method(code) for code in ["F", "GVR", "VB", "2430", "", "9999"]] == [
+            "RO",
+            "PZ",
+            "SVT",
+            None,
+            None,
+            None,
+        ]
+
+    def test_add_and_remove_codes(self):
+        codes = tema_codes.copy()
+
+        codes.add("2430", MethodType.OTHER)
+        codes.add("PZX", "PZ", write=True)
+        codes.add("F", MethodType.SA)
+
+        assert (codes.method("2430"), codes.code("OTHER")) == ("OTHER", "2430")
+        assert (codes.method("PZX"), codes.code("PZ")) == ("PZ", "PZX")
+        assert (codes.method("F"), codes.code("RO"), codes.code("SA")) == ("SA", "2251", "2402")
+        codes.remove("2251")
+        assert codes.code("RO") == ""
+        codes.remove("PZX")
+        assert codes.code("PZ") == "2413"
+        assert tema_codes.method("2430") is None, "The shared table is not changed by changing a copy"
+
+    def test_mappings_are_read_only_views(self):
+        codes = tema_codes.copy()
+        parser = KOFParser(tema_codes=codes)
+        writer = KOFWriter(tema_codes=codes)
+
+        with pytest.raises(TypeError):
+            parser.tema_codes_mapping["2430"] = MethodType.OTHER  # type: ignore[index]
+        with pytest.raises(TypeError):
+            writer.method_type_to_temakode["OTHER"] = "2430"  # type: ignore[index]
+        codes.add("2430", MethodType.OTHER)
+
+        assert parser.tema_codes_mapping["2430"] is MethodType.OTHER
+        assert writer.method_type_to_temakode["OTHER"] == "2430"
+        assert "2430" not in KOFParser.tema_codes_mapping
+        assert "OTHER" not in KOFWriter.method_type_to_temakode
+
+    def test_class_mappings_are_read_only_views_of_the_shared_table(self):
+        with pytest.raises(TypeError):
+            KOFWriter.method_type_to_temakode["OTHER"] = "2430"  # type: ignore[index]
+
+        assert KOFParser.tema_codes_mapping["2418"] is MethodType.TOT
+        assert KOFWriter.method_type_to_temakode["TOT"] == "2418"
+        assert KOFParser().tema_codes_mapping == KOFParser.tema_codes_mapping
+
+    def test_custom_codes_are_used_to_parse_and_write(self, tmp_path):
+        codes = tema_codes.copy()
+        codes.add("2430", MethodType.OTHER)
+        path = tmp_path / "file.kof"
+        path.write_bytes(
+            b" 05 SMPLOC1    2430     112893.150   1217079.460 2.000\n"
+            b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+        )
+        parser = KOFParser(tema_codes=codes)
+
+        [location] = parser.parse(path, 5110)
+        kof_string = KOFWriter(tema_codes=codes).writeKOF(uuid.uuid4(), "cool-name", [location], 5110)
+
+        assert location.methods == ["OTHER", "TOT"]
+        assert parser.parse_parallel(path, 5110, workers=2, chunk_size=10) == [location]
+        assert " 05 SMPLOC1    2430 " in kof_string and " 05 SMPLOC1    2418 " in kof_string
+        assert KOFParser().parse(path, 5110)[0].methods == ["TOT"]
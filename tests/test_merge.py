@@ -0,0 +1,94 @@
+import io
+
+import pytest
+from kof_generator import SyntheticKof
+
+from kof_parser import ExternalMerge, KOFParser, construct_location
+from kof_parser import merge as merge_module
+
+
+def locations_with_duplicates(count: int) -> list:
+    # Every fifth location has the name of a location far earlier, so names are merged across spills
+    return [
+        construct_location(f"P{i // 5 if i % 5 == 0 else i}", [f"M{i}"], float(i), float(i + 1), float(i % 7), 25832)
+        for i in range(count)
+    ]
+
+
+def merged_in_memory(locations: list) -> list:
+    return KOFParser._merge_locations(
+        construct_location(
+            location.name,
+            list(location.methods),
+            location.point_easting,
+            location.point_northing,
+            location.point_z,
+            location.srid,
+        )
+        for location in locations
+    )
+
+
+class TestExternalMerge:
+    def test_merge_in_memory(self, tmp_path):
+        locations = locations_with_duplicates(100)
+        merge = ExternalMerge(directory=tmp_path)
+
+        assert list(merge.merge(locations_with_duplicates(100))) == merged_in_memory(locations)
+        assert merge.spills == 0
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize("memory_budget, partitions", [(50 * 1600, 1), (50 * 1600, 7), (1, 3)])
+    def test_spilled_merge_matches_merge_in_memory(self, tmp_path, memory_budget, partitions):
+        locations = locations_with_duplicates(1000)
+        merge = ExternalMerge(memory_budget=memory_budget, partitions=partitions, directory=tmp_path)
+
+        assert list(merge.merge(locations_with_duplicates(1000))) == merged_in_memory(locations)
+        assert merge.spills > 1
+        assert list(tmp_path.iterdir()) == [], "The temporary files are removed"
+
+    def test_partitions_are_merged_in_several_passes(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(merge_module, "MAX_OPEN_RUNS", 2)
+        locations = locations_with_duplicates(500)
+        merge = ExternalMerge(memory_budget=20 * 1600, partitions=9, directory=tmp_path)
+
+        assert list(merge.merge(locations_with_duplicates(500))) == merged_in_memory(locations)
+
+    def test_temporary_files_are_removed_when_iteration_stops(self, tmp_path):
+        merged = ExternalMerge(memory_budget=1, partitions=4, directory=tmp_path).merge(locations_with_duplicates(100))
+
+        assert next(merged).name == "P0"
+        assert list(tmp_path.iterdir()) != []
+        merged.close()
+        assert list(tmp_path.iterdir()) == []
+
+    def test_partitions_for(self):
+        assert ExternalMerge.partitions_for(0, 64 * 1024 * 1024) == 1
+        assert ExternalMerge.partitions_for(6 * 1024 * 1024 * 1024, 64 * 1024 * 1024) == merge_module.MAX_PARTITIONS
+        assert 1 < ExternalMerge.partitions_for(100 * 1024 * 1024, 64 * 1024 * 1024) < merge_module.MAX_PARTITIONS
+
+
+class TestIterParseMerged:
+    @pytest.mark.parametrize(
+        "kof",
+        [
+            SyntheticKof(points=2000, duplicate_ratio=0.5),
+            SyntheticKof(points=2000, duplicate_ratio=0.3, north_east=True, srid=23032),
+            SyntheticKof(points=2000, duplicate_ratio=0.3, encoding="utf-8"),
+        ],
+    )
+    @pytest.mark.parametrize("memory_budget", [64 * 1024 * 1024, 100 * 1600])
+    def test_matches_parse(self, tmp_path, kof, memory_budget):
+        data = kof.generate()
+
+        locations = KOFParser().iter_parse_merged(
+            io.BytesIO(data), result_srid=25832, memory_budget=memory_budget, temporary_directory=tmp_path
+        )
+
+        assert list(locations) == KOFParser().parse(io.BytesIO(data), result_srid=25832)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_file_path(self):
+        locations = KOFParser().iter_parse_merged("tests/data/KOF_from_ArcGIS.kof", result_srid=25832, memory_budget=1)
+
+        assert list(locations) == KOFParser().parse("tests/data/KOF_from_ArcGIS.kof", result_srid=25832)
@@ -1,7 +1,33 @@
+import asyncio
+import io
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from kof_parser import KOFParser, exceptions
+from kof_parser import (
+    Diagnostic,
+    DiskParseCache,
+    KOFParser,
+    MemoryParseCache,
+    ParseCache,
+    ParseStats,
+    exceptions,
+    projector,
+)
 from kof_parser.enums import MethodType
+from kof_parser.kof import TemaCodes, tema_codes
+from kof_parser.parser import FALLBACK_CHAR_SET, ParseContext
+
+
+def parse_locations(parser, *args, document=False, **kwargs):
+    """
+    Parse with `parse()`, or with `parse_document()` if `document` is True, which splits the lines as bytes
+    """
+    if document:
+        return parser.parse_document(*args, **kwargs).locations
+    return parser.parse(*args, **kwargs)
 
 
 class TestParse:
@@ -115,3 +141,773 @@ class TestParse:
             match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
         ):
             parser.parse("tests/data/kof-with-tabs.kof", srid)
+
+    def test_merge_locations_with_same_name(self):
+        kof = (
+            " 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+            " 05 SMPLOC2    2407     112891.880   1217073.010 0.000\n"
+            " 05 SMPLOC1    2407     112894.150   1217080.460 3.000\n"
+        )
+        parser = KOFParser()
+
+        locations = parser.parse(io.BytesIO(kof.encode()), 5110)
+
+        assert [location.name for location in locations] == ["SMPLOC1", "SMPLOC2"]
+        [location1, location2] = locations
+        assert location1.methods == ["TOT", "CPT"]
+        assert location1.point_easting == 112894.150
+        assert location1.point_northing == 1217080.460
+        assert location1.point_z == 3.000
+        assert location2.methods == ["CPT"]
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/ED50_UTM32_EN.kof", 23032, 25833),
+            ("tests/data/KOF_from_ArcGIS.kof", 5110, 25832),
+            ("tests/data/UTM32_NE.kof", 25832, 23031),
+        ],
+    )
+    def test_batched_transformation_matches_per_point_transformation(self, file_name, kof_srid, proj_srid):
+        parser = KOFParser()
+
+        untransformed = parser.parse(file_name, result_srid=kof_srid, file_srid=kof_srid)
+        locations = parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+
+        assert len(locations) == len(untransformed)
+        for location, original in zip(locations, untransformed):
+            expected = projector.transform(kof_srid, proj_srid, original.point_easting, original.point_northing)
+            assert (location.point_easting, location.point_northing) == pytest.approx(expected)
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/test.kof", None, 5110),
+            ("tests/data/UTM32_NE.kof", None, 25833),
+            ("tests/data/15-5-18-Fossegata_windows.kof", None, 23031),
+            ("tests/data/ED50_UTM32_EN.kof", 23032, 25833),
+        ],
+    )
+    def test_iter_parse_merge_consecutive_matches_parse(self, file_name, kof_srid, proj_srid):
+        parser = KOFParser()
+
+        locations = parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+        iterated_locations = list(
+            parser.iter_parse(
+                file_name, result_srid=proj_srid, file_srid=kof_srid, merge_consecutive=True, batch_size=10
+            )
+        )
+
+        assert iterated_locations == locations
+
+    def test_iter_parse_yields_one_location_per_line(self):
+        kof = (
+            " 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+            " 05 SMPLOC1    2407     112894.150   1217080.460 3.000\n"
+            " 05 SMPLOC2    2407     112891.880   1217073.010 0.000\n"
+            " 05 SMPLOC1    2406     112895.150   1217081.460 4.000\n"
+        )
+        parser = KOFParser()
+
+        lines = list(parser.iter_parse(io.BytesIO(kof.encode()), 5110))
+        merged = list(parser.iter_parse(io.BytesIO(kof.encode()), 5110, merge_consecutive=True))
+
+        assert [(location.name, location.methods) for location in lines] == [
+            ("SMPLOC1", ["TOT"]),
+            ("SMPLOC1", ["CPT"]),
+            ("SMPLOC2", ["CPT"]),
+            ("SMPLOC1", ["RP"]),
+        ]
+        assert [(location.name, location.methods, location.point_z) for location in merged] == [
+            ("SMPLOC1", ["TOT", "CPT"], 3.0),
+            ("SMPLOC2", ["CPT"], 0.0),
+            ("SMPLOC1", ["RP"], 4.0),
+        ]
+
+    def test_iter_parse_err_file_containing_tabs(self):
+        parser = KOFParser()
+
+        locations = parser.iter_parse("tests/data/kof-with-tabs.kof", 25832, batch_size=1)
+
+        assert next(locations).name == "14"
+        with pytest.raises(
+            exceptions.ParseError,
+            match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
+        ):
+            next(locations)
+
+    @pytest.mark.parametrize(
+        "file_name", ["tests/data/15-5-18-Fossegata_linux.kof", "tests/data/15-5-18-Fossegata_windows.kof"]
+    )
+    @pytest.mark.parametrize("charset_sample_size", [None, 64 * 1024])
+    def test_parse_non_seekable_stream(self, file_name, charset_sample_size):
+        with open(file_name, "rb") as f:
+            data = f.read()
+        expected = KOFParser().parse(file_name, 23031)
+
+        locations = KOFParser(charset_sample_size=charset_sample_size).parse(NonSeekableStream(data), 23031)
+
+        assert locations == expected
+
+    @pytest.mark.parametrize(
+        "data, expected_encoding",
+        [
+            (b" 00 ascii\n" * 100, FALLBACK_CHAR_SET),
+            (b" 00 ascii\n" * 100 + " 00 Innmålt\n".encode("utf-8"), FALLBACK_CHAR_SET),
+            (" 00 Innmålt\n".encode("utf-8") * 100, FALLBACK_CHAR_SET),
+            (b" 00 ascii\n" * 100 + " 00 Innmålt øst\n".encode("iso-8859-15"), None),
+        ],
+    )
+    def test_detect_char_set_from_sample(self, data, expected_encoding):
+        file = io.BytesIO(data)
+        file.seek(5)
+        whole_file_encoding = KOFParser(charset_sample_size=None).detect_char_set_from_file(file)
+
+        encoding = KOFParser(charset_sample_size=100).detect_char_set_from_file(file)
+
+        assert encoding == (expected_encoding or whole_file_encoding)
+        assert file.tell() == 5, "File position is restored"
+
+    @pytest.mark.parametrize(
+        "head, encoding",
+        [
+            ("SMPLOC0", "utf-8"),
+            ("Innmålt", "utf-8"),
+            ("Innmålt", "iso-8859-15"),
+        ],
+    )
+    def test_parse_characters_after_charset_sample(self, tmp_path, head, encoding):
+        line = b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+        path = tmp_path / "file.kof"
+        path.write_bytes(
+            f" 05 {head:<10} 2418\n".encode("utf-8")
+            + line * 2000
+            + " 05 Brø        2418\n".encode(encoding)
+            + line * 2000
+        )
+
+        locations = KOFParser().parse(path, result_srid=5110)
+
+        assert [location.name for location in locations] == [head, "SMPLOC1", "Brø"]
+
+    def test_aparse_characters_after_charset_sample(self):
+        line = b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+        data = line * 2000 + " 05 Brø        2418\n".encode("utf-8") + " 05 Vår        2418\n".encode("iso-8859-15")
+
+        async def chunks():
+            for start in range(0, len(data), 1024):
+                yield data[start : start + 1024]
+
+        locations = asyncio.run(KOFParser().aparse(chunks(), 5110))
+
+        assert [location.name for location in locations] == ["SMPLOC1", "Brø", "Vår"]
+
+    def test_undecodable_line_raises_parse_error(self):
+        file = io.BytesIO(b" 05 SMPLOC1\n" * 10 + b" 05 \xff\n")
+        context = ParseContext(encoding="ascii")
+
+        with pytest.raises(exceptions.ParseError, match="on line 1 - 'ascii' codec can't decode byte 0xff"):
+            list(KOFParser()._iter_text_lines(file, context))
+
+    def test_iter_records(self):
+        data = (
+            b" 00 Oppdrag\n"
+            b" 01 EXP          31012022   2      22 0000 $21100000000           NN\n"
+            b" 09_91\n"
+            b" 05 SK1        2407       6589000.000  594000.000   10.000\n"
+            b" 05 SK2        2407       6589010.000  594010.000\n"
+            b" 09_99\n"
+            b" 03 Other\n"
+        )
+
+        records = [
+            (line_number, spec.record_type, fields)
+            for line_number, spec, fields in KOFParser().iter_records(io.BytesIO(data))
+        ]
+
+        assert records == [
+            (1, "00", ("Oppdrag",)),
+            (2, "01", ("EXP", "31012022", "2", "22", "0000", "$21100000000 ", "NN")),
+            (3, "09", ("91",)),
+            (4, "05", ("SK1", "2407", 6589000.0, 594000.0, 10.0)),
+            (5, "05", ("SK2", "2407", 6589010.0, 594010.0, None)),
+            (6, "09", ("99",)),
+        ]
+
+    def test_iter_records_err_line_number(self):
+        data = b" 00 Oppdrag\n 05 SK1        2407       6589x00.000\n"
+
+        with pytest.raises(exceptions.ParseError, match="on line 2 - could not convert string to float"):
+            list(KOFParser().iter_records(io.BytesIO(data)))
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/test.kof", None, 5110),
+            ("tests/data/KOF_from_ArcGIS.kof", 5110, 25832),
+            ("tests/data/15-5-18-Fossegata_linux.kof", None, 23031),
+        ],
+    )
+    def test_parse_without_validation(self, file_name, kof_srid, proj_srid):
+        parser = KOFParser()
+
+        locations = parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+        unvalidated_locations = parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid, validate=False)
+
+        assert unvalidated_locations == locations
+        assert [location.model_dump() for location in unvalidated_locations] == [
+            location.model_dump() for location in locations
+        ]
+        parser.validate_locations(unvalidated_locations)
+
+    def test_validate_locations(self):
+        kof = " 05 SMPLOC1    2418     112893.150   1217079.460 99999.000\n"
+        parser = KOFParser()
+
+        with pytest.raises(exceptions.ParseError, match="Error parsing KOF file on line 1 - 1 validation error"):
+            parser.parse(io.BytesIO(kof.encode()), 5110)
+
+        [location] = parser.parse(io.BytesIO(kof.encode()), 5110, validate=False)
+        assert location.point_z == 99999.0
+        with pytest.raises(exceptions.ParseError, match="Invalid location SMPLOC1 - 1 validation error"):
+            parser.validate_locations([location])
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/test.kof", None, 5110),
+            ("tests/data/UTM32_NE.kof", None, 25833),
+            ("tests/data/KOF_from_ArcGIS.kof", 5110, 25832),
+            ("tests/data/15-5-18-Fossegata_linux.kof", None, 23031),
+        ],
+    )
+    def test_parse_columnar_matches_parse(self, file_name, kof_srid, proj_srid):
+        parser = KOFParser()
+
+        locations = parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+        columns = parser.parse_columnar(file_name, result_srid=proj_srid, file_srid=kof_srid)
+
+        assert len(columns) == len(locations)
+        assert list(columns.to_locations()) == locations
+        assert columns.easting.typecode == "d"
+        assert list(columns.srid) == [proj_srid] * len(locations)
+
+    def test_parse_columnar_methods_and_missing_values(self):
+        kof = (
+            " 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+            " 05 SMPLOC2    2407\n"
+            " 05 SMPLOC1    2407     112894.150   1217080.460\n"
+            " 05 SMPLOC3\n"
+            " 05 SMPLOC2    2406\n"
+        )
+
+        columns = KOFParser().parse_columnar(io.BytesIO(kof.encode()), 5110)
+
+        assert columns.names == ["SMPLOC1", "SMPLOC2", "SMPLOC3"]
+        assert columns.method_values == ["TOT", "CPT", "CPT", "RP"]
+        assert list(columns.method_offsets) == [0, 2, 4, 4]
+        assert columns.get_methods(1) == ["CPT", "RP"]
+        assert columns.easting[0] == 112894.150
+        assert math.isnan(columns.z[0])
+        assert math.isnan(columns.northing[2])
+
+    def test_parse_columnar_err_file_containing_tabs(self):
+        with pytest.raises(
+            exceptions.ParseError,
+            match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
+        ):
+            KOFParser().parse_columnar("tests/data/kof-with-tabs.kof", 25832)
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/test.kof", None, 5110),
+            ("tests/data/UTM32_NE.kof", None, 25833),
+            ("tests/data/KOF_from_ArcGIS.kof", 5110, 25832),
+            ("tests/data/Innmålt_UTM32.kof", None, 25833),
+            ("tests/data/15-5-18-Fossegata_linux.kof", None, 23031),
+            ("tests/data/15-5-18-Fossegata_windows.kof", None, 23031),
+        ],
+    )
+    def test_parse_document_matches_parse(self, file_name, kof_srid, proj_srid):
+        parser = KOFParser()
+
+        locations = parser.parse_document(file_name, result_srid=proj_srid, file_srid=kof_srid).locations
+
+        assert locations == parser.parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+
+    @pytest.mark.parametrize(
+        "kof, encoding",
+        [
+            (" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\r\n 05 SMPLOC2    2407\r\n", "ascii"),
+            (" 05 Prøve1     2418     112893.150   1217079.460 2.000\r\n 05 SMPLOC1\n", "iso-8859-15"),
+            (" 05 Prøve1     2418     112893.150   1217079.460 2.000\n 05 Prøve2     2407  1.0  2.0", "utf-8"),
+            (" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\r 05 SMPLOC2    2407\r", "ascii"),
+            ("", "ascii"),
+        ],
+    )
+    def test_parse_document_line_endings_and_encodings(self, tmp_path, kof, encoding):
+        path = tmp_path / "file.kof"
+        path.write_bytes(kof.encode(encoding))
+        parser = KOFParser()
+
+        locations = parser.parse_document(path, result_srid=5110).locations
+
+        assert locations == parser.parse(path, result_srid=5110)
+
+    def test_parse_document_errors_match_parse(self, tmp_path):
+        path = tmp_path / "file.kof"
+        path.write_bytes(b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n 05 SMPLOC2    2407     1x3\n")
+        parser = KOFParser()
+
+        with pytest.raises(exceptions.ParseError) as expected:
+            parser.parse(path, result_srid=5110)
+        with pytest.raises(exceptions.ParseError) as error:
+            parser.parse_document(path, result_srid=5110)
+
+        assert str(error.value) == str(expected.value)
+        assert "on line 2 - could not convert string to float: '1x3\\n'" in str(error.value)
+
+    def test_parse_document_err_file_containing_tabs(self):
+        with pytest.raises(
+            exceptions.ParseError,
+            match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
+        ):
+            KOFParser().parse_document("tests/data/kof-with-tabs.kof", 25832)
+
+    def test_parse_cache_returns_unchanged_file(self, monkeypatch):
+        data = kof_with_points(0, 200)
+        cache = MemoryParseCache()
+        parser = KOFParser()
+        expected = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+        expected[0].methods.append("CPT")
+        calls = count_coordinate_lines(monkeypatch)
+
+        locations = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+
+        assert calls == []
+        assert locations == parser.parse(io.BytesIO(data), result_srid=25832)
+        assert locations[0].methods == ["TOT", "INC"], "Changing a returned location does not change the cache"
+
+    @pytest.mark.parametrize("cache_type", ["memory", "disk"])
+    def test_parse_cache_parses_appended_lines_only(self, monkeypatch, tmp_path, cache_type):
+        cache = MemoryParseCache() if cache_type == "memory" else DiskParseCache(tmp_path)
+        parser = KOFParser()
+        parser.parse(io.BytesIO(kof_with_points(0, 200)), result_srid=25832, cache=cache)
+        data = kof_with_points(0, 250)
+        calls = count_coordinate_lines(monkeypatch)
+
+        locations = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+
+        assert len(calls) == 50
+        assert locations == KOFParser().parse(io.BytesIO(data), result_srid=25832)
+
+    def test_parse_cache_parses_appended_latin_9_lines_only(self, monkeypatch):
+        cache = MemoryParseCache()
+        parser = KOFParser()
+        data = kof_with_points(0, 200) + " 05 Brønn      2418\n".encode("iso-8859-15")
+        monkeypatch.setattr(KOFParser, "detect_char_set_from_file", lambda self, file: "iso-8859-15")
+        parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+        data += " 05 Vår€       2418\n 05 Øst        2418\n".encode("iso-8859-15")
+        # Detecting the character set of the longer file names another one for the same bytes
+        monkeypatch.setattr(KOFParser, "detect_char_set_from_file", lambda self, file: "cp775")
+        calls = count_coordinate_lines(monkeypatch)
+
+        locations = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+
+        assert len(calls) == 2
+        assert [location.name for location in locations[-3:]] == ["Brønn", "Vår€", "Øst"]
+
+    def test_parse_cache_parses_file_when_appended_lines_do_not_decode(self, monkeypatch):
+        cache = MemoryParseCache()
+        parser = KOFParser()
+        data = kof_with_points(0, 200) + " 05 Brønn      2418\n".encode("utf-8")
+        monkeypatch.setattr(KOFParser, "detect_char_set_from_file", lambda self, file: "utf-8")
+        parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+        data += " 05 Øst        2418\n".encode("iso-8859-15")
+        monkeypatch.setattr(KOFParser, "detect_char_set_from_file", lambda self, file: FALLBACK_CHAR_SET)
+        calls = count_coordinate_lines(monkeypatch)
+
+        locations = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+
+        assert len(calls) == 202
+        assert [location.name for location in locations[-2:]] == ["Brønn", "Øst"]
+
+    def test_parse_cache_parses_changed_file(self, monkeypatch):
+        cache = MemoryParseCache()
+        parser = KOFParser()
+        parser.parse(io.BytesIO(kof_with_points(0, 200)), result_srid=25832, cache=cache)
+        data = kof_with_points(0, 199) + kof_with_points(1000, 1001, header=False)
+        calls = count_coordinate_lines(monkeypatch)
+
+        locations = parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+
+        assert len(calls) == 200
+        assert locations == KOFParser().parse(io.BytesIO(data), result_srid=25832)
+
+    def test_parse_cache_is_keyed_by_parameters(self, tmp_path):
+        path = tmp_path / "file.kof"
+        path.write_bytes(kof_with_points(0, 200))
+        cache = MemoryParseCache()
+        parser = KOFParser()
+
+        for result_srid, swap_easting_northing in [(25832, False), (25833, False), (25832, True), (25832, False)]:
+            locations = parser.parse(
+                path, result_srid=result_srid, swap_easting_northing=swap_easting_northing, cache=cache
+            )
+            assert locations == parser.parse(path, result_srid=result_srid, swap_easting_northing=swap_easting_northing)
+        assert len(cache) == 3
+
+    @pytest.mark.parametrize("cache_type", ["memory", "disk"])
+    def test_parse_cache_is_keyed_by_tema_codes(self, tmp_path, cache_type):
+        data = b" 05 SMPLOC1    2430     112893.150   1217079.460 2.000\n 05 SMPLOC1    2401\n"
+        cache = MemoryParseCache() if cache_type == "memory" else DiskParseCache(tmp_path)
+        codes = tema_codes.copy()
+        parser = KOFParser(tema_codes=codes)
+
+        assert parser.parse(io.BytesIO(data), 25832, cache=cache)[0].methods == ["RWS"]
+        codes.add("2430", MethodType.OTHER)
+        assert parser.parse(io.BytesIO(data), 25832, cache=cache)[0].methods == ["OTHER", "RWS"]
+        assert KOFParser(tema_codes=TemaCodes()).parse(io.BytesIO(data), 25832, cache=cache)[0].methods == []
+        codes.remove("2430")
+        assert parser.parse(io.BytesIO(data), 25832, cache=cache)[0].methods == ["RWS"]
+
+    def test_parse_cache_evicts_least_recently_used(self):
+        cache = MemoryParseCache(maxsize=2)
+        parser = KOFParser()
+
+        for start in [0, 1000, 2000, 3000]:
+            parser.parse(io.BytesIO(kof_with_points(start, start + 200)), result_srid=25832, cache=cache)
+
+        assert len(cache) == 2
+
+    def test_parse_cache_err_backend_without_set(self):
+        class ReadOnlyCache(ParseCache):
+            def get(self, key):
+                return None
+
+        with pytest.raises(TypeError, match="abstract method"):
+            ReadOnlyCache()
+
+    def test_parse_cache_err_appended_line_number(self):
+        cache = MemoryParseCache()
+        parser = KOFParser()
+        data = kof_with_points(0, 200)
+        parser.parse(io.BytesIO(data), result_srid=25832, cache=cache)
+        number_of_lines = data.count(b"\n")
+
+        with pytest.raises(
+            exceptions.ParseError,
+            match=f"Error parsing KOF file on line {number_of_lines + 2} - KOF file contains tabs",
+        ):
+            parser.parse(
+                io.BytesIO(data + kof_with_points(200, 201, header=False) + b" 05 TAB\t\n"), 25832, cache=cache
+            )
+
+    @pytest.mark.parametrize("document", [False, True])
+    def test_parse_stats(self, document):
+        stats = ParseStats()
+
+        locations = parse_locations(
+            KOFParser(), "tests/data/15-5-18-Fossegata_windows.kof", 25832, document=document, stats=stats
+        )
+
+        assert (stats.lines, stats.bytes_read, stats.points, stats.locations, stats.errors) == (12, 624, 6, 6, 0)
+        assert len(locations) == stats.locations
+        assert stats.transform_seconds > 0
+        assert stats.parse_seconds > 0 and stats.construct_seconds > 0
+        assert stats.total_seconds == pytest.approx(
+            stats.detect_seconds
+            + stats.read_seconds
+            + stats.parse_seconds
+            + stats.construct_seconds
+            + stats.transform_seconds
+            + stats.merge_seconds
+        )
+
+    def test_parse_stats_add_up(self):
+        stats = ParseStats()
+        parser = KOFParser()
+
+        parser.parse("tests/data/test.kof", 5110, stats=stats)
+        with open("tests/data/test.kof", "rb") as f:
+            parser.parse(NonSeekableStream(f.read()), 5110, stats=stats)
+        with pytest.raises(exceptions.ParseError):
+            parser.parse("tests/data/kof-with-tabs.kof", 5110, stats=stats)
+
+        assert (stats.lines, stats.points, stats.locations, stats.errors) == (2 * 9 + 3, 2 * 7 + 2, 14, 1)
+        assert stats.bytes_read == 2 * 560, "The bytes read are counted for complete parses"
+
+    def test_parse_stats_are_sampled(self):
+        stats = ParseStats()
+
+        KOFParser().parse(io.BytesIO(kof_with_points(0, 100)), 25832, stats=stats)
+
+        assert stats.points == 100
+        assert stats.parse_seconds > 0 and stats.construct_seconds > 0
+
+    @pytest.mark.parametrize("document", [False, True])
+    def test_parse_lenient_repairs_tabs(self, document):
+        diagnostics = []
+
+        locations = parse_locations(
+            KOFParser(), "tests/data/kof-with-tabs.kof", 25832, document=document, diagnostics=diagnostics
+        )
+
+        assert [(location.name, location.point_easting, location.point_northing) for location in locations] == [
+            ("14", 598993.753, 7023003.489),
+            ("15", 599001.246, 7023231.981),
+            ("2", 596889.839, 7023286.401),
+            ("3", 596884.579, 7023991.712),
+        ]
+        assert [(diagnostic.line_number, diagnostic.field, diagnostic.repaired) for diagnostic in diagnostics] == [
+            (3, None, True),
+            (4, None, True),
+            (5, None, True),
+        ]
+        assert diagnostics[0].reason == "Tabs expanded to spaces, and fields split on whitespace"
+
+    @pytest.mark.parametrize("document", [False, True])
+    def test_parse_lenient_skips_bad_lines(self, tmp_path, document):
+        path = tmp_path / "file.kof"
+        path.write_bytes(
+            b" 01 EXP          31012022   2     X32 0000 $21100000000           NN\n"
+            b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+            b" 05 SMPLOC2    2407     1x3          1217079.460 2.000\n"
+            b" 05 SMPLOC3    2407     112893.150   1217079.460 99999.000\n"
+            b" 05 SMPLOC4    2407     112893.150   1217079.460 3.000\n"
+        )
+        diagnostics = []
+
+        locations = parse_locations(KOFParser(), path, 5110, document=document, diagnostics=diagnostics)
+
+        assert [location.name for location in locations] == ["SMPLOC1", "SMPLOC4"]
+        assert diagnostics == [
+            Diagnostic(1, "coordinate_system", "Invalid coordinate system 'X32'"),
+            Diagnostic(3, "easting", "Invalid number '1x3'"),
+            Diagnostic(4, "z", "Input should be less than or equal to 10000"),
+        ]
+        with pytest.raises(exceptions.ParseError, match="on line 1"):
+            parse_locations(KOFParser(), path, 5110, document=document)
+
+    def test_parse_lenient_cache_keeps_diagnostics(self, tmp_path):
+        cache = DiskParseCache(tmp_path)
+        parser = KOFParser()
+        data = kof_with_points(0, 200) + b" 05 BAD        2418     1x3\n"
+        expected = []
+        parser.parse(io.BytesIO(data), 25832, cache=cache, diagnostics=expected)
+        diagnostics = []
+
+        locations = parser.parse(io.BytesIO(data), 25832, cache=cache, diagnostics=diagnostics)
+
+        assert diagnostics == expected == [Diagnostic(202, "easting", "Invalid number '1x3'")]
+        assert len(locations) == 100
+        with pytest.raises(exceptions.ParseError, match="on line 202"):
+            parser.parse(io.BytesIO(data), 25832, cache=cache)
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_parse_many(self, workers):
+        file_names = [
+            "tests/data/UTM32_NE.kof",
+            "tests/data/test.kof",
+            "tests/data/kof-with-tabs.kof",
+            "tests/data/does-not-exist.kof",
+            "tests/data/15-5-18-Fossegata_windows.kof",
+        ]
+
+        results = KOFParser().parse_many(file_names, result_srid=25832, workers=workers)
+
+        assert len(results) == len(file_names)
+        for file_name, result in zip(file_names[:2] + file_names[4:], results[:2] + results[4:]):
+            assert result == KOFParser().parse(file_name, result_srid=25832)
+        assert isinstance(results[2], exceptions.ParseError)
+        assert "kof-with-tabs.kof - Error parsing KOF file on line 3" in str(results[2])
+        assert isinstance(results[3], exceptions.ParseError)
+        assert "does-not-exist.kof" in str(results[3])
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_parse_parallel_matches_parse(self, tmp_path, workers):
+        path = tmp_path / "file.kof"
+        path.write_bytes(
+            kof_with_points(0, 300)
+            + b" 01 EXP          31012022   2      23 0000 $21100000000           NN\r\n"
+            + kof_with_points(250, 500, header=False)
+            + b" 01 EXP          31012022   2      22 0000 $11100000000           NN\n"
+            + kof_with_points(100, 200, header=False)
+        )
+        parser = KOFParser()
+
+        locations = parser.parse_parallel(path, result_srid=25832, workers=workers, chunk_size=1000)
+
+        assert locations == parser.parse(path, result_srid=25832)
+        assert len(locations) == 250
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_parse_parallel_errors_match_parse(self, tmp_path, workers):
+        path = tmp_path / "file.kof"
+        path.write_bytes(kof_with_points(0, 300) + b" 05 SMPLOC2    2407     1x3\n" + kof_with_points(300, 400))
+        parser = KOFParser()
+
+        with pytest.raises(exceptions.ParseError) as expected:
+            parser.parse(path, result_srid=25832)
+        with pytest.raises(exceptions.ParseError) as error:
+            parser.parse_parallel(path, result_srid=25832, workers=workers, chunk_size=1000)
+
+        assert str(error.value) == str(expected.value)
+        assert "on line 302 - could not convert string to float" in str(error.value)
+
+    @pytest.mark.parametrize(
+        "file_name",
+        ["tests/data/Innmålt_UTM32.kof", "tests/data/UTM32_NE.kof", "tests/data/15-5-18-Fossegata_windows.kof"],
+    )
+    def test_parse_parallel_data_files(self, file_name):
+        parser = KOFParser()
+
+        locations = parser.parse_parallel(file_name, result_srid=25832, workers=2, chunk_size=100)
+
+        assert locations == parser.parse(file_name, result_srid=25832)
+
+    def test_parse_parallel_err_file_containing_tabs(self):
+        with pytest.raises(
+            exceptions.ParseError,
+            match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
+        ):
+            KOFParser().parse_parallel("tests/data/kof-with-tabs.kof", 25832, workers=2, chunk_size=100)
+
+    def test_parse_parallel_carriage_return_line_endings(self, tmp_path):
+        path = tmp_path / "file.kof"
+        path.write_bytes(kof_with_points(0, 100).replace(b"\n", b"\r"))
+        parser = KOFParser()
+
+        locations = parser.parse_parallel(path, result_srid=25832, workers=2, chunk_size=1000)
+
+        assert locations == parser.parse(path, result_srid=25832)
+        assert len(locations) == 50
+
+    def test_parse_from_many_threads(self):
+        """
+        One parser shared between threads gives the same results as parsing the files one by one
+        """
+        parser = KOFParser()
+        tasks = [
+            ("tests/data/UTM32_NE.kof", 25833),
+            ("tests/data/UTM33_EN.kof", 25832),
+            ("tests/data/test.kof", 5110),
+            ("tests/data/ED50_UTM32_EN.kof", 25832),
+            ("tests/data/15-5-18-Fossegata_windows.kof", 23031),
+        ] * 40
+        expected = [KOFParser().parse(file_name, result_srid) for file_name, result_srid in tasks]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda task: parser.parse(*task), tasks))
+
+        assert results == expected
+
+    @pytest.mark.parametrize(
+        "file_name, kof_srid, proj_srid",
+        [
+            ("tests/data/test.kof", None, 5110),
+            ("tests/data/UTM32_NE.kof", None, 25833),
+            ("tests/data/KOF_from_ArcGIS.kof", 5110, 25832),
+            ("tests/data/15-5-18-Fossegata_linux.kof", None, 23031),
+            ("tests/data/15-5-18-Fossegata_windows.kof", None, 23031),
+        ],
+    )
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+    def test_aparse(self, file_name, kof_srid, proj_srid, chunk_size):
+        with open(file_name, "rb") as f:
+            data = f.read()
+        expected = KOFParser().parse(file_name, result_srid=proj_srid, file_srid=kof_srid)
+
+        async def chunks():
+            for start in range(0, len(data), chunk_size):
+                yield data[start : start + chunk_size]
+
+        locations = asyncio.run(KOFParser().aparse(chunks(), result_srid=proj_srid, file_srid=kof_srid, batch_size=3))
+
+        assert locations == expected
+
+    def test_aparse_detects_char_set_in_executor(self, monkeypatch):
+        threads = []
+        detect = KOFParser._detect_char_set_from_sample
+
+        def detect_in_thread(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return detect(*args, **kwargs)
+
+        monkeypatch.setattr(KOFParser, "_detect_char_set_from_sample", staticmethod(detect_in_thread))
+
+        async def chunks():
+            yield b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+
+        locations = asyncio.run(KOFParser().aparse(chunks(), 5110))
+
+        assert [location.name for location in locations] == ["SMPLOC1"]
+        assert threads and threading.get_ident() not in threads
+
+    def test_aparse_reader_err_file_containing_tabs(self):
+        class AsyncReader:
+            def __init__(self, data: bytes):
+                self.stream = io.BytesIO(data)
+
+            async def read(self, size: int) -> bytes:
+                return self.stream.read(size)
+
+        with open("tests/data/kof-with-tabs.kof", "rb") as f:
+            reader = AsyncReader(f.read())
+
+        with pytest.raises(
+            exceptions.ParseError,
+            match="Error parsing KOF file on line 3 - KOF file contains tabs, please convert to spaces.",
+        ):
+            asyncio.run(KOFParser().aparse(reader, 25832, batch_size=1))
+
+
+def kof_with_points(start: int, stop: int, header: bool = True) -> bytes:
+    """
+    A KOF file in ED50/UTM32 with northing/easting order and points P{start} to P{stop - 1}, where every name is used
+    twice
+    """
+    lines = []
+    if header:
+        lines.append(" 01 EXP          31012022   2      32 0000 $21100000000           NN\n")
+    for i in range(start, stop):
+        lines.append(
+            f" 05 {f'P{i // 2}':<10} {2418 - i % 2}     {6589314.813 + i:12.3f} {594219.239 + i:12.3f} 1.000\n"
+        )
+    return "".join(lines).encode()
+
+
+def count_coordinate_lines(monkeypatch) -> list[str]:
+    """
+    Record the coordinate lines parsed by any KOFParser
+    """
+    calls: list[str] = []
+    map_line_to_coordinate_block = KOFParser.map_line_to_coordinate_block
+
+    def record(self, line, *args, **kwargs):
+        calls.append(line)
+        return map_line_to_coordinate_block(self, line, *args, **kwargs)
+
+    monkeypatch.setattr(KOFParser, "map_line_to_coordinate_block", record)
+    return calls
+
+
+class NonSeekableStream(io.RawIOBase):
+    """
+    Stream that can only be read from the start, a few bytes at the time, like a pipe or an HTTP body
+    """
+
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readinto(self, buffer):
+        data = self.stream.read(min(len(buffer), 7))
+        buffer[: len(data)] = data
+        return len(data)
@@ -0,0 +1,101 @@
+import pytest
+
+from kof_parser import (
+    ADMINISTRATIVE_RECORD,
+    COMMAND_RECORD,
+    COMMENT_RECORD,
+    COORDINATE_RECORD,
+    Column,
+    ParseError,
+    RecordSpec,
+    record_spec,
+)
+
+
+class TestRecordSpec:
+    @pytest.mark.parametrize(
+        "line, expected",
+        [
+            (
+                " 05 SK1        2407       6589000.000  594000.000   10.000             \n",
+                ("SK1", "2407", 6589000.0, 594000.0, 10.0),
+            ),
+            (" 05 SK1                   6589000.000  594000.000\n", ("SK1", "", 6589000.0, 594000.0, None)),
+            (" 05 SK1                               594000.000   10.000", ("SK1", "", None, 594000.0, 10.0)),
+            (" 05 SK1\n", ("SK1", "", None, None, None)),
+            (" 05", ("", "", None, None, None)),
+        ],
+    )
+    def test_split_coordinate_line(self, line, expected):
+        assert COORDINATE_RECORD.split(line) == expected
+        assert COORDINATE_RECORD.split_bytes(line.encode("ascii")) == expected
+        assert COORDINATE_RECORD.split_bytes(line.replace("\n", "\r\n").encode("ascii")) == expected
+
+    def test_split_administrative_line(self):
+        line = " 01 EXP          31012022   2      32 0000 $22100000000           NN\n"
+
+        fields = dict(zip(ADMINISTRATIVE_RECORD.fields, ADMINISTRATIVE_RECORD.split(line)))
+
+        assert fields == {
+            "project": "EXP",
+            "date": "31012022",
+            "version": "2",
+            "coordinate_system": "32",
+            "municipality": "0000",
+            "units": "$22100000000 ",
+            "observer": "NN",
+        }
+        assert ADMINISTRATIVE_RECORD.split_bytes(line.encode("ascii")) == tuple(fields.values())
+
+    def test_split_comment_line(self):
+        assert COMMENT_RECORD.split(" 00 Oppdrag  Dato\n") == ("Oppdrag  Dato",)
+        assert COMMENT_RECORD.split_bytes(b" 00 Oppdrag  Dato\r\n") == ("Oppdrag  Dato",)
+
+    def test_split_command_line(self):
+        assert COMMAND_RECORD.split(" 09_91\n") == ("91",)
+        assert COMMAND_RECORD.split_bytes(b" 09_99\r\n") == ("99",)
+
+    @pytest.mark.parametrize(
+        "line, expected",
+        [
+            (" 00 Oppdrag\n", COMMENT_RECORD),
+            (" 01 EXP\n", ADMINISTRATIVE_RECORD),
+            (" 05 SK1        2407\n", COORDINATE_RECORD),
+            (" 09_91\n", COMMAND_RECORD),
+            (" 09 91\n", None),
+            (" 03 Other\n", None),
+            ("\n", None),
+        ],
+    )
+    def test_record_spec(self, line, expected):
+        assert record_spec(line) is expected
+
+    def test_tabs_are_rejected(self):
+        with pytest.raises(ParseError, match="tabs"):
+            COORDINATE_RECORD.split(" 05 SK1\t2407 6589000.000 594000.000\n")
+
+    def test_invalid_number(self):
+        with pytest.raises(ValueError):
+            COORDINATE_RECORD.split(" 05 SK1        2407       6589x00.000  594000.000\n")
+
+    def test_custom_spec(self):
+        spec = RecordSpec(
+            "09", [Column("code", 4, 9), Column("value", 10, 16, kind="number"), Column("rest", 17, None)]
+        )
+
+        assert spec.split(" 09 _91     12.5 curve start\n") == ("_91", 12.5, "curve start")
+        assert spec.split_bytes(b" 09 _91     12.5 curve start") == ("_91", 12.5, "curve start")
+        assert spec.column("value") == Column("value", 10, 16, kind="number")
+
+    @pytest.mark.parametrize(
+        "columns",
+        [
+            [Column("a", 4, 10), Column("b", 8, 12)],
+            [Column("a", 4, 4)],
+            [Column("a", 4, None), Column("b", 10, 12)],
+            [Column("a", 4, 10, kind="date")],
+        ],
+    )
+    def test_invalid_columns(self, columns):
+        with pytest.raises(ValueError):
+            RecordSpec("05", columns)
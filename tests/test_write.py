@@ -1,8 +1,17 @@
+import asyncio
 import io
+import tempfile
 import uuid
 
+import pytest
+
+from kof_parser import Diagnostic
 from kof_parser import KOFParser
 from kof_parser import KOFWriter
+from kof_parser import Location
+from kof_parser import ParseStats
+from kof_parser import WriteStats
+from kof_parser import projector
 from kof_parser.enums import MethodType
 
 
@@ -32,6 +41,143 @@ class TestWrite:
         )
         assert " 05 SMPLOC2    2418       112893.150 1217079.460    2.000             " in kof_string
 
+    def test_write_transforms_locations_with_mixed_srids(self):
+        srid = 25833
+        locations = [
+            Location(name="UTM32", point_easting=594137.802, point_northing=6589107.923, point_z=1.0, srid=25832),
+            Location(name="NTM10", point_easting=112893.150, point_northing=1217079.460, point_z=2.0, srid=5110),
+            Location(name="UTM33", point_easting=253851.717, point_northing=6595967.833, point_z=3.0, srid=25833),
+            Location(name="UTM32B", point_easting=594219.239, point_northing=6589314.813, point_z=4.0, srid=25832),
+        ]
+
+        kof_string = KOFWriter().writeKOF(
+            project_id=uuid.uuid4(),
+            project_name="cool-name",
+            locations=locations,
+            srid=srid,
+            swap_easting_northing=True,
+        )
+
+        for location in locations:
+            x, y = location.point_easting, location.point_northing
+            if location.srid != srid:
+                x, y = projector.transform(location.srid, srid, x, y)
+            assert KOFWriter.create_kof_coordinate_block(location.name, "", y, x, location.point_z) in kof_string
+
+    def test_write_to_binary_stream(self):
+        srid = 5110
+        locations = [
+            Location(name="Innmålt", point_easting=112892.81, point_northing=1217083.64, point_z=1.0, srid=srid),
+            Location(name="SMPLOC2", point_easting=112893.15, point_northing=1217079.46, methods=["TOT"], srid=srid),
+        ]
+        kof_string = KOFWriter().writeKOF(
+            project_id="project_id", project_name="cool-name", locations=locations, srid=srid
+        )
+        stream = io.BytesIO()
+
+        KOFWriter().write_to(
+            stream,
+            project_id="project_id",
+            project_name="cool-name",
+            locations=(location for location in locations),
+            srid=srid,
+            batch_size=1,
+        )
+
+        kof_bytes = stream.getvalue()
+        assert " 05 Innmålt              1217083.640  112892.810    1.000".encode("iso-8859-15") in kof_bytes
+        assert without_export_date(kof_bytes.decode("iso-8859-15")) == without_export_date(kof_string)
+
+    @pytest.mark.parametrize("mode", ["w+", "w+b"])
+    def test_write_to_spooled_temporary_file(self, mode):
+        locations = [Location(name="Innmålt", point_easting=112892.81, point_northing=1217083.64, srid=5110)]
+
+        with tempfile.SpooledTemporaryFile(mode=mode) as stream:
+            KOFWriter().write_to(
+                stream, project_id="project_id", project_name="cool-name", locations=locations, srid=5110
+            )
+            stream.seek(0)
+            content = stream.read()
+
+        text = content.decode("iso-8859-15") if "b" in mode else content
+        assert " 05 Innmålt              1217083.640  112892.810" in text
+
+    def test_write_stats(self):
+        locations = KOFParser().parse("tests/data/KOF_from_ArcGIS.kof", 5110)
+        stats = WriteStats()
+
+        kof_string = KOFWriter().writeKOF(
+            project_id="project_id", project_name="cool-name", locations=locations, srid=25833, stats=stats
+        )
+
+        assert stats.locations == len(locations)
+        assert stats.lines == kof_string.count("\n") == 6 + sum(max(len(location.methods), 1) for location in locations)
+        assert stats.bytes_written == len(kof_string)
+        assert stats.transform_seconds > 0
+        assert stats.total_seconds == stats.transform_seconds + stats.format_seconds + stats.write_seconds
+
+    def test_write_to_binary_stream_stats(self):
+        locations = [Location(name="Innmålt", point_easting=112892.81, point_northing=1217083.64, srid=5110)]
+        stats = WriteStats()
+        stream = io.BytesIO()
+
+        for _ in range(2):
+            KOFWriter().write_to(
+                stream, project_id="project_id", project_name="cool-name", locations=locations, srid=5110, stats=stats
+            )
+
+        assert stats.locations == 2
+        assert stats.bytes_written == len(stream.getvalue())
+
+    def test_awrite(self):
+        srid = 25833
+        locations = KOFParser().parse("tests/data/KOF_from_ArcGIS.kof", 5110)
+        kof_string = KOFWriter().writeKOF(
+            project_id="project_id", project_name="cool-name", locations=locations, srid=srid
+        )
+
+        class AsyncWriter:
+            def __init__(self):
+                self.data = b""
+
+            async def write(self, data: bytes):
+                self.data += data
+
+        async def async_locations():
+            for location in locations:
+                yield location
+
+        writer = AsyncWriter()
+        asyncio.run(
+            KOFWriter().awrite(
+                writer,
+                project_id="project_id",
+                project_name="cool-name",
+                locations=async_locations(),
+                srid=srid,
+                batch_size=10,
+            )
+        )
+
+        assert without_export_date(writer.data.decode("iso-8859-15")) == without_export_date(kof_string)
+
+    def test_create_kof_coordinate_blocks_matches_create_kof_coordinate_block(self):
+        rows = [
+            ("SMPLOC1", "2418", 112892.81, 1217083.64, 1.0),
+            ("Innmålt", "", 0, 0, 0),
+            ("A name longer than ten", "2401", -594219.2391, -6589314.8135, -12.3456),
+            ("X", "TOOLONGCODE", 1.0, 2.0, 3.0),
+            ("Y", "2407", 123456789012.5, 6589314.813, 1.0),
+            ("Z", "2407", 594219.239, 12345678901234.5, 99999.999),
+            ("", "", 1e30, -1e30, float("nan")),
+        ]
+        ids, temakodes, xs, ys, zs = (list(column) for column in zip(*rows))
+
+        kof_string = KOFWriter.create_kof_coordinate_blocks(ids, temakodes, xs, ys, zs)
+
+        assert kof_string == "".join(KOFWriter.create_kof_coordinate_block(*row) for row in rows)
+        assert KOFWriter.create_kof_coordinate_blocks([], [], [], [], []) == ""
+
     def test_write_all_method_types(self):
         """
         Write all method types to kof file.
@@ -58,3 +204,189 @@ class TestWrite:
         assert len([method for method in location2.methods if method == "OTHER"]) == 0, (
             "There are seven methods we do not have a tema code for and are therefore mapped to 2430 OTHER"
         )
+
+
+def without_export_date(kof_string: str) -> list[str]:
+    return [line for line in kof_string.splitlines() if not line.startswith(" 00 Export date")]
+
+
+def write_document(document) -> bytes:
+    stream = io.BytesIO()
+    KOFWriter().write_document(document, stream)
+    return stream.getvalue()
+
+
+def changed_lines(before: bytes, after: bytes) -> list[tuple[bytes, bytes]]:
+    return [
+        (old, new)
+        for old, new in zip(before.splitlines(keepends=True), after.splitlines(keepends=True), strict=True)
+        if old != new
+    ]
+
+
+class TestWriteDocument:
+    @pytest.mark.parametrize(
+        "file",
+        [
+            "15-5-18-Fossegata_linux.kof",
+            "15-5-18-Fossegata_windows.kof",
+            "ED50_UTM32_EN.kof",
+            "Innmålt_UTM32.kof",
+            "KOF_from_ArcGIS.kof",
+            "UTM32_NE.kof",
+            "UTM33_EN.kof",
+            "import_template.kof",
+            "test.kof",
+        ],
+    )
+    def test_unchanged_document_is_written_as_it_was_read(self, file):
+        with open(f"tests/data/{file}", "rb") as f:
+            source = f.read()
+
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=4326)
+
+        assert document.locations == KOFParser().parse(io.BytesIO(source), result_srid=4326)
+        assert document.line_count == len(source.splitlines())
+        assert write_document(document) == source
+
+    def test_changed_location_replaces_its_line_only(self):
+        with open("tests/data/15-5-18-Fossegata_linux.kof", "rb") as f:
+            source = f.read().replace(b"\n", b"\r\n")
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        document.locations[2].point_z = 12.5
+
+        written = write_document(document)
+
+        [(old, new)] = changed_lines(document.source, written)
+        assert new.endswith(b"\r\n"), "The line ending of the replaced line is kept"
+        assert new.split()[:-1] == old.split()[:-1]
+        assert float(new.split()[-1]) == 12.5
+        assert KOFParser().parse(io.BytesIO(written), result_srid=25832) == document.locations
+
+    def test_changed_location_is_written_in_the_coordinate_system_of_its_line(self):
+        document = KOFParser().parse_document("tests/data/ED50_UTM32_EN.kof", result_srid=4326)
+        assert document.source_srids.tolist() == [23032]
+        document.locations[0].point_z = 3.0
+
+        written = write_document(document)
+
+        [(old, new)] = changed_lines(document.source, written)
+        assert new[:49] == old[:49]
+        assert float(new[49:58]) == 3.0
+
+    def test_removed_and_new_locations(self):
+        document = KOFParser().parse_document("tests/data/KOF_from_ArcGIS.kof", result_srid=25832)
+        removed = document.locations.pop(5)
+        new = Location(
+            name="NEW", methods=["CPT"], point_easting=594000.0, point_northing=6589000.0, point_z=2.0, srid=25832
+        )
+        document.locations.append(new)
+
+        written = write_document(document)
+
+        assert removed.name.encode() not in written
+        assert written.startswith(document.source[: document.line_offsets[document.coordinate_lines[5]]])
+        assert len(written.splitlines()) == len(document.source.splitlines())
+        locations = KOFParser().parse(io.BytesIO(written), result_srid=25832)
+        assert [location.name for location in locations] == [location.name for location in document.locations]
+        assert locations[-1].methods == ["CPT"]
+        assert (locations[-1].point_easting, locations[-1].point_northing) == pytest.approx((594000.0, 6589000.0))
+
+    def test_location_with_several_lines(self):
+        source = (
+            b" 00 Comment\n"
+            b" 01 EXP          31012022   2      22 0000 $21100000000           NN\n"
+            b" 05 SK1        2407       6589000.000 594000.000   10.000\n"
+            b" 05 SK2        2407       6589010.000 594010.000   11.000\n"
+            b" 05 SK1        2418       6589000.000 594000.000   10.000"
+        )
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        assert document.locations[0].methods == ["CPT", "TOT"]
+        document.locations[0].methods.append("RP")
+
+        written = write_document(document).splitlines(keepends=True)
+
+        assert written[:2] == source.splitlines(keepends=True)[:2]
+        assert written[2].startswith(b" 05 SK1        2407      6589000.000  594000.000   10.000")
+        assert written[3] == source.splitlines(keepends=True)[3]
+        assert written[4].startswith(b" 05 SK1        2418 ")
+        assert written[5].startswith(b" 05 SK1        2406 ")
+        assert len(written) == 6
+        locations = KOFParser().parse(io.BytesIO(b"".join(written)), result_srid=25832)
+        assert locations[0].methods == ["CPT", "TOT", "RP"]
+
+    def test_changed_location_keeps_the_tema_code_of_every_line(self):
+        source = (
+            b" 05 A          2430       6589000.000 594000.000   10.000\n"
+            b" 05 B          2407       6589010.000 594010.000   11.000\n"
+            b" 05 A          2401       6589000.000 594000.000   10.000\n"
+        )
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        document.locations[0].point_z = 12.5
+
+        written = write_document(document).splitlines(keepends=True)
+
+        assert [line[:24] for line in written] == [line[:24] for line in source.splitlines(keepends=True)]
+        assert [float(line[49:58]) for line in written] == [12.5, 11.0, 12.5]
+        assert KOFParser().parse(io.BytesIO(b"".join(written)), result_srid=25832) == document.locations
+
+    def test_lenient_document_keeps_skipped_lines(self):
+        source = (
+            b" 05 A          2407       6589000.000 594000.000   10.000\r"
+            b" 05 B          2407       6589010.000 59401x.000   11.000\r"
+            b" 05 C          2418       6589020.000 594020.000   12.000"
+        )
+        diagnostics: list[Diagnostic] = []
+        stats = ParseStats()
+        document = KOFParser().parse_document(io.BytesIO(source), 25832, stats=stats, diagnostics=diagnostics)
+        document.locations[1].point_z = 2.0
+
+        written = write_document(document).splitlines(keepends=True)
+
+        assert [location.name for location in document.locations] == ["A", "C"]
+        assert [(diagnostic.line_number, diagnostic.field) for diagnostic in diagnostics] == [(2, "northing")]
+        assert (stats.lines, stats.points, stats.bytes_read) == (3, 3, len(source))
+        assert document.line_offsets.tolist() == [0, 58, 116, len(source)]
+        assert written[:2] == source.splitlines(keepends=True)[:2]
+        assert written[2].startswith(b" 05 C          2418 ") and float(written[2][49:58]) == 2.0
+
+    def test_location_without_methods_keeps_its_first_line(self):
+        source = (
+            b" 05 A          2407       6589000.000 594000.000   10.000\n"
+            b" 05 B          2407       6589010.000 594010.000   11.000\n"
+            b" 05 A          2418       6589000.000 594000.000   10.000\n"
+        )
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        document.locations[0].methods.clear()
+
+        written = write_document(document).splitlines(keepends=True)
+
+        assert [line[:24] for line in written] == [b" 05 A                   ", b" 05 B          2407     "]
+        assert KOFParser().parse(io.BytesIO(b"".join(written)), result_srid=25832) == document.locations
+
+    @pytest.mark.parametrize("encoding", ["iso-8859-15", "utf-8"])
+    def test_document_larger_than_charset_sample_is_written_in_its_encoding(self, encoding):
+        line = b" 05 SMPLOC1    2418     112893.150   1217079.460 2.000\n"
+        source = line * 2000 + " 05 BØR1       2418     112893.150   1217079.460 2.000\n".encode(encoding) + line * 2000
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        document.locations[1].point_z = 3.0
+
+        [(old, new)] = changed_lines(source, write_document(document))
+
+        assert document.encoding == encoding
+        assert new.startswith(" 05 BØR1       2418 ".encode(encoding))
+        assert float(new[49:58]) == 3.0
+
+    def test_lines_of_removed_methods_are_removed(self):
+        source = (
+            b" 05 A          2407       6589000.000 594000.000   10.000\n"
+            b" 05 A          2430       6589000.000 594000.000   10.000\n"
+            b" 05 A          2418       6589000.000 594000.000   10.000\n"
+        )
+        document = KOFParser().parse_document(io.BytesIO(source), result_srid=25832)
+        document.locations[0].methods.remove("CPT")
+
+        written = write_document(document).splitlines(keepends=True)
+
+        assert [line[:24] for line in written] == [b" 05 A          2430     ", b" 05 A          2418     "]
+        assert KOFParser().parse(io.BytesIO(b"".join(written)), result_srid=25832)[0].methods == ["TOT"]